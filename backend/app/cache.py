@@ -0,0 +1,198 @@
+"""
+Read-through cache for payout reads: in-process L1 in front of Redis.
+
+Entries are per user. Every user has a generation number, and a write bumps
+it after commit. The bump is INCR in Redis plus a PUBLISH, so every worker
+drops its L1 entries for that user. Old generations are never read again and
+expire on their own.
+
+A reader captures the generation before it queries the database and stores
+under that generation. A fill that races with a write therefore lands on a
+key nobody will read.
+
+Concurrent misses for the same key in one worker share a single load
+(single-flight). If Redis is unreachable, reads fall through to the loader
+and only L1 is used. In that case other workers' L1 entries can be stale for
+up to CACHE_L1_TTL_SECONDS.
+"""
+
+from __future__ import annotations
+
+import asyncio, json, time
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+import redis.asyncio as aioredis
+from redis.exceptions import RedisError
+
+from app.config import settings
+from app.logging import logger
+from app.metrics import Counter
+
+cache_requests = Counter(
+    "cache_requests_total", "Read-through cache lookups by tier and outcome"
+)
+
+# one round trip: current generation and the entry stored under it
+_READ = """
+local g = redis.call('GET', KEYS[1]) or '0'
+return {g, redis.call('GET', ARGV[1] .. g .. ':' .. ARGV[2])}
+"""
+
+
+class ReadCache:
+    def __init__(
+        self,
+        name: str,
+        redis_url: str | None,
+        ttl: float,
+        l1_ttl: float,
+        l1_size: int,
+        enabled: bool = True,
+    ):
+        self.name, self.ttl, self.l1_ttl, self.l1_size = name, ttl, l1_ttl, l1_size
+        self.enabled = enabled
+        self.redis = None
+        if redis_url and redis_url.startswith("redis"):
+            self.redis = aioredis.from_url(
+                redis_url, socket_timeout=0.25, socket_connect_timeout=0.25
+            )
+            self._read = self.redis.register_script(_READ)
+        self._redis_retry_at = 0.0  # skip Redis briefly after an error
+        self.channel = f"cache:{name}:invalidate"
+        # L1: (uid, key) -> (expires, local generation, value)
+        self._l1: OrderedDict[tuple, tuple[float, int, dict]] = OrderedDict()
+        self._gen: dict[int, int] = {}  # local generation per user
+        self._inflight: dict[tuple, asyncio.Future] = {}
+        # called with the uid of every invalidation, local or from another worker
+        self.on_invalidate: list[Callable[[int], None]] = []
+
+    def _gen_key(self, uid: int) -> str:
+        return f"cache:{self.name}:gen:{uid}"
+
+    def _entry_prefix(self, uid: int) -> str:
+        return f"cache:{self.name}:{uid}:"
+
+    async def get_or_load(
+        self, uid: int, key: str, loader: Callable[[], Awaitable[dict]]
+    ) -> dict:
+        if not self.enabled:
+            return await loader()
+        gen = self._gen.get(uid, 0)
+        hit = self._l1.get((uid, key))
+        if hit and hit[1] == gen and hit[0] > time.monotonic():
+            self._l1.move_to_end((uid, key))
+            cache_requests.inc(cache=self.name, result="l1_hit")
+            return hit[2]
+
+        fut = self._inflight.get((uid, key))
+        if fut is not None:
+            cache_requests.inc(cache=self.name, result="coalesced")
+            return await asyncio.shield(fut)
+        fut = self._inflight[(uid, key)] = asyncio.get_running_loop().create_future()
+        try:
+            value = await self._fill(uid, key, gen, loader)
+            fut.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            fut.cancel()
+            raise
+        except Exception as e:
+            fut.set_exception(e)
+            fut.exception()  # mark retrieved: there may be no waiters
+            raise
+        finally:
+            del self._inflight[(uid, key)]
+
+    async def _fill(self, uid, key, gen, loader) -> dict:
+        remote_gen = None
+        if self.redis is not None and time.monotonic() >= self._redis_retry_at:
+            try:
+                remote_gen, raw = await self._read(
+                    keys=[self._gen_key(uid)], args=[self._entry_prefix(uid), key]
+                )
+                if raw is not None:
+                    value = json.loads(raw)
+                    cache_requests.inc(cache=self.name, result="l2_hit")
+                    self._store_l1(uid, key, gen, value)
+                    return value
+            except RedisError as e:
+                logger.warning("cache_redis_error", cache=self.name, err=str(e))
+                self._redis_retry_at = time.monotonic() + 5
+                remote_gen = None
+        cache_requests.inc(cache=self.name, result="miss")
+        value = await loader()
+        self._store_l1(uid, key, gen, value)
+        if remote_gen is not None:
+            try:
+                await self.redis.set(
+                    f"{self._entry_prefix(uid)}{remote_gen.decode()}:{key}",
+                    json.dumps(value),
+                    ex=max(1, int(self.ttl)),
+                )
+            except RedisError:
+                pass
+        return value
+
+    def _store_l1(self, uid: int, key: str, gen: int, value: dict) -> None:
+        if gen != self._gen.get(uid, 0):
+            return  # invalidated while loading
+        self._l1[(uid, key)] = (time.monotonic() + self.l1_ttl, gen, value)
+        self._l1.move_to_end((uid, key))
+        while len(self._l1) > self.l1_size:
+            self._l1.popitem(last=False)
+
+    def invalidate_local(self, uid: int) -> None:
+        self._gen[uid] = self._gen.get(uid, 0) + 1
+        for fn in self.on_invalidate:
+            fn(uid)
+
+    async def invalidate(self, *uids: int) -> None:
+        """Call after the write has committed."""
+        uids = set(uids)
+        for uid in uids:
+            self.invalidate_local(uid)
+        if self.redis is None or not uids:
+            return
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for uid in uids:
+                pipe.incr(self._gen_key(uid))
+                # outlives every entry, so a reset generation can't hit old data
+                pipe.expire(self._gen_key(uid), max(3600, int(self.ttl) * 10))
+                pipe.publish(self.channel, str(uid))
+            await pipe.execute()
+        except RedisError as e:
+            logger.warning("cache_invalidate_failed", cache=self.name, err=str(e))
+
+    async def listen(self) -> None:
+        """Apply other workers' invalidations to this worker's L1."""
+        while True:
+            pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(self.channel)
+                # anything published while we were away is unknown: start clean
+                self._l1.clear()
+                async for msg in pubsub.listen():
+                    self.invalidate_local(int(msg["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("cache_listener_error", cache=self.name)
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+    def clear(self) -> None:
+        self._l1.clear()
+        self._gen.clear()
+
+
+payout_cache = ReadCache(
+    "payouts",
+    settings.cache_redis_url,
+    ttl=settings.cache_ttl_seconds,
+    l1_ttl=settings.cache_l1_ttl_seconds,
+    l1_size=settings.cache_l1_size,
+    enabled=settings.cache_enabled,
+)
@@ -1,16 +1,78 @@
-import asyncio, os
-from datetime import datetime, timedelta, timezone
-from sqlalchemy import delete
-from app.db import SessionLocal
-from app.models import IdempotencyKey
+"""
+Expiry of idempotency keys (and, optionally, webhook events).
+
+Rows are deleted in bounded batches, each in its own short transaction, so no
+statement holds locks for long and the event loop gets control back between
+batches. The `created_at`/`received_at` indexes keep every batch an index
+range scan.
+"""
+
+import asyncio, os, time
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, select
+
+from app.db import AsyncSessionLocal, utcnow
+from app.logging import logger
+from app.metrics import Counter, Gauge
+from app.models import IdempotencyKey, WebhookEvent
 
 TTL_HOURS = int(os.getenv("IDEMP_TTL_HOURS", "24"))
+WEBHOOK_TTL_HOURS = int(os.getenv("WEBHOOK_EVENT_TTL_HOURS", "0"))  # 0 = keep
+BATCH_SIZE = int(os.getenv("CLEANUP_BATCH_SIZE", "5000"))
+INTERVAL_SECONDS = int(os.getenv("CLEANUP_INTERVAL_SECONDS", "3600"))
+
+rows_deleted = Counter(
+    "cleanup_rows_deleted_total", "Expired rows removed by the cleanup job"
+)
+last_duration = Gauge(
+    "cleanup_last_duration_seconds", "Wall time of the last cleanup run per table"
+)
+
+
+async def delete_expired(
+    model, column, cutoff: datetime, session_factory=AsyncSessionLocal, batch_size=None
+) -> int:
+    """Delete rows older than `cutoff` in batches; returns the number deleted."""
+    pk = model.__mapper__.primary_key[0]
+    batch = (
+        select(pk)
+        .where(column < cutoff)
+        .order_by(column)
+        .limit(batch_size or BATCH_SIZE)
+        .with_for_update(skip_locked=True)
+    )
+    total = 0
+    while True:
+        async with session_factory() as db:
+            n = (await db.execute(delete(model).where(pk.in_(batch)))).rowcount
+            await db.commit()
+        total += n
+        if n < (batch_size or BATCH_SIZE):
+            return total
+        await asyncio.sleep(0)  # let requests run between batches
+
+
+async def expire(
+    model, column, ttl_hours: int, session_factory=AsyncSessionLocal
+) -> int:
+    table = model.__tablename__
+    cutoff = utcnow() - timedelta(hours=ttl_hours)
+    start = time.perf_counter()
+    n = await delete_expired(model, column, cutoff, session_factory)
+    dur = time.perf_counter() - start
+    rows_deleted.inc(n, table=table)
+    last_duration.set(dur, table=table)
+    logger.info("cleanup_completed", table=table, rows=n, duration_ms=int(dur * 1000))
+    return n
 
 
-async def cleanup_idempotency_keys():
+async def cleanup_expired():
     while True:
-        cutoff = datetime.now(timezone.utc) - timedelta(hours=TTL_HOURS)
-        with SessionLocal() as db:
-            db.execute(delete(IdempotencyKey).where(IdempotencyKey.created_at < cutoff))
-            db.commit()
-        await asyncio.sleep(3600)
+        try:
+            await expire(IdempotencyKey, IdempotencyKey.created_at, TTL_HOURS)
+            if WEBHOOK_TTL_HOURS:
+                await expire(WebhookEvent, WebhookEvent.received_at, WEBHOOK_TTL_HOURS)
+        except Exception:
+            logger.exception("cleanup_error")
+        await asyncio.sleep(INTERVAL_SECONDS)
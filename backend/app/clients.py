@@ -0,0 +1,55 @@
+"""
+App-scoped, connection-pooled HTTP clients, one per upstream.
+
+Opened and closed in `main.lifespan` and stored on `app.state.http_clients`;
+the dispatcher is handed the provider client, routers get theirs through a
+`get_*_client` dependency, so every call reuses keep-alive connections
+instead of paying a TCP/TLS handshake.
+"""
+
+import httpx
+from fastapi import Request
+
+from app.config import settings
+
+PROVIDER = "provider"
+GITHUB = "github"
+
+try:  # HTTP/2 needs the optional `h2` package (httpx[http2])
+    import h2  # noqa: F401
+
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+
+def build_client(**kwargs) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        http2=HTTP2,
+        timeout=httpx.Timeout(
+            settings.http_timeout_seconds,
+            connect=settings.http_connect_timeout_seconds,
+        ),
+        limits=httpx.Limits(
+            max_connections=settings.http_max_connections,
+            max_keepalive_connections=settings.http_max_keepalive,
+            keepalive_expiry=settings.http_keepalive_expiry_seconds,
+        ),
+        **kwargs,
+    )
+
+
+def open_clients() -> dict[str, httpx.AsyncClient]:
+    return {
+        PROVIDER: build_client(),
+        GITHUB: build_client(headers={"Accept": "application/json"}),
+    }
+
+
+async def close_clients(clients: dict[str, httpx.AsyncClient]) -> None:
+    for c in clients.values():
+        await c.aclose()
+
+
+def get_github_client(request: Request) -> httpx.AsyncClient:
+    return request.app.state.http_clients[GITHUB]
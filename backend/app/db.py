@@ -1,20 +1,72 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, DeclarativeBase
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import DeclarativeBase
 
 from app.config import settings
+from app.metrics import db_checkout_wait, db_queries
 
 
 class Base(DeclarativeBase):
     pass
 
 
-engine = create_engine(settings.database_url, pool_pre_ping=True, future=True)
-SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
+def utcnow() -> datetime:
+    # naive UTC, matching the DateTime columns and CURRENT_TIMESTAMP defaults
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class _TimedCheckout:
+    """Pool mixin recording how long a checkout waited for a connection."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            db_checkout_wait.observe(time.perf_counter() - start)
+
+
+class TimedAsyncQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    pass
+
+
+def pool_kwargs(url: str) -> dict:
+    # SQLite (tests, local tooling) uses a non-queue pool without these knobs
+    if url.startswith("sqlite"):
+        return {}
+    return {
+        "poolclass": TimedAsyncQueuePool,
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_recycle": settings.db_pool_recycle_seconds,
+        "pool_timeout": settings.db_pool_timeout_seconds,
+    }
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    db_queries.inc()
+
+
+def make_async_engine(url: str):
+    """Pooled async engine whose statements count towards db_queries_total."""
+    eng = create_async_engine(url, pool_pre_ping=True, **pool_kwargs(url))
+    event.listen(eng.sync_engine, "before_cursor_execute", _count_query)
+    return eng
+
+
+def make_sessionmaker(eng) -> async_sessionmaker:
+    return async_sessionmaker(bind=eng, autoflush=False, expire_on_commit=False)
+
+
+# async engine: request handlers and the dispatcher; read replicas in app/replicas.py
+async_engine = make_async_engine(settings.database_url)
+AsyncSessionLocal = make_sessionmaker(async_engine)
 
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
@@ -0,0 +1,210 @@
+"""
+Outbox dispatcher: submits payouts to the provider outside the request path.
+
+`create_payout` commits a `PayoutDispatch` row next to the `Payout`. This loop
+claims due rows in batches (FOR UPDATE SKIP LOCKED, so several workers can run
+it side by side), leases them by pushing `next_attempt_at` forward, calls the
+provider and then records the result. Failed attempts are rescheduled with
+bounded exponential backoff + jitter (or the provider's Retry-After, if
+longer) instead of sleeping inline. Calls go through app/provider.py, which
+bounds concurrency and rate; calls it sheds are rescheduled without spending
+an attempt. When the attempts run out, or the provider rejects the payout
+with a 4xx other than 429, the payout itself moves to "failed".
+"""
+
+import asyncio, random
+from datetime import timedelta
+
+import httpx
+from sqlalchemy import select, update
+
+from app import events as sse, money
+from app.cache import payout_cache
+from app.config import settings
+from app.db import AsyncSessionLocal, utcnow
+from app.logging import logger
+from app.metrics import dispatch_failed, provider_retries
+from app.models import Payout, PayoutDispatch
+from app.provider import ProviderError, ProviderUnavailable, create_payout
+from app.webhooks import fail_payout
+
+
+def _backoff(attempt: int) -> float:
+    base = min(5.0, 0.5 * (2**attempt))
+    return base + random.random() * 0.25
+
+
+async def claim_batch(
+    session_factory=AsyncSessionLocal, limit: int | None = None
+) -> list:
+    """Lock due dispatch rows, lease them and return what the provider call needs."""
+    now = utcnow()
+    stmt = (
+        select(
+            PayoutDispatch.id,
+            PayoutDispatch.payout_id,
+            PayoutDispatch.attempts,
+            PayoutDispatch.correlation_id,
+            Payout.amount_minor,
+            Payout.currency,
+        )
+        .join(Payout, Payout.id == PayoutDispatch.payout_id)
+        .where(
+            PayoutDispatch.status == "pending",
+            PayoutDispatch.next_attempt_at <= now,
+        )
+        .order_by(PayoutDispatch.next_attempt_at)
+        .limit(limit or settings.dispatch_batch_size)
+        .with_for_update(skip_locked=True, of=PayoutDispatch)
+    )
+    async with session_factory() as db:
+        rows = (await db.execute(stmt)).all()
+        if rows:
+            # lease: if this worker dies the rows become due again after the lease
+            await db.execute(
+                update(PayoutDispatch)
+                .where(PayoutDispatch.id.in_([r.id for r in rows]))
+                .values(
+                    attempts=PayoutDispatch.attempts + 1,
+                    next_attempt_at=now
+                    + timedelta(seconds=settings.dispatch_lease_seconds),
+                )
+            )
+        await db.commit()
+    return rows
+
+
+async def submit(client: httpx.AsyncClient, row) -> str | None:
+    """One provider attempt. Returns the provider reference, raises on failure."""
+    headers = {"x-correlation-id": row.correlation_id or ""}
+    payload = {
+        "amount": money.to_str(row.amount_minor, row.currency),
+        "currency": row.currency,
+        "reference": f"payout_{row.payout_id}",
+    }
+    return await create_payout(client, payload, headers)
+
+
+async def record_result(
+    row,
+    ref: str | None,
+    err: str | None,
+    session_factory=AsyncSessionLocal,
+    retry_after: float | None = None,
+    permanent: bool = False,
+) -> None:
+    attempt = row.attempts + 1
+    moved = []
+    async with session_factory() as db:
+        if err is None:
+            if ref:
+                await db.execute(
+                    update(Payout)
+                    .where(Payout.id == row.payout_id)
+                    .values(provider_ref=ref)
+                )
+            await db.execute(
+                update(PayoutDispatch)
+                .where(PayoutDispatch.id == row.id)
+                .values(status="sent", last_error=None)
+            )
+            logger.info(
+                "payout_provider_ref_set", payout_id=row.payout_id, provider_ref=ref
+            )
+        elif permanent or attempt >= settings.dispatch_max_attempts:
+            await db.execute(
+                update(PayoutDispatch)
+                .where(PayoutDispatch.id == row.id)
+                .values(status="failed", last_error=err[:255])
+            )
+            moved = await fail_payout(db, row.payout_id)
+            evs = sse.payout_events(moved)
+            await sse.notify(db, evs)
+            dispatch_failed.inc()
+            logger.info(
+                "payout_dispatch_failed",
+                payout_id=row.payout_id,
+                attempts=attempt,
+                err=err,
+            )
+        else:
+            await db.execute(
+                update(PayoutDispatch)
+                .where(PayoutDispatch.id == row.id)
+                .values(
+                    last_error=err[:255],
+                    next_attempt_at=utcnow()
+                    + timedelta(seconds=max(_backoff(attempt), retry_after or 0)),
+                )
+            )
+            provider_retries.inc()
+            logger.info(
+                "payout_provider_call_error",
+                payout_id=row.payout_id,
+                err=err,
+                attempt=attempt,
+            )
+        await db.commit()
+    if moved:
+        await payout_cache.invalidate(*(r.user_id for r in moved))
+        sse.hub.publish_many(evs)
+
+
+async def record_shed(
+    row, e: ProviderUnavailable, session_factory=AsyncSessionLocal
+) -> None:
+    """Reschedule a call that never reached the provider; no attempt is spent."""
+    async with session_factory() as db:
+        await db.execute(
+            update(PayoutDispatch)
+            .where(PayoutDispatch.id == row.id)
+            .values(
+                attempts=row.attempts,  # undo the lease's increment
+                last_error=str(e)[:255],
+                next_attempt_at=utcnow()
+                + timedelta(seconds=e.retry_after + random.random() * 0.25),
+            )
+        )
+        await db.commit()
+
+
+async def _process(client: httpx.AsyncClient, row, session_factory) -> None:
+    try:
+        ref = await submit(client, row)
+    except ProviderUnavailable as e:
+        await record_shed(row, e, session_factory)
+    except ProviderError as e:
+        # other 4xx: the provider rejected the payout, retrying won't change that
+        permanent = e.status < 500 and e.status != 429
+        await record_result(
+            row, None, str(e), session_factory, e.retry_after, permanent
+        )
+    except Exception as e:
+        await record_result(row, None, str(e) or e.__class__.__name__, session_factory)
+    else:
+        await record_result(row, ref, None, session_factory)
+
+
+async def dispatch_once(
+    client: httpx.AsyncClient, session_factory=AsyncSessionLocal
+) -> int:
+    """Claim one batch and submit it concurrently. Returns the batch size."""
+    rows = await claim_batch(session_factory)
+    # the provider guard bounds calls in flight (at most DISPATCH_CONCURRENCY)
+    if rows:
+        await asyncio.gather(*(_process(client, r, session_factory) for r in rows))
+    return len(rows)
+
+
+async def run_dispatcher(
+    client: httpx.AsyncClient, session_factory=AsyncSessionLocal
+) -> None:
+    while True:
+        try:
+            n = await dispatch_once(client, session_factory)
+        except Exception:
+            logger.exception("payout_dispatch_loop_error")
+            n = 0
+        # a full batch means there is probably more work waiting
+        if n < settings.dispatch_batch_size:
+            await asyncio.sleep(settings.dispatch_poll_seconds)
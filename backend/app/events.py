@@ -0,0 +1,212 @@
+"""
+Push payout status changes to clients as Server-Sent Events.
+
+Each worker keeps an in-process hub: one bounded queue per open stream, grouped
+by user. Webhook handlers publish to the local hub after commit and queue a
+Postgres NOTIFY inside their transaction, so the other workers' listeners get
+the same events exactly at commit (the origin tag stops a worker from
+delivering its own events twice).
+
+The endpoint reserves a stream's slot before it responds, so concurrent
+requests can't overshoot the limits. One ticker per worker writes heartbeat
+comments, so idle streams need no timer of their own. A stream that hasn't
+sent its previous heartbeat (including a reserved one whose body never
+started), or is `sse_queue_size` frames behind, is closed; on reconnect the
+client refetches GET /payouts.
+"""
+
+import asyncio, os
+from collections import defaultdict
+from uuid import uuid4
+
+import orjson
+import psycopg
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import money
+from app.config import settings
+from app.idempotency import _dsn
+from app.logging import logger
+from app.metrics import Counter, Gauge
+
+CHANNEL = "payout_events"
+_NONCE = uuid4().hex[:12]
+
+
+def _origin() -> str:
+    # pid as well: workers forked from a preloaded app share _NONCE
+    return f"{_NONCE}:{os.getpid()}"
+
+
+PING = b": ping\n\n"
+RETRY = b"retry: 3000\n\n"
+_CLOSE = None
+
+sse_connections = Gauge("sse_connections", "Open event streams in this worker")
+sse_lagging = Counter(
+    "sse_lagging_closed_total", "Event streams closed for falling behind"
+)
+
+
+class _Subscription(asyncio.Queue):
+    # set by the ticker, cleared when the stream takes the ping
+    ping_pending = False
+
+
+class EventHub:
+    def __init__(
+        self,
+        max_connections: int,
+        max_per_user: int,
+        queue_size: int,
+        heartbeat: float,
+    ):
+        self.max_connections, self.max_per_user = max_connections, max_per_user
+        self.queue_size, self.heartbeat = queue_size, heartbeat
+        self._subs: dict[int, set[_Subscription]] = defaultdict(set)
+        self._count = 0
+        self._ticker: asyncio.Task | None = None
+
+    def __len__(self) -> int:
+        return self._count
+
+    def room_for(self, uid: int) -> str | None:
+        """Why a new stream for `uid` would be refused, or None."""
+        if self._count >= self.max_connections:
+            return "worker"
+        if len(self._subs.get(uid, ())) >= self.max_per_user:
+            return "user"
+        return None
+
+    def subscribe(self, uid: int) -> _Subscription:
+        """Take a stream slot for `uid`; check room_for() first."""
+        q = _Subscription(self.queue_size)
+        self._subs[uid].add(q)
+        self._count += 1
+        sse_connections.set(self._count)
+        loop = asyncio.get_running_loop()
+        if (
+            self._ticker is None
+            or self._ticker.done()
+            or self._ticker.get_loop() is not loop
+        ):
+            self._ticker = loop.create_task(self._tick())
+        return q
+
+    def _unsubscribe(self, uid: int, q: _Subscription) -> None:
+        subs = self._subs.get(uid)
+        if subs is None or q not in subs:
+            return
+        subs.discard(q)
+        if not subs:
+            del self._subs[uid]
+        self._count -= 1
+        sse_connections.set(self._count)
+
+    async def stream(self, uid: int, q: _Subscription):
+        """SSE body for the subscription `q`; releases it when done."""
+        try:
+            yield RETRY
+            while (frame := await q.get()) is not _CLOSE:
+                if frame is PING:
+                    q.ping_pending = False
+                yield frame
+        finally:
+            self._unsubscribe(uid, q)
+
+    def publish(self, uid: int, event: dict) -> None:
+        subs = self._subs.get(uid)
+        if not subs:
+            return
+        frame = b"event: payout\ndata: " + orjson.dumps(event) + b"\n\n"
+        for q in list(subs):
+            try:
+                q.put_nowait(frame)
+            except asyncio.QueueFull:
+                self._evict(uid, q)
+
+    def _evict(self, uid: int, q: _Subscription) -> None:
+        sse_lagging.inc()
+        self._unsubscribe(uid, q)
+        while not q.empty():
+            q.get_nowait()
+        q.put_nowait(_CLOSE)
+
+    def publish_many(self, events: list[tuple[int, dict]]) -> None:
+        for uid, event in events:
+            self.publish(uid, event)
+
+    async def _tick(self) -> None:
+        # exits with the last stream; the next subscriber starts a new one
+        while self._count:
+            await asyncio.sleep(self.heartbeat)
+            for uid, subs in list(self._subs.items()):
+                for q in list(subs):
+                    if q.ping_pending:
+                        # last ping never went out: the reader is stuck or
+                        # gone without its generator being closed
+                        self._evict(uid, q)
+                    elif q.empty():
+                        q.put_nowait(PING)
+                        q.ping_pending = True
+
+
+hub = EventHub(
+    max_connections=settings.sse_max_connections,
+    max_per_user=settings.sse_max_per_user,
+    queue_size=settings.sse_queue_size,
+    heartbeat=settings.sse_heartbeat_seconds,
+)
+
+
+def payout_events(rows) -> list[tuple[int, dict]]:
+    """(user_id, event) pairs for rows with id, user_id, status, amount_minor, currency."""
+    return [
+        (
+            r.user_id,
+            {
+                "id": r.id,
+                "status": r.status,
+                "amount": money.to_str(r.amount_minor, r.currency),
+                "currency": r.currency,
+            },
+        )
+        for r in rows
+    ]
+
+
+async def notify(db: AsyncSession, events: list[tuple[int, dict]]) -> None:
+    """Queue `events` for the other workers; call before the transaction commits."""
+    if events and db.bind.dialect.name == "postgresql":
+        origin = _origin()
+        await db.execute(
+            text("SELECT pg_notify(:ch, p) FROM unnest(CAST(:payloads AS text[])) p"),
+            {
+                "ch": CHANNEL,
+                "payloads": [
+                    orjson.dumps({"o": origin, "u": uid, "e": ev}).decode()
+                    for uid, ev in events
+                ],
+            },
+        )
+
+
+async def listen(url: str | None = None) -> None:
+    """Deliver other workers' events to this worker's streams. Reconnects on error."""
+    dsn, origin = _dsn(url or settings.database_url), _origin()
+    while True:
+        try:
+            async with await psycopg.AsyncConnection.connect(
+                dsn, autocommit=True
+            ) as conn:
+                await conn.execute(f"LISTEN {CHANNEL}")
+                async for n in conn.notifies():
+                    msg = orjson.loads(n.payload)
+                    if msg["o"] != origin:
+                        hub.publish(msg["u"], msg["e"])
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("events_listener_error")
+            await asyncio.sleep(1)
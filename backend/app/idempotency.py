@@ -0,0 +1,193 @@
+"""
+Claim `Idempotency-Key`s and wake duplicate requests when the winner commits.
+
+A request first claims its key (payout_id NULL) in a short transaction of its
+own, then creates the payout and fills in payout_id in a second one. Because
+the claim is already committed, a duplicate sees it at once instead of
+queueing on an uncommitted unique key while holding a pooled connection.
+
+Losers register a future under the key and release their DB connection; the
+winner publishes `key -> payout_id`. Within a worker that resolves the futures
+directly. Across workers it goes through Postgres LISTEN/NOTIFY: the NOTIFY is
+issued inside the winner's transaction, so it is delivered exactly at commit,
+and each worker's listener resolves its own local waiters.
+
+A winner that fails releases its claim. One that dies leaves it behind; after
+IDEMP_CLAIM_SECONDS a retry by the same user takes it over. Filling in
+payout_id only succeeds while the claim is still empty, so of a slow winner
+and the request that took over, exactly one commits a payout.
+"""
+
+import asyncio
+from collections import defaultdict
+from datetime import timedelta
+
+import psycopg
+from sqlalchemy import bindparam, delete, select, text, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.db import utcnow
+from app.logging import logger
+from app.models import IdempotencyKey
+
+CHANNEL = "idempotency_keys"
+
+
+class WaiterRegistry:
+    def __init__(self):
+        self._waiters: dict[str, set[asyncio.Future]] = defaultdict(set)
+
+    def register(self, key: str) -> asyncio.Future:
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters[key].add(fut)
+        return fut
+
+    def discard(self, key: str, fut: asyncio.Future) -> None:
+        futs = self._waiters.get(key)
+        if futs is not None:
+            futs.discard(fut)
+            if not futs:
+                del self._waiters[key]
+
+    def resolve(self, key: str, payout_id: int) -> None:
+        for fut in self._waiters.pop(key, ()):
+            if not fut.done():
+                fut.get_loop().call_soon_threadsafe(_set_result, fut, payout_id)
+
+    def __len__(self) -> int:
+        return sum(len(f) for f in self._waiters.values())
+
+
+def _set_result(fut: asyncio.Future, value) -> None:
+    if not fut.done():
+        fut.set_result(value)
+
+
+waiters = WaiterRegistry()
+
+_FILL = (
+    update(IdempotencyKey.__table__)
+    .where(
+        IdempotencyKey.key == bindparam("k"),
+        IdempotencyKey.payout_id.is_(None),
+    )
+    .values(payout_id=bindparam("pid"))
+)
+
+
+async def claim(db: AsyncSession, keys: list[str], uid: int) -> list[str]:
+    """Claim `keys` for new payouts and commit; returns the keys we now own."""
+    won = set(
+        await db.scalars(
+            insert(IdempotencyKey)
+            .values([{"key": k, "user_id": uid} for k in keys])
+            .on_conflict_do_nothing(index_elements=[IdempotencyKey.key])
+            .returning(IdempotencyKey.key)
+        )
+    )
+    rest = [k for k in keys if k not in won]
+    if rest:
+        stale = utcnow() - timedelta(seconds=settings.idempotency_claim_seconds)
+        won.update(
+            await db.scalars(
+                update(IdempotencyKey)
+                .where(
+                    IdempotencyKey.key.in_(rest),
+                    IdempotencyKey.user_id == uid,
+                    IdempotencyKey.payout_id.is_(None),
+                    IdempotencyKey.created_at < stale,
+                )
+                .values(created_at=utcnow())
+                .returning(IdempotencyKey.key)
+                .execution_options(synchronize_session=False)
+            )
+        )
+    await db.commit()
+    return [k for k in keys if k in won]
+
+
+async def fill(db: AsyncSession, pairs: list[tuple[str, int]]) -> bool:
+    """Attach payout ids to our claims, inside the payouts' transaction.
+
+    False if a claim was taken over meanwhile; the caller must roll back.
+    """
+    if not pairs:
+        return True
+    res = await db.execute(_FILL, [{"k": k, "pid": pid} for k, pid in pairs])
+    if res.rowcount != len(pairs):
+        return False
+    await publish_many(db, pairs)
+    return True
+
+
+async def release(db: AsyncSession, keys: list[str]) -> None:
+    """Give up claims whose payouts were not created, so a retry can claim them."""
+    try:
+        await db.rollback()
+        await db.execute(
+            delete(IdempotencyKey).where(
+                IdempotencyKey.key.in_(keys), IdempotencyKey.payout_id.is_(None)
+            )
+        )
+        await db.commit()
+    except Exception as e:
+        # the claim goes stale and is taken over by a retry
+        logger.warning("idempotency_release_failed", keys=len(keys), err=str(e))
+
+
+async def publish_many(db: AsyncSession, pairs: list[tuple[str, int]]) -> None:
+    """Queue the cross-worker notifications; call before the winner commits."""
+    if pairs and db.bind.dialect.name == "postgresql":
+        await db.execute(
+            text("SELECT pg_notify(:ch, p) FROM unnest(CAST(:payloads AS text[])) p"),
+            {"ch": CHANNEL, "payloads": [f"{k}:{pid}" for k, pid in pairs]},
+        )
+
+
+async def wait_for_payout(
+    db: AsyncSession, key: str, timeout: float | None = None
+) -> int | None:
+    """Block (without polling) until the key's payout_id is known, or time out."""
+    fut = waiters.register(key)
+    try:
+        # the winner may have committed before we registered
+        payout_id = await db.scalar(
+            select(IdempotencyKey.payout_id).where(IdempotencyKey.key == key)
+        )
+        if payout_id:
+            return payout_id
+        await db.rollback()  # hand the connection back while we wait
+        try:
+            return await asyncio.wait_for(
+                fut, timeout or settings.idempotency_wait_seconds
+            )
+        except asyncio.TimeoutError:
+            return None
+    finally:
+        waiters.discard(key, fut)
+
+
+def _dsn(url: str) -> str:
+    return make_url(url).set(drivername="postgresql").render_as_string(False)
+
+
+async def listen(url: str | None = None) -> None:
+    """Resolve local waiters from NOTIFYs sent by any worker. Reconnects on error."""
+    dsn = _dsn(url or settings.database_url)
+    while True:
+        try:
+            async with await psycopg.AsyncConnection.connect(
+                dsn, autocommit=True
+            ) as conn:
+                await conn.execute(f"LISTEN {CHANNEL}")
+                async for n in conn.notifies():
+                    key, _, payout_id = n.payload.rpartition(":")
+                    waiters.resolve(key, int(payout_id))
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("idempotency_listener_error")
+            await asyncio.sleep(1)
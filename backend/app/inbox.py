@@ -0,0 +1,260 @@
+"""
+Webhook inbox consumers: apply queued webhook events outside the request path.
+
+The webhook handlers commit each new event to `webhook_inbox` and return.
+`webhook_consumers` loops per worker claim due rows here, but only the oldest
+row of each payout_ref (no earlier row for the same ref may still be queued),
+so a payout's events are applied in the order they arrived and a payout with
+an event in retry waits for it. Claimed rows are leased like the dispatch
+outbox (FOR UPDATE SKIP LOCKED + `next_attempt_at` pushed forward), so several
+workers can consume side by side.
+
+A claimed batch is applied in one transaction that also deletes its rows. If
+that fails, each row is retried on its own; a row that keeps failing is
+rescheduled with backoff and after `webhook_max_attempts` moved to
+`webhook_dead_letters`. So is a row whose payout_ref no payout has yet: the
+dispatcher stores the ref after the provider answers, and a prompt webhook
+can beat it.
+
+    python -m app.inbox replay [--event-id ID ...]   # requeue dead letters
+"""
+
+import argparse, asyncio, json, random
+from datetime import timedelta
+
+from sqlalchemy import delete, exists, insert, select, update
+from sqlalchemy.orm import aliased
+
+from app import events as sse
+from app.cache import payout_cache
+from app.config import settings
+from app.db import AsyncSessionLocal, utcnow
+from app.logging import logger
+from app.metrics import webhook_dead_lettered, webhook_queue_lag, webhook_retries
+from app.models import Payout, WebhookDeadLetter, WebhookInbox
+from app.webhooks import apply_statuses
+
+CLAIMED = (
+    WebhookInbox.id,
+    WebhookInbox.event_id,
+    WebhookInbox.payout_ref,
+    WebhookInbox.payload,
+    WebhookInbox.attempts,
+    WebhookInbox.received_at,
+)
+
+
+def _backoff(attempt: int) -> float:
+    base = min(60.0, 0.5 * (2**attempt))
+    return base + random.random() * 0.25
+
+
+async def claim_batch(
+    session_factory=AsyncSessionLocal, limit: int | None = None
+) -> list:
+    """Lease the due head row of up to `limit` payout_refs."""
+    now = utcnow()
+    earlier = aliased(WebhookInbox)
+    heads = (
+        select(WebhookInbox.id)
+        .where(
+            WebhookInbox.next_attempt_at <= now,
+            ~exists().where(
+                earlier.payout_ref == WebhookInbox.payout_ref,
+                earlier.id < WebhookInbox.id,
+            ),
+        )
+        .order_by(WebhookInbox.id)
+        .limit(limit or settings.webhook_consume_batch)
+        .with_for_update(skip_locked=True, of=WebhookInbox)
+    )
+    async with session_factory() as db:
+        ids = (await db.scalars(heads)).all()
+        rows = []
+        if ids:
+            # the due check again: a consumer that read the same heads first
+            # (no row locks on SQLite) has already leased them
+            rows = (
+                await db.execute(
+                    update(WebhookInbox)
+                    .where(
+                        WebhookInbox.id.in_(ids),
+                        WebhookInbox.next_attempt_at <= now,
+                    )
+                    .values(
+                        attempts=WebhookInbox.attempts + 1,
+                        next_attempt_at=now
+                        + timedelta(seconds=settings.webhook_lease_seconds),
+                    )
+                    .returning(*CLAIMED)
+                )
+            ).all()
+        await db.commit()
+    return rows
+
+
+async def apply(rows, session_factory=AsyncSessionLocal) -> None:
+    """Apply claimed rows (one per payout_ref) and drop them from the queue.
+
+    Rows whose payout_ref matches no payout stay queued, as failed attempts.
+    """
+    async with session_factory() as db:
+        known = set(
+            (
+                await db.scalars(
+                    select(Payout.provider_ref).where(
+                        Payout.provider_ref.in_({r.payout_ref for r in rows})
+                    )
+                )
+            ).all()
+        )
+        ready = [r for r in rows if r.payout_ref in known]
+        moved, evs = [], []
+        if ready:
+            statuses = {r.payout_ref: json.loads(r.payload)["status"] for r in ready}
+            moved = await apply_statuses(db, statuses)
+            evs = sse.payout_events(moved)
+            await sse.notify(db, evs)
+            await db.execute(
+                delete(WebhookInbox).where(WebhookInbox.id.in_([r.id for r in ready]))
+            )
+        await db.commit()
+    if moved:
+        await payout_cache.invalidate(*(r.user_id for r in moved))
+        sse.hub.publish_many(evs)
+    now = utcnow()
+    for r in ready:
+        webhook_queue_lag.observe(max(0.0, (now - r.received_at).total_seconds()))
+    for r in rows:
+        if r.payout_ref not in known:
+            await record_failure(r, "unknown payout_ref", session_factory)
+
+
+async def record_failure(row, err: str, session_factory=AsyncSessionLocal) -> None:
+    attempt = row.attempts  # the lease already counted this one
+    async with session_factory() as db:
+        if attempt >= settings.webhook_max_attempts:
+            await db.execute(
+                insert(WebhookDeadLetter).values(
+                    event_id=row.event_id,
+                    payout_ref=row.payout_ref,
+                    payload=row.payload,
+                    attempts=attempt,
+                    last_error=err[:255],
+                    received_at=row.received_at,
+                )
+            )
+            await db.execute(delete(WebhookInbox).where(WebhookInbox.id == row.id))
+            webhook_dead_lettered.inc()
+            logger.warning(
+                "webhook_dead_lettered",
+                event_id=row.event_id,
+                payout_ref=row.payout_ref,
+                attempts=attempt,
+                err=err,
+            )
+        else:
+            await db.execute(
+                update(WebhookInbox)
+                .where(WebhookInbox.id == row.id)
+                .values(
+                    last_error=err[:255],
+                    next_attempt_at=utcnow() + timedelta(seconds=_backoff(attempt)),
+                )
+            )
+            webhook_retries.inc()
+            logger.info(
+                "webhook_apply_error",
+                event_id=row.event_id,
+                err=err,
+                attempt=attempt,
+            )
+        await db.commit()
+
+
+async def consume_once(session_factory=AsyncSessionLocal) -> int:
+    """Claim one batch and apply it. Returns the batch size."""
+    rows = await claim_batch(session_factory)
+    if not rows:
+        return 0
+    try:
+        await apply(rows, session_factory)
+    except Exception:
+        # find the row that breaks the batch; the rest go through
+        for r in rows:
+            try:
+                await apply([r], session_factory)
+            except Exception as e:
+                await record_failure(r, str(e) or e.__class__.__name__, session_factory)
+    return len(rows)
+
+
+async def drain(session_factory=AsyncSessionLocal) -> int:
+    """Apply everything due now; returns how many rows were claimed."""
+    total = 0
+    while n := await consume_once(session_factory):
+        total += n
+    return total
+
+
+async def _consume_forever(session_factory) -> None:
+    while True:
+        try:
+            n = await consume_once(session_factory)
+        except Exception:
+            logger.exception("webhook_consumer_loop_error")
+            n = 0
+        # a full batch means there is probably more work waiting
+        if n < settings.webhook_consume_batch:
+            await asyncio.sleep(settings.webhook_poll_seconds)
+
+
+async def run_consumers(session_factory=AsyncSessionLocal) -> None:
+    await asyncio.gather(
+        *(_consume_forever(session_factory) for _ in range(settings.webhook_consumers))
+    )
+
+
+async def replay(
+    event_ids: list[str] | None = None, session_factory=AsyncSessionLocal
+) -> int:
+    """Move dead letters (all, or these event_ids) back to the inbox."""
+    stmt = select(WebhookDeadLetter).order_by(WebhookDeadLetter.id)
+    if event_ids:
+        stmt = stmt.where(WebhookDeadLetter.event_id.in_(event_ids))
+    async with session_factory() as db:
+        dead = (await db.scalars(stmt)).all()
+        if dead:
+            now = utcnow()
+            await db.execute(
+                insert(WebhookInbox),
+                [
+                    {
+                        "event_id": d.event_id,
+                        "payout_ref": d.payout_ref,
+                        "payload": d.payload,
+                        "next_attempt_at": now,
+                    }
+                    for d in dead
+                ],
+            )
+            await db.execute(
+                delete(WebhookDeadLetter).where(
+                    WebhookDeadLetter.id.in_([d.id for d in dead])
+                )
+            )
+        await db.commit()
+    return len(dead)
+
+
+def main():
+    ap = argparse.ArgumentParser(prog="python -m app.inbox")
+    ap.add_argument("command", choices=["replay"])
+    ap.add_argument("--event-id", action="append", dest="event_ids")
+    args = ap.parse_args()
+    n = asyncio.run(replay(args.event_ids))
+    print(f"webhook events requeued: {n}")
+
+
+if __name__ == "__main__":
+    main()
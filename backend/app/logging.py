@@ -1,11 +1,157 @@
-import logging, structlog
-
-logging.basicConfig(level=logging.INFO)
-structlog.configure(
-    processors=[
-        structlog.processors.add_log_level,
-        structlog.processors.TimeStamper(fmt="iso"),
-        structlog.processors.JSONRenderer(),
-    ]
-)
+"""
+Structured logging off the event loop.
+
+structlog renders each event with orjson and hands the bytes to a bounded
+queue; a daemon thread drains it and writes to stdout in batches. Stdlib
+loggers (uvicorn, httpx, sqlalchemy) go through a QueueHandler the same way.
+If the queue is full the record is dropped and counted rather than blocking
+the request.
+
+Levels come from Settings: LOG_LEVEL for the root, LOG_LEVELS for per-logger
+overrides ("httpx=WARNING,sqlalchemy.engine=INFO"); "app" is the structlog
+logger used throughout the backend.
+
+LOG_SAMPLE ("/health=0.01,/metrics=0") sets the fraction of requests to a
+path that get a request_completed line; 5xx responses are always logged.
+"""
+
+import atexit, logging, logging.handlers, queue, random, sys, threading
+
+import orjson, structlog
+
+from app.config import settings
+from app.metrics import Counter
+
+log_dropped = Counter("log_records_dropped_total", "Log records dropped, queue full")
+
+
+def _levels(spec: str) -> dict[str, int]:
+    out = {}
+    for part in spec.split(","):
+        name, _, level = part.partition("=")
+        if name.strip() and level.strip():
+            out[name.strip()] = logging.getLevelName(level.strip().upper())
+    return out
+
+
+def _rates(spec: str) -> dict[str, float]:
+    out = {}
+    for part in spec.split(","):
+        path, _, rate = part.partition("=")
+        if path.strip() and rate.strip():
+            out[path.strip()] = float(rate)
+    return out
+
+
+_sample_rates = _rates(settings.log_sample)
+
+
+def sampled(path: str, status: int) -> bool:
+    """Whether to log this request, per LOG_SAMPLE."""
+    rate = _sample_rates.get(path)
+    if rate is None or status >= 500:
+        return True
+    return rate > 0 and random.random() < rate
+
+
+class QueueWriter:
+    """Bounded queue of rendered lines, written to a stream by one thread."""
+
+    def __init__(self, maxsize: int, stream=None):
+        self.queue: queue.Queue[bytes] = queue.Queue(maxsize)
+        self.stream = stream
+        self._thread = threading.Thread(
+            target=self._run, name="log-writer", daemon=True
+        )
+        self._thread.start()
+
+    def put(self, line: bytes) -> None:
+        try:
+            self.queue.put_nowait(line)
+        except queue.Full:
+            log_dropped.inc()
+
+    def _write(self, data: bytes) -> None:
+        stream = self.stream or sys.stdout
+        buf = getattr(stream, "buffer", None)
+        if buf is not None:
+            stream.flush()
+            buf.write(data)
+            buf.flush()
+        else:
+            stream.write(data.decode())
+            stream.flush()
+
+    def _run(self) -> None:
+        while True:
+            lines = [self.queue.get()]
+            # drain whatever else is waiting into one write
+            while len(lines) < 1000:
+                try:
+                    lines.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(b"".join(ln + b"\n" for ln in lines))
+            except Exception:
+                pass  # never let a broken stdout kill the writer
+            for _ in lines:
+                self.queue.task_done()
+
+    def flush(self) -> None:
+        self.queue.join()
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            log_dropped.inc()
+
+
+class QueueLogger:
+    """structlog logger that enqueues already-rendered bytes."""
+
+    def __init__(self, writer: QueueWriter):
+        self._writer = writer
+
+    def msg(self, message: bytes) -> None:
+        self._writer.put(message)
+
+    log = debug = info = warn = warning = msg
+    err = error = critical = exception = fatal = failure = msg
+
+
+def configure(writer: QueueWriter) -> None:
+    levels = _levels(settings.log_levels)
+    root_level = logging.getLevelName(settings.log_level.upper())
+
+    log_queue: queue.Queue = queue.Queue(settings.log_queue_size)
+    handler = _DroppingQueueHandler(log_queue)
+    logging.basicConfig(level=root_level, handlers=[handler], force=True)
+    listener = logging.handlers.QueueListener(log_queue, logging.StreamHandler())
+    listener.start()
+    atexit.register(listener.stop)
+    for name, level in levels.items():
+        logging.getLogger(name).setLevel(level)
+
+    structlog.configure(
+        processors=[
+            structlog.processors.add_log_level,
+            structlog.processors.TimeStamper(fmt="iso"),
+            structlog.processors.format_exc_info,
+            structlog.processors.JSONRenderer(serializer=orjson.dumps),
+        ],
+        wrapper_class=structlog.make_filtering_bound_logger(
+            levels.get("app", root_level)
+        ),
+        logger_factory=lambda *args: QueueLogger(writer),
+        cache_logger_on_first_use=True,
+    )
+
+
+writer = QueueWriter(settings.log_queue_size)
+atexit.register(writer.flush)
+configure(writer)
 logger = structlog.get_logger()
@@ -1,26 +1,27 @@
 from fastapi import FastAPI, Request
 from fastapi.encoders import jsonable_encoder
-from fastapi.middleware.cors import CORSMiddleware
 from fastapi import HTTPException
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi import HTTPException
 from fastapi.exceptions import RequestValidationError
 from fastapi.encoders import jsonable_encoder
 
 from slowapi.errors import RateLimitExceeded
 from slowapi import _rate_limit_exceeded_handler
-from slowapi.middleware import SlowAPIMiddleware
 
-import os, asyncio
+import asyncio
 from contextlib import asynccontextmanager
-from app.cleanup import cleanup_idempotency_keys
+from app.cleanup import cleanup_expired
+from app.dispatch import run_dispatcher
+from app.clients import PROVIDER, open_clients, close_clients
+from app import events, idempotency, inbox, metrics, middleware
+from app.replicas import read_router
+from app.cache import payout_cache
 
 from app.rate_limit import limiter
 from pydantic import ValidationError
 from sqlalchemy.exc import IntegrityError
-from uuid import uuid4
-import time
 
 from app.config import settings
 from app.logging import logger
@@ -35,44 +36,33 @@ from app.webhooks import router as webhook_router
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    task = None
+    tasks = []
+    app.state.http_clients = clients = open_clients()
     try:
-        if os.getenv("ENV") != "test":
-            task = asyncio.create_task(cleanup_idempotency_keys())
+        if settings.run_background_tasks:
+            tasks.append(asyncio.create_task(cleanup_expired()))
+            tasks.append(asyncio.create_task(run_dispatcher(clients[PROVIDER])))
+            tasks.append(asyncio.create_task(inbox.run_consumers()))
+        if settings.database_url.startswith("postgresql"):
+            # every worker serves event streams and duplicate POST /payouts
+            tasks.append(asyncio.create_task(events.listen()))
+            tasks.append(asyncio.create_task(idempotency.listen()))
+        if payout_cache.redis is not None and (
+            payout_cache.enabled or read_router.replicas
+        ):
+            # every worker needs this for its L1 and its replica pins,
+            # background tasks or not
+            tasks.append(asyncio.create_task(payout_cache.listen()))
+        if read_router.replicas:
+            tasks.append(asyncio.create_task(read_router.run_health_checks()))
+        if metrics.METRICS_DIR:
+            tasks.append(asyncio.create_task(metrics.flush_forever()))
         yield
     finally:
-        if task:
+        for task in tasks:
             task.cancel()
-
-
-app = FastAPI(title="Fintech Backend", lifespan=lifespan)
-
-
-app.state.limiter = limiter
-
-
-@app.middleware("http")
-async def correlation_and_log(request: Request, call_next):
-    cid = request.headers.get("x-correlation-id") or str(uuid4())
-    request.state.request_id = cid
-    start = time.perf_counter()
-    response = None
-
-    try:
-        response = await call_next(request)
-        return response
-    finally:
-        dur_ms = int((time.perf_counter() - start) * 1000)
-        logger.info(
-            "request_completed",
-            path=str(request.url),
-            method=request.method,
-            status=getattr(response, "status_code", 500),
-            duration_ms=dur_ms,
-            cid=cid,
-        )
-        if response:
-            response.headers["x-correlation-id"] = cid
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await close_clients(clients)
 
 
 # CORS
@@ -82,15 +72,14 @@ origins = (
     else settings.cors_origins
 )
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+app = FastAPI(
+    title="Fintech Backend",
+    lifespan=lifespan,
+    middleware=middleware.stack(limiter, origins),
 )
 
-app.add_middleware(SlowAPIMiddleware)
+
+app.state.limiter = limiter
 
 
 # Error Helpers
@@ -144,6 +133,9 @@ async def on_request_validation_error(request: Request, exc: RequestValidationEr
 
 @app.exception_handler(RateLimitExceeded)
 async def on_rate_limited(request: Request, exc: RateLimitExceeded):
+    metrics.rate_limited.inc(
+        route=getattr(request.scope.get("route"), "path", "unmatched")
+    )
     # 1) Build the default response (sync function → do NOT await)
     default_resp = _rate_limit_exceeded_handler(request, exc)
 
@@ -166,5 +158,12 @@ app.include_router(webhook_router)
 
 
 @app.get("/health")
-def health():
+async def health():
     return {"status": "ok"}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    return PlainTextResponse(
+        await metrics.render_async(), media_type="text/plain; version=0.0.4"
+    )
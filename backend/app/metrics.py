@@ -0,0 +1,233 @@
+"""
+Minimal in-process metrics, rendered in the Prometheus text format.
+
+Metrics are module-level singletons registered on creation; labels are passed
+as keyword arguments. Updates are plain dict operations on the event loop
+thread, so there is no locking on the hot path.
+
+With several uvicorn workers set METRICS_DIR to a directory shared by them:
+each worker periodically writes a JSON snapshot of its metrics there, and
+`/metrics` on any worker merges all snapshots (counters and histograms are
+summed, gauges get a `pid` label). A snapshot not rewritten for a few flush
+intervals belongs to a worker that is gone: its counters still count, its
+gauges are dropped.
+"""
+
+import asyncio, bisect, json, os, time
+from collections import defaultdict
+
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "5"))
+STALE_SECONDS = 3 * FLUSH_SECONDS
+
+REGISTRY: list["_Metric"] = []
+
+# latency buckets in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _labels_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def _fmt_labels(key: tuple) -> str:
+    if not key:
+        return ""
+    inner = ",".join(f'{k}="{v}"' for k, v in key)
+    return "{" + inner + "}"
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str):
+        self.name, self.help = name, help
+        self._values: dict[tuple, float] = defaultdict(float)
+        REGISTRY.append(self)
+
+    def value(self, **labels) -> float:
+        return self._values.get(_labels_key(labels), 0.0)
+
+    def state(self) -> list:
+        return [[list(map(list, k)), v] for k, v in list(self._values.items())]
+
+    @staticmethod
+    def merge(a, b):
+        return a + b
+
+    def samples(self, values: dict):
+        for key, v in values.items():
+            yield self.name, key, v
+
+    def render(self, values: dict | None = None) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for name, key, v in self.samples(self._values if values is None else values):
+            lines.append(f"{name}{_fmt_labels(key)} {v:g}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        self._values[_labels_key(labels)] += amount
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        self._values[_labels_key(labels)] = value
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(buckets)
+        # per label set: one count per bucket, +Inf count, then the sum
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = _labels_key(labels)
+        h = self._values.get(key)
+        if h is None:
+            h = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        h[bisect.bisect_left(self.buckets, value)] += 1
+        h[-1] += value
+
+    def count(self, **labels) -> int:
+        h = self._values.get(_labels_key(labels))
+        return sum(h[:-1]) if h else 0
+
+    def state(self) -> list:
+        return [[list(map(list, k)), list(v)] for k, v in list(self._values.items())]
+
+    @staticmethod
+    def merge(a, b):
+        return [x + y for x, y in zip(a, b)]
+
+    def samples(self, values: dict):
+        for key, h in values.items():
+            cum = 0
+            for le, n in zip((*self.buckets, "+Inf"), h[:-1]):
+                cum += n
+                yield f"{self.name}_bucket", (*key, ("le", le)), cum
+            yield f"{self.name}_sum", key, h[-1]
+            yield f"{self.name}_count", key, cum
+
+
+def snapshot() -> dict:
+    return {m.name: m.state() for m in REGISTRY}
+
+
+def _snapshot_path(pid: int) -> str:
+    return os.path.join(METRICS_DIR, f"{pid}.json")
+
+
+def write_snapshot() -> None:
+    tmp = _snapshot_path(os.getpid()) + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(snapshot(), f)
+    os.replace(tmp, _snapshot_path(os.getpid()))
+
+
+def _merged(metrics_dir: str) -> dict[str, dict]:
+    merged: dict[str, dict] = defaultdict(dict)
+    by_name = {m.name: m for m in REGISTRY}
+    now = time.time()
+    for fn in os.listdir(metrics_dir):
+        if not fn.endswith(".json"):
+            continue
+        path = os.path.join(metrics_dir, fn)
+        try:
+            stale = now - os.path.getmtime(path) > STALE_SECONDS
+            with open(path) as f:
+                snap = json.load(f)
+        except (OSError, ValueError):
+            continue  # being replaced right now
+        pid = fn.removesuffix(".json")
+        for name, entries in snap.items():
+            m = by_name.get(name)
+            if m is None or (stale and isinstance(m, Gauge)):
+                continue
+            for key, v in entries:
+                key = tuple(tuple(kv) for kv in key)
+                if isinstance(m, Gauge):
+                    key = (*key, ("pid", pid))
+                prev = merged[name].get(key)
+                merged[name][key] = v if prev is None else m.merge(prev, v)
+    return merged
+
+
+def render() -> str:
+    if not METRICS_DIR:
+        return "\n".join(m.render() for m in REGISTRY) + "\n"
+    write_snapshot()  # include this worker's latest numbers
+    merged = _merged(METRICS_DIR)
+    return "\n".join(m.render(merged.get(m.name, {})) for m in REGISTRY) + "\n"
+
+
+async def render_async() -> str:
+    """render() for request handlers: snapshot file I/O runs in a thread."""
+    if not METRICS_DIR:
+        return render()
+    return await asyncio.to_thread(render)
+
+
+async def flush_forever() -> None:
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    while True:
+        await asyncio.to_thread(write_snapshot)
+        await asyncio.sleep(FLUSH_SECONDS)
+
+
+# HTTP, provider, webhook, DB pool and limiter metrics live here so every
+# module records into the same names.
+http_requests = Counter("http_requests_total", "HTTP requests by route and status")
+http_latency = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template"
+)
+provider_latency = Histogram(
+    "provider_request_duration_seconds", "Payout provider call latency"
+)
+provider_shed = Counter(
+    "provider_shed_total", "Provider calls not sent (breaker, Retry-After, limits)"
+)
+provider_breaker_state = Gauge(
+    "provider_breaker_state", "Provider circuit: 0 closed, 1 half-open, 2 open"
+)
+provider_concurrency_limit = Gauge(
+    "provider_concurrency_limit", "Adaptive (AIMD) limit on provider calls in flight"
+)
+provider_retries = Counter(
+    "provider_retries_total", "Payout provider attempts rescheduled after an error"
+)
+dispatch_failed = Counter(
+    "payout_dispatch_failed_total", "Payouts that exhausted all provider attempts"
+)
+webhook_latency = Histogram(
+    "webhook_processing_seconds", "Webhook handling time after signature check"
+)
+webhook_retries = Counter(
+    "webhook_inbox_retries_total", "Queued webhook events rescheduled after an error"
+)
+webhook_dead_lettered = Counter(
+    "webhook_dead_letters_total", "Queued webhook events moved to the dead-letter table"
+)
+webhook_queue_lag = Histogram(
+    "webhook_queue_lag_seconds", "Time from webhook ack to its status being applied"
+)
+db_checkout_wait = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent waiting for a pooled DB connection",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30),
+)
+db_queries = Counter("db_queries_total", "Statements sent by the async engine")
+db_reads = Counter(
+    "db_read_sessions_total", "Read-only sessions by target and routing reason"
+)
+db_replica_healthy = Gauge("db_replica_healthy", "1 if a read replica is in rotation")
+db_replica_lag = Gauge("db_replica_lag_seconds", "Replay lag at the last health check")
+rate_limited = Counter("rate_limit_rejections_total", "Requests rejected with 429")
@@ -0,0 +1,146 @@
+"""
+The HTTP middleware stack, as plain ASGI callables.
+
+Each layer wraps `send` to see the response start and otherwise passes the
+ASGI messages straight through: no extra task per request and no body
+buffering, so streaming responses (SSE, exports) flow unchanged. Outermost
+first:
+
+- CorrelationId: takes X-Correlation-ID or makes one, stores it as
+  request.state.request_id and echoes it on the response.
+- AccessLog: request count/latency metrics by route template, and the
+  sampled request_completed log line.
+- CORSMiddleware (Starlette's, already pure ASGI).
+- RateLimit: the limiter's default/application limits for routes without
+  their own @limiter.limit (those are checked by the decorator).
+"""
+
+import time
+from uuid import uuid4
+
+from slowapi.errors import RateLimitExceeded
+from slowapi.middleware import _find_route_handler, _should_exempt
+from starlette.datastructures import MutableHeaders
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app import metrics
+from app.logging import logger, sampled
+
+CORRELATION_HEADER = b"x-correlation-id"
+
+
+class CorrelationId:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        cid = None
+        for k, v in scope["headers"]:
+            if k == CORRELATION_HEADER:
+                cid = v.decode("latin-1")
+                break
+        cid = cid or str(uuid4())
+        scope.setdefault("state", {})["request_id"] = cid
+
+        async def send_with_cid(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message)["x-correlation-id"] = cid
+            await send(message)
+
+        await self.app(scope, receive, send_with_cid)
+
+
+class AccessLog:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        status, dur = 500, None
+
+        async def send_timed(message: Message) -> None:
+            nonlocal status, dur
+            if message["type"] == "http.response.start":
+                # time to the response head, so a long stream isn't a slow request
+                status, dur = message["status"], time.perf_counter() - start
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_timed)
+        finally:
+            if dur is None:
+                dur = time.perf_counter() - start
+            method = scope["method"]
+            # route template (/payouts/{id}), not the raw URL, keeps label sets bounded
+            route = getattr(scope.get("route"), "path", "unmatched")
+            metrics.http_requests.inc(method=method, route=route, status=status)
+            metrics.http_latency.observe(dur, method=method, route=route)
+            if sampled(scope["path"], status):
+                logger.info(
+                    "request_completed",
+                    path=str(Request(scope).url),
+                    method=method,
+                    status=status,
+                    duration_ms=int(dur * 1000),
+                    cid=scope.get("state", {}).get("request_id"),
+                )
+
+
+class RateLimit:
+    """slowapi's middleware check, without BaseHTTPMiddleware."""
+
+    def __init__(self, app: ASGIApp, limiter):
+        self.app, self.limiter = app, limiter
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        limiter = self.limiter
+        if (
+            scope["type"] != "http"
+            or not limiter.enabled
+            # nothing to enforce here: decorated routes check themselves
+            or not (limiter._default_limits or limiter._application_limits)
+        ):
+            return await self.app(scope, receive, send)
+
+        app = scope["app"]
+        handler = _find_route_handler(app.routes, scope)
+        if _should_exempt(limiter, handler):
+            return await self.app(scope, receive, send)
+        request = Request(scope, receive)
+        try:
+            limiter._check_request_limit(request, handler, True)
+        except RateLimitExceeded as e:
+            response = await app.exception_handlers[RateLimitExceeded](request, e)
+            return await response(scope, receive, send)
+
+        async def send_with_limits(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                limiter._inject_asgi_headers(
+                    MutableHeaders(scope=message), request.state.view_rate_limit
+                )
+            await send(message)
+
+        await self.app(scope, receive, send_with_limits)
+
+
+def stack(limiter, cors_origins: list[str]) -> list[Middleware]:
+    """The app's middleware, outermost first."""
+    return [
+        Middleware(CorrelationId),
+        Middleware(AccessLog),
+        Middleware(
+            CORSMiddleware,
+            allow_origins=cors_origins,
+            allow_credentials=True,
+            allow_methods=["*"],
+            allow_headers=["*"],
+        ),
+        Middleware(RateLimit, limiter=limiter),
+    ]
@@ -1,12 +1,13 @@
 from sqlalchemy import (
+    BigInteger,
     Column,
     Integer,
     String,
-    Numeric,
     ForeignKey,
     DateTime,
     func,
     UniqueConstraint,
+    Index,
 )
 import sqlalchemy as sa
 from sqlalchemy.orm import relationship, Mapped, mapped_column
@@ -20,6 +21,10 @@ class User(Base):
     provider_user_id: Mapped[str] = mapped_column(String(128), index=True)
     email: Mapped[str | None] = mapped_column(String(255), index=True)
     name: Mapped[str | None] = mapped_column(String(255))
+    # maintained by create_payout so listing never has to count()
+    payout_count: Mapped[int] = mapped_column(
+        Integer, default=0, server_default=sa.text("0")
+    )
     created_at: Mapped[DateTime] = mapped_column(
         DateTime, server_default=sa.text("CURRENT_TIMESTAMP")
     )
@@ -31,15 +36,15 @@ class User(Base):
 class Payout(Base):
     __tablename__ = "payouts"
     id: Mapped[int] = mapped_column(primary_key=True)
-    user_id: Mapped[int] = mapped_column(
-        ForeignKey("users.id", ondelete="CASCADE"), index=True
-    )
-    amount: Mapped[Numeric] = mapped_column(Numeric(12, 2))
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"))
+    # minor units of `currency` (app/money.py)
+    amount_minor: Mapped[int] = mapped_column(BigInteger)
     currency: Mapped[str] = mapped_column(String(3))
     status: Mapped[str] = mapped_column(
         String(32), default="pending"
     )  # pending|processing|paid|failed
     provider_ref: Mapped[str | None] = mapped_column(String(128), index=True)
+    batch_id: Mapped[str | None] = mapped_column(String(32), index=True)
     created_at: Mapped[DateTime] = mapped_column(
         DateTime, server_default=sa.text("CURRENT_TIMESTAMP")
     )
@@ -51,13 +56,17 @@ class Payout(Base):
     user = relationship("User")
 
 
+# keyset pagination: WHERE user_id = ? AND id < ? ORDER BY id DESC
+Index("ix_payouts_user_id_id", Payout.user_id, Payout.id.desc())
+
+
 class IdempotencyKey(Base):
     __tablename__ = "idempotency_keys"
     key: Mapped[str] = mapped_column(String(128), primary_key=True)
     user_id: Mapped[int] = mapped_column(Integer, index=True)
     payout_id: Mapped[int | None] = mapped_column(Integer)
     created_at: Mapped[DateTime] = mapped_column(
-        DateTime, server_default=sa.text("CURRENT_TIMESTAMP")
+        DateTime, server_default=sa.text("CURRENT_TIMESTAMP"), index=True
     )
 
 
@@ -66,6 +75,72 @@ class WebhookEvent(Base):
     id: Mapped[int] = mapped_column(primary_key=True)
     event_id: Mapped[str] = mapped_column(String(128), unique=True, index=True)
     payload: Mapped[str] = mapped_column(String)
+    received_at: Mapped[DateTime] = mapped_column(
+        DateTime, server_default=sa.text("CURRENT_TIMESTAMP"), index=True
+    )
+
+
+class WebhookInbox(Base):
+    """Queue row: an acknowledged webhook event waiting to be applied (app/inbox.py)."""
+
+    __tablename__ = "webhook_inbox"
+    __table_args__ = (Index("ix_webhook_inbox_payout_ref_id", "payout_ref", "id"),)
+    id: Mapped[int] = mapped_column(primary_key=True)  # order within a payout_ref
+    event_id: Mapped[str] = mapped_column(String(128))
+    payout_ref: Mapped[str] = mapped_column(String(128))
+    payload: Mapped[str] = mapped_column(String)
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    next_attempt_at: Mapped[DateTime] = mapped_column(DateTime, index=True)
+    last_error: Mapped[str | None] = mapped_column(String(255))
     received_at: Mapped[DateTime] = mapped_column(
         DateTime, server_default=sa.text("CURRENT_TIMESTAMP")
     )
+
+
+class WebhookDeadLetter(Base):
+    """A queued webhook event that exhausted its attempts; see `python -m app.inbox`."""
+
+    __tablename__ = "webhook_dead_letters"
+    id: Mapped[int] = mapped_column(primary_key=True)
+    event_id: Mapped[str] = mapped_column(String(128), index=True)
+    payout_ref: Mapped[str] = mapped_column(String(128))
+    payload: Mapped[str] = mapped_column(String)
+    attempts: Mapped[int] = mapped_column(Integer)
+    last_error: Mapped[str | None] = mapped_column(String(255))
+    received_at: Mapped[DateTime] = mapped_column(DateTime)
+    failed_at: Mapped[DateTime] = mapped_column(
+        DateTime, server_default=sa.text("CURRENT_TIMESTAMP")
+    )
+
+
+class PayoutDispatch(Base):
+    """Outbox row: a payout waiting to be submitted to the provider."""
+
+    __tablename__ = "payout_dispatches"
+    id: Mapped[int] = mapped_column(primary_key=True)
+    payout_id: Mapped[int] = mapped_column(
+        ForeignKey("payouts.id", ondelete="CASCADE"), unique=True
+    )
+    status: Mapped[str] = mapped_column(
+        String(16), default="pending"
+    )  # pending|sent|failed
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    next_attempt_at: Mapped[DateTime] = mapped_column(DateTime, index=True)
+    correlation_id: Mapped[str | None] = mapped_column(String(128))
+    last_error: Mapped[str | None] = mapped_column(String(255))
+    created_at: Mapped[DateTime] = mapped_column(
+        DateTime, server_default=sa.text("CURRENT_TIMESTAMP")
+    )
+
+
+class PayoutStat(Base):
+    """Per-user count and sum of payouts by currency and status (app/stats.py)."""
+
+    __tablename__ = "payout_stats"
+    user_id: Mapped[int] = mapped_column(
+        ForeignKey("users.id", ondelete="CASCADE"), primary_key=True
+    )
+    currency: Mapped[str] = mapped_column(String(3), primary_key=True)
+    status: Mapped[str] = mapped_column(String(32), primary_key=True)
+    count: Mapped[int] = mapped_column(Integer, default=0)
+    total_minor: Mapped[int] = mapped_column(BigInteger, default=0)
@@ -0,0 +1,52 @@
+"""
+Money as integer minor units (cents, pence, yen, fils ...).
+
+Amounts are stored and summed as BIGINT minor units; the API keeps speaking
+decimal strings with exactly the currency's number of decimals ("25.00",
+"1500" for JPY, "1.250" for KWD). `EXPONENTS` is the ISO 4217 minor-unit
+table; accepting a currency is a separate decision (CURRENCY_WHITELIST in
+app/schemas.py).
+"""
+
+from decimal import Decimal, ROUND_HALF_UP
+
+# ISO 4217 minor units; anything not listed has 2
+EXPONENTS = {
+    **dict.fromkeys(
+        ("BIF", "CLP", "DJF", "GNF", "ISK", "JPY", "KMF", "KRW", "PYG", "RWF"), 0
+    ),
+    **dict.fromkeys(("UGX", "UYI", "VND", "VUV", "XAF", "XOF", "XPF"), 0),
+    **dict.fromkeys(("BHD", "IQD", "JOD", "KWD", "LYD", "OMR", "TND"), 3),
+    "CLF": 4,
+    "UYW": 4,
+}
+DEFAULT_EXPONENT = 2
+
+# BIGINT
+MAX_MINOR = 2**63 - 1
+# payouts.amount is still Numeric(12,2), filled by a sync trigger, until the
+# contract release of migration b5e1f7c4a9d0 drops it
+MAX_MAJOR = Decimal(10) ** 10
+
+
+def exponent(currency: str) -> int:
+    return EXPONENTS.get(currency, DEFAULT_EXPONENT)
+
+
+def quantize(amount: Decimal, currency: str) -> Decimal:
+    """Round half up to the currency's minor unit."""
+    return amount.quantize(Decimal(1).scaleb(-exponent(currency)), ROUND_HALF_UP)
+
+
+def to_minor(amount: Decimal, currency: str) -> int:
+    """Decimal major units -> int minor units (rounded half up)."""
+    return int(quantize(amount, currency).scaleb(exponent(currency)))
+
+
+def to_str(minor: int, currency: str) -> str:
+    """int minor units -> the API's decimal string, e.g. 2500 USD -> "25.00"."""
+    exp = exponent(currency)
+    if not exp:
+        return str(minor)
+    major, frac = divmod(abs(minor), 10**exp)
+    return f"{'-' if minor < 0 else ''}{major}.{frac:0{exp}d}"
@@ -0,0 +1,305 @@
+"""
+Guarded calls to the payment provider.
+
+Every outbound call passes these gates, cheapest first, and is shed (never sent)
+when one of them says no:
+
+- circuit breaker: opens when at least `provider_breaker_failure_ratio` of the
+  last `provider_breaker_window` calls failed (5xx or transport error), sheds
+  everything for `provider_breaker_cooldown_seconds`, then lets
+  `provider_breaker_probes` calls through (half-open). A successful probe
+  closes it; a failed one reopens it.
+- Retry-After: a 429/503 carrying Retry-After pauses all calls until then.
+- token bucket: at most `provider_rate_per_second` calls (burst
+  `provider_burst`).
+- AIMD concurrency: the limit grows by 1/limit per fast success and halves on a
+  429 or a call slower than `provider_latency_target_seconds`, between 1 and
+  `dispatch_concurrency`.
+
+Waiting for a token or a slot is bounded by `provider_queue_timeout_seconds`.
+A shed call raises ProviderUnavailable with the time to retry after, and the
+dispatcher reschedules it without spending an attempt. State is per worker.
+"""
+
+import asyncio, time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable
+
+import httpx
+
+from app.config import settings
+from app.metrics import (
+    provider_breaker_state,
+    provider_concurrency_limit,
+    provider_latency,
+    provider_shed,
+)
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_VALUE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+MAX_RETRY_AFTER = 600.0
+
+
+class ProviderUnavailable(Exception):
+    """The call was shed before reaching the provider."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"provider call shed: {reason}")
+        self.reason, self.retry_after = reason, retry_after
+
+
+class ProviderError(Exception):
+    """The provider answered with an error status."""
+
+    def __init__(self, status: int, retry_after: float | None = None):
+        super().__init__(f"provider returned {status}")
+        self.status, self.retry_after = status, retry_after
+
+
+def retry_after(r: httpx.Response) -> float | None:
+    """Seconds from a Retry-After header (delta or HTTP date), capped."""
+    raw = r.headers.get("retry-after")
+    if not raw:
+        return None
+    try:
+        secs = float(raw)
+    except ValueError:
+        try:
+            secs = parsedate_to_datetime(raw).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(secs, 0.0), MAX_RETRY_AFTER)
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        window: int,
+        failure_ratio: float,
+        min_calls: int,
+        cooldown: float,
+        probes: int,
+    ):
+        self.failure_ratio, self.min_calls = failure_ratio, min_calls
+        self.cooldown, self.probes = cooldown, probes
+        self.outcomes: deque[bool] = deque(maxlen=window)
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.probing = 0
+
+    def _set(self, state: str) -> None:
+        self.state = state
+        provider_breaker_state.set(_STATE_VALUE[state])
+
+    def admit(self) -> float:
+        """0 if a call may go out now, else seconds until it might."""
+        if self.state == OPEN:
+            wait = self.opened_at + self.cooldown - time.monotonic()
+            if wait > 0:
+                return wait
+            self._set(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            if self.probing >= self.probes:
+                return self.cooldown
+            self.probing += 1
+        return 0.0
+
+    def record(self, ok: bool) -> None:
+        if self.state == HALF_OPEN:
+            self.probing = max(0, self.probing - 1)
+            if ok:
+                self.outcomes.clear()
+                self._set(CLOSED)
+            else:
+                self._open()
+            return
+        self.outcomes.append(ok)
+        failures = self.outcomes.count(False)
+        if (
+            self.state == CLOSED
+            and len(self.outcomes) >= self.min_calls
+            and failures >= self.failure_ratio * len(self.outcomes)
+        ):
+            self._open()
+
+    def _open(self) -> None:
+        self.opened_at = time.monotonic()
+        self.probing = 0
+        self._set(OPEN)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate, self.burst = rate, burst
+        self.tokens, self.updated = float(burst), time.monotonic()
+
+    def reserve(self, max_wait: float) -> float | None:
+        """Take a token; return how long to wait for it, or None if too long."""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        wait = (1 - self.tokens) / self.rate if self.tokens < 1 else 0.0
+        if wait > max_wait:
+            return None
+        self.tokens -= 1
+        return wait
+
+
+class AIMDLimiter:
+    """Concurrency limit: additive increase, multiplicative decrease."""
+
+    def __init__(self, initial: int, minimum: int, maximum: int, cooldown: float):
+        self.minimum, self.maximum, self.cooldown = minimum, maximum, cooldown
+        self.limit = float(initial)
+        self.inflight = 0
+        self._waiters: deque[asyncio.Future] = deque()
+        self._decreased_at = 0.0
+        provider_concurrency_limit.set(int(self.limit))
+
+    async def acquire(self, timeout: float) -> bool:
+        if self.inflight < int(self.limit) and not self._waiters:
+            self.inflight += 1
+            return True
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        try:
+            await asyncio.wait_for(fut, timeout)  # release() hands us its slot
+            return True
+        except asyncio.TimeoutError:
+            return False
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self.release()
+            raise
+        finally:
+            if fut in self._waiters:
+                self._waiters.remove(fut)
+
+    def release(self) -> None:
+        self.inflight -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._waiters and self.inflight < int(self.limit):
+            fut = self._waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)
+                self.inflight += 1
+
+    def on_success(self) -> None:
+        self.limit = min(self.maximum, self.limit + 1 / self.limit)
+        provider_concurrency_limit.set(int(self.limit))
+        self._wake()
+
+    def on_overload(self) -> None:
+        # one halving per cooldown: a burst of 429s from the same moment
+        # is one signal, not twenty
+        now = time.monotonic()
+        if now - self._decreased_at < self.cooldown:
+            return
+        self._decreased_at = now
+        self.limit = max(self.minimum, self.limit / 2)
+        provider_concurrency_limit.set(int(self.limit))
+
+
+class ProviderGuard:
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        """(Re)build every gate from settings, forgetting all state."""
+        self.breaker = CircuitBreaker(
+            window=settings.provider_breaker_window,
+            failure_ratio=settings.provider_breaker_failure_ratio,
+            min_calls=settings.provider_breaker_min_calls,
+            cooldown=settings.provider_breaker_cooldown_seconds,
+            probes=settings.provider_breaker_probes,
+        )
+        provider_breaker_state.set(0)
+        self.bucket = TokenBucket(
+            settings.provider_rate_per_second, settings.provider_burst
+        )
+        self.limiter = AIMDLimiter(
+            initial=settings.dispatch_concurrency,
+            minimum=1,
+            maximum=settings.dispatch_concurrency,
+            cooldown=settings.provider_latency_target_seconds,
+        )
+        self.latency_target = settings.provider_latency_target_seconds
+        self.queue_timeout = settings.provider_queue_timeout_seconds
+        self.paused_until = 0.0  # from Retry-After
+
+    def _shed(self, reason: str, retry_after: float):
+        provider_shed.inc(reason=reason)
+        return ProviderUnavailable(reason, retry_after)
+
+    async def call(self, send: Callable[[], Awaitable[httpx.Response]]):
+        """Run `send` through the gates; returns its response or raises."""
+        paused = self.paused_until - time.monotonic()
+        if paused > 0:
+            raise self._shed("retry_after", paused)
+        wait = self.breaker.admit()
+        if wait:
+            raise self._shed("open", wait)
+        try:
+            wait = self.bucket.reserve(self.queue_timeout)
+            if wait is None:
+                raise self._shed("rate", 1 / self.bucket.rate)
+            if wait:
+                await asyncio.sleep(wait)
+            if not await self.limiter.acquire(self.queue_timeout):
+                raise self._shed("concurrency", self.queue_timeout)
+        except BaseException:
+            if self.breaker.state == HALF_OPEN:
+                self.breaker.probing = max(0, self.breaker.probing - 1)
+            raise
+
+        start = time.perf_counter()
+        try:
+            r = await send()
+        except Exception:  # transport errors and timeouts
+            provider_latency.observe(time.perf_counter() - start, outcome="error")
+            self.breaker.record(False)
+            raise
+        finally:
+            self.limiter.release()
+        elapsed = time.perf_counter() - start
+
+        if r.status_code in (429, 503):
+            pause = retry_after(r)
+            if pause:
+                self.paused_until = max(self.paused_until, time.monotonic() + pause)
+        if r.status_code == 429:
+            outcome = "throttled"
+            self.limiter.on_overload()
+            self.breaker.record(True)  # it answered; the limiter handles load
+        elif r.status_code >= 500:
+            outcome = "error"
+            self.breaker.record(False)
+        else:
+            outcome = "ok"
+            self.breaker.record(True)
+            if elapsed > self.latency_target:
+                self.limiter.on_overload()
+            else:
+                self.limiter.on_success()
+        provider_latency.observe(elapsed, outcome=outcome)
+        return r
+
+
+guard = ProviderGuard()
+
+
+async def create_payout(
+    client: httpx.AsyncClient, payload: dict, headers: dict
+) -> str | None:
+    """POST a payout through the guard. Returns the provider reference."""
+    r = await guard.call(
+        lambda: client.post(settings.provider_url, json=payload, headers=headers)
+    )
+    if r.status_code >= 400:
+        raise ProviderError(r.status_code, retry_after(r))
+    return r.json().get("reference")
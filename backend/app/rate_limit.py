@@ -1,9 +1,14 @@
 from __future__ import annotations
-import os
+import os, threading, time
+from dataclasses import dataclass
 from typing import Optional
 from fastapi import Request
+from limits.storage import Storage
 from slowapi import Limiter
 from slowapi.util import get_remote_address
+import redis
+
+from app.logging import logger
 
 
 def _get_user_id(request: Request) -> Optional[str]:
@@ -15,16 +20,204 @@ def key_per_user(request: Request) -> str:
     return f"user:{uid}" if uid else f"ip:{get_remote_address(request)}"
 
 
+def key_per_user_export(request: Request) -> str:
+    # bulk exports get their own bucket, apart from interactive listing
+    return f"export:{key_per_user(request)}"
+
+
 def key_per_ip(request: Request) -> str:
     return f"ip:{get_remote_address(request)}"
 
 
+@dataclass
+class _Window:
+    index: int  # epoch-aligned window number, shared by all workers
+    expiry: int
+    synced: int = 0  # cluster-wide count last seen in Redis
+    pending: int = 0  # local hits not pushed to Redis yet
+    read: bool = False  # read since the last sync: pull the total next time
+
+    @property
+    def ends_at(self) -> float:
+        return (self.index + 1) * self.expiry
+
+
+class HybridStorage(Storage):
+    """
+    Fixed-window counters kept in process memory and reconciled with Redis in
+    the background, so a rate-limit check never waits on a Redis round trip.
+
+    Windows are aligned to the epoch, so every worker counts into the same
+    Redis key per window. A sync thread pushes local hits with INCRBY every
+    `sync_interval` seconds and pulls back the cluster-wide total. Windows
+    without local hits are only refreshed (GET) after a local read, so idle
+    keys cost no Redis traffic. Limits
+    across workers are therefore approximate (off by at most one interval of
+    traffic). While Redis is unreachable each worker limits on its own counts
+    and pushes the backlog once Redis is back.
+
+    Selected with a ``hybrid+redis://`` storage URI.
+    """
+
+    STORAGE_SCHEME = ["hybrid+redis", "hybrid+rediss"]
+    PREFIX = "LIMITS:hybrid"
+
+    def __init__(
+        self,
+        uri: str,
+        wrap_exceptions: bool = False,
+        sync_interval: float = 0.1,
+        client=None,
+        **options,
+    ):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self.sync_interval = float(sync_interval)
+        self.redis = client or redis.from_url(
+            uri.removeprefix("hybrid+"),
+            socket_timeout=0.25,
+            socket_connect_timeout=0.25,
+        )
+        self.redis_ok = True
+        self._windows: dict[str, _Window] = {}
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def base_exceptions(self):
+        return redis.RedisError
+
+    def _window(self, key: str, expiry: int | None = None) -> _Window | None:
+        w = self._windows.get(key)
+        if w is not None and w.ends_at <= time.time():
+            w = None
+        if w is None and expiry:
+            w = self._windows[key] = _Window(int(time.time() // expiry), expiry)
+        return w
+
+    def _redis_key(self, key: str, w: _Window) -> str:
+        return f"{self.PREFIX}:{key}:{w.index}"
+
+    def incr(self, key: str, expiry: int, amount: int = 1) -> int:
+        self._ensure_syncing()
+        with self._lock:
+            w = self._window(key, int(expiry))
+            w.pending += amount
+            return w.synced + w.pending
+
+    def get(self, key: str) -> int:
+        with self._lock:
+            w = self._window(key)
+            if w is None:
+                return 0
+            w.read = True
+            return w.synced + w.pending
+
+    def get_expiry(self, key: str) -> float:
+        with self._lock:
+            w = self._window(key)
+            return w.ends_at if w else time.time()
+
+    def check(self) -> bool:
+        try:
+            return bool(self.redis.ping())
+        except redis.RedisError:
+            return False
+
+    def reset(self) -> int | None:
+        with self._lock:
+            n = len(self._windows)
+            self._windows.clear()
+        try:
+            for k in self.redis.scan_iter(f"{self.PREFIX}:*"):
+                self.redis.delete(k)
+        except redis.RedisError:
+            pass
+        return n
+
+    def clear(self, key: str) -> None:
+        with self._lock:
+            w = self._windows.pop(key, None)
+        if w is not None:
+            try:
+                self.redis.delete(self._redis_key(key, w))
+            except redis.RedisError:
+                pass
+
+    # background reconciliation
+
+    def _ensure_syncing(self) -> None:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._sync_forever, name="ratelimit-sync", daemon=True
+                    )
+                    self._thread.start()
+
+    def _sync_forever(self) -> None:
+        while True:
+            time.sleep(self.sync_interval)
+            self.sync()
+
+    def sync(self) -> None:
+        """Push pending hits and pull cluster totals in one pipeline."""
+        now = time.time()
+        with self._lock:
+            for k in [k for k, w in self._windows.items() if w.ends_at <= now]:
+                del self._windows[k]
+            batch = [
+                (k, w, w.pending)
+                for k, w in self._windows.items()
+                if w.pending or w.read
+            ]
+            for _, w, _ in batch:
+                w.read = False
+        if not batch:
+            return
+        pipe = self.redis.pipeline(transaction=False)
+        for k, w, pushed in batch:
+            rk = self._redis_key(k, w)
+            if pushed:
+                pipe.incrby(rk, pushed)
+                pipe.expireat(rk, int(w.ends_at) + 1)
+            else:
+                pipe.get(rk)
+        try:
+            replies = iter(pipe.execute())
+        except redis.RedisError as e:
+            if self.redis_ok:
+                logger.warning("rate_limit_redis_unavailable", err=str(e))
+            self.redis_ok = False
+            return
+        if not self.redis_ok:
+            logger.info("rate_limit_redis_recovered")
+        self.redis_ok = True
+        with self._lock:
+            for k, w, pushed in batch:
+                total = int(next(replies) or 0)
+                if pushed:
+                    next(replies)  # EXPIREAT
+                w.pending -= pushed
+                w.synced = max(w.synced, total)  # total already includes `pushed`
+
+
 def build_limiter() -> Limiter:
     storage_uri = os.getenv("RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0")
+    storage_options = {}
+    # RATE_LIMIT_MODE=redis sends every check to Redis (slowapi default)
+    mode = os.getenv("RATE_LIMIT_MODE", "hybrid")
+    if mode == "hybrid" and storage_uri.startswith("redis"):
+        storage_uri = f"hybrid+{storage_uri}"
+        storage_options["sync_interval"] = float(
+            os.getenv("RATE_LIMIT_SYNC_SECONDS", "0.1")
+        )
     return Limiter(
         key_func=key_per_user,  # default per-user
         storage_uri=storage_uri,
+        storage_options=storage_options,
         headers_enabled=True,
+        # off only for load tests (bench/lifecycle.py)
+        enabled=os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true",
     )
 
 
@@ -0,0 +1,235 @@
+"""
+Read-replica routing for read-only endpoints.
+
+Writes always use `get_db` (the primary). Read-only handlers take `get_read_db`
+(`get_lazy_read_db` behind payout_cache, `get_read_session_factory` for
+streams), which hands out a session on a healthy replica, round robin, and
+falls back to the primary when there is no replica to use:
+
+- read-your-writes: after a write commits, the handler stores a token in the
+  `read_after` cookie, the primary's WAL position on Postgres (a wall-clock
+  timestamp on other databases). Reads carrying a token only use a replica
+  that had replayed past it at its last health check;
+- a user whose payouts changed by someone else's hand (webhooks, another
+  worker) is pinned to the primary for a lag window; payout_cache
+  invalidations feed this, on every worker;
+- every worker checks each replica every REPLICA_CHECK_SECONDS. A replica
+  that fails the check, lags more than REPLICA_MAX_LAG_SECONDS or raises a
+  connection error mid-request leaves rotation until its next good check.
+
+Without DATABASE_REPLICA_URLS everything reads from the primary.
+"""
+
+import asyncio, itertools, math, time
+from contextlib import asynccontextmanager
+
+from fastapi import Depends, Request, Response
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import InterfaceError, OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.cache import payout_cache
+from app.config import settings
+from app.db import AsyncSessionLocal, make_async_engine, make_sessionmaker
+from app.logging import logger
+from app.metrics import db_reads, db_replica_healthy, db_replica_lag
+from app.session import SAMESITE, SECURE_COOKIES
+
+READ_TOKEN_COOKIE = "read_after"
+
+_PG_REPLAY = text(
+    "SELECT pg_last_wal_replay_lsn()::text AS lsn, "
+    "CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE coalesce(extract(epoch FROM now() - pg_last_xact_replay_timestamp()), 0) "
+    "END AS lag"
+)
+
+
+def _lsn(s: str) -> int:
+    hi, lo = s.split("/")
+    return (int(hi, 16) << 32) | int(lo, 16)
+
+
+def _window() -> float:
+    """How long a write may take to show up on a replica still in rotation."""
+    return settings.replica_max_lag_seconds + settings.replica_check_seconds
+
+
+class Replica:
+    def __init__(self, name: str, sessions: async_sessionmaker):
+        self.name, self.sessions = name, sessions
+        # out of rotation until the first good health check
+        self.healthy = False
+        self.position = 0  # replayed up to here (LSN, or ms timestamp)
+
+
+class ReadRouter:
+    def __init__(self, primary: async_sessionmaker, replicas=()):
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.uses_lsn = primary.kw["bind"].dialect.name == "postgresql"
+        self._next = itertools.count()
+        self._pinned: dict[int, float] = {}  # uid -> monotonic deadline
+
+    def pin(self, uid: int) -> None:
+        """Read `uid`'s data from the primary for the next lag window."""
+        if not self.replicas:
+            return
+        now = time.monotonic()
+        if len(self._pinned) > 10000:
+            self._pinned = {u: t for u, t in self._pinned.items() if t > now}
+        self._pinned[uid] = now + _window()
+
+    def pick(
+        self, token: int | None = None, uid: int | None = None
+    ) -> tuple[Replica | None, async_sessionmaker]:
+        """(replica or None, sessionmaker) for one read-only unit of work."""
+        if not self.replicas:
+            return None, self.primary
+        if uid is not None and self._pinned.get(uid, 0) > time.monotonic():
+            reason = "pinned"
+        else:
+            healthy = [r for r in self.replicas if r.healthy]
+            fresh = [r for r in healthy if token is None or r.position >= token]
+            if fresh:
+                r = fresh[next(self._next) % len(fresh)]
+                db_reads.inc(target="replica", reason="ok")
+                return r, r.sessions
+            reason = "behind_token" if healthy else "no_healthy_replica"
+        db_reads.inc(target="primary", reason=reason)
+        return None, self.primary
+
+    def mark_down(self, replica: Replica, err: str) -> None:
+        if replica.healthy:
+            logger.warning("replica_down", replica=replica.name, err=err)
+        replica.healthy = False
+        db_replica_healthy.set(0, replica=replica.name)
+
+    async def _probe(self, replica: Replica) -> None:
+        started_ms = int(time.time() * 1000)
+        try:
+            async with replica.sessions() as db:
+                if self.uses_lsn:
+                    row = (await db.execute(_PG_REPLAY)).one()
+                    if row.lsn is None:
+                        raise RuntimeError("not a standby")
+                    position, lag = _lsn(row.lsn), float(row.lag)
+                else:
+                    # nothing to observe: assume the worst lag we accept
+                    await db.execute(text("SELECT 1"))
+                    lag = 0.0
+                    position = started_ms - int(settings.replica_max_lag_seconds * 1000)
+        except Exception as e:
+            self.mark_down(replica, str(e) or e.__class__.__name__)
+            return
+        db_replica_lag.set(lag, replica=replica.name)
+        if lag > settings.replica_max_lag_seconds:
+            self.mark_down(replica, f"lag {lag:.1f}s")
+            return
+        replica.position = position
+        if not replica.healthy:
+            logger.info("replica_up", replica=replica.name, lag=lag)
+        replica.healthy = True
+        db_replica_healthy.set(1, replica=replica.name)
+
+    async def check(self) -> None:
+        """Health-check every replica once."""
+        timeout = settings.replica_check_seconds
+
+        async def one(r: Replica):
+            try:
+                await asyncio.wait_for(self._probe(r), timeout)
+            except asyncio.TimeoutError:
+                self.mark_down(r, "health check timed out")
+
+        await asyncio.gather(*(one(r) for r in self.replicas))
+
+    async def run_health_checks(self) -> None:
+        while True:
+            try:
+                await self.check()
+            except Exception:
+                logger.exception("replica_check_error")
+            await asyncio.sleep(settings.replica_check_seconds)
+
+    async def remember_write(self, db: AsyncSession, resp: Response) -> None:
+        """Call after commit: later reads in this session see the write."""
+        if not self.replicas:
+            return
+        if self.uses_lsn:
+            token = _lsn(await db.scalar(text("SELECT pg_current_wal_lsn()::text")))
+        else:
+            token = int(time.time() * 1000)
+        resp.set_cookie(
+            READ_TOKEN_COOKIE,
+            str(token),
+            max_age=math.ceil(_window()),
+            httponly=True,
+            secure=SECURE_COOKIES,
+            samesite=SAMESITE,
+            path="/",
+        )
+
+
+def _replicas_from_settings() -> list[Replica]:
+    out = []
+    for i, url in enumerate(
+        u.strip() for u in settings.database_replica_urls.split(",")
+    ):
+        if url:
+            u = make_url(url)
+            name = f"{u.host}:{u.port}" if u.port else u.host or f"replica{i}"
+            out.append(Replica(name, make_sessionmaker(make_async_engine(url))))
+    return out
+
+
+read_router = ReadRouter(AsyncSessionLocal, _replicas_from_settings())
+# any write to a user's payouts invalidates their cache entries, on every worker
+payout_cache.on_invalidate.append(read_router.pin)
+
+
+def get_read_router() -> ReadRouter:
+    return read_router
+
+
+def _pick(request: Request, router: ReadRouter):
+    try:
+        token = int(request.cookies.get(READ_TOKEN_COOKIE, ""))
+    except ValueError:
+        token = None
+    return router.pick(token, getattr(request.state, "user_id", None))
+
+
+@asynccontextmanager
+async def _read_session(request: Request, router: ReadRouter):
+    replica, sessions = _pick(request, router)
+    async with sessions() as db:
+        try:
+            yield db
+        except (OperationalError, InterfaceError) as e:
+            if replica is not None:
+                router.mark_down(replica, str(e.orig or e))
+            raise
+
+
+async def get_read_db(request: Request, router: ReadRouter = Depends(get_read_router)):
+    async with _read_session(request, router) as db:
+        yield db
+
+
+def get_lazy_read_db(request: Request, router: ReadRouter = Depends(get_read_router)):
+    """`async with open_read() as db`: picks the replica when the read happens.
+
+    For cache loaders: the pick comes after the cache captured the user's
+    generation, so a write that pins the user in between can't leave replica
+    data cached under the new generation.
+    """
+    return lambda: _read_session(request, router)
+
+
+def get_read_session_factory(
+    request: Request, router: ReadRouter = Depends(get_read_router)
+):
+    # for streaming responses, which outlive a `get_read_db` session
+    return _pick(request, router)[1]
@@ -1,8 +1,11 @@
-from fastapi import APIRouter, Request, Response, HTTPException, Response
+from fastapi import APIRouter, Depends, Request, Response, HTTPException, Response
 from fastapi.responses import RedirectResponse
-import os, secrets, base64, hashlib, httpx
+import asyncio, os, secrets, base64, hashlib, httpx
+from app.clients import get_github_client
 from app.session import get_session, set_session
-from app.db import SessionLocal
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db import get_db
 from app.models import User
 from app.rate_limit import limiter, key_per_ip  # per-IP limits for auth endpoints
 
@@ -30,28 +33,29 @@ if os.getenv("ENV") == "test":
 
     @router.post("/test-login")
     @limiter.limit("60/minute", key_func=key_per_ip)
-    def test_login(
-        request: Request, response: Response, email: str = "test@example.com"
+    async def test_login(
+        request: Request,
+        response: Response,
+        email: str = "test@example.com",
+        db: AsyncSession = Depends(get_db),
     ):
-        with SessionLocal() as db:
-            u = db.query(User).filter(User.email == email).one_or_none()
-            if not u:
-                u = User(
-                    provider="github",
-                    provider_user_id=f"test-{email}",
-                    email=email,
-                    name="Test User",
-                )
-                db.add(u)
-                db.commit()
-                db.refresh(u)
+        u = await db.scalar(select(User).where(User.email == email))
+        if not u:
+            u = User(
+                provider="github",
+                provider_user_id=f"test-{email}",
+                email=email,
+                name="Test User",
+            )
+            db.add(u)
+            await db.commit()
         set_session(response, {"uid": u.id, "email": u.email})
         return {"ok": True}
 
 
 @router.get("/login")
 @limiter.limit("10/minute", key_func=key_per_ip)  # conservative per-IP
-def login(request: Request, response: Response):
+async def login(request: Request, response: Response):
     state = secrets.token_urlsafe(16)
     ver, chal = _code_verifier()
     sess = get_session(request) or {}
@@ -67,60 +71,67 @@ def login(request: Request, response: Response):
 
 @router.get("/callback")
 @limiter.limit("10/minute", key_func=key_per_ip)  # conservative per-IP
-async def callback(request: Request, response: Response, code: str, state: str):
+async def callback(
+    request: Request,
+    response: Response,
+    code: str,
+    state: str,
+    x: httpx.AsyncClient = Depends(get_github_client),
+    db: AsyncSession = Depends(get_db),
+):
     sess = get_session(request) or {}
     if state != sess.get("oauth_state"):
         raise HTTPException(400, "bad state")
     ver = sess.get("pkce_verifier") or ""
 
-    async with httpx.AsyncClient(headers={"Accept": "application/json"}) as x:
-        tk = (
-            await x.post(
-                TOKEN,
-                data={
-                    "client_id": CID,
-                    "client_secret": CSEC,
-                    "code": code,
-                    "redirect_uri": REDIR,
-                    "grant_type": "authorization_code",
-                    "code_verifier": ver,
-                },
-            )
-        ).json()
-        access = tk.get("access_token")
-        if not access:
-            raise HTTPException(401, f"oauth failed: {tk}")
-
-        auth_headers = {
-            "Authorization": f"Bearer {access}",
-            "Accept": "application/vnd.github+json",
-        }
-        me = (await x.get(ME, headers=auth_headers)).json()
-        emails = (await x.get(EMAILS, headers=auth_headers)).json()
-        email = next(
-            (e["email"] for e in emails if e.get("primary")),
-            (emails[0]["email"] if emails else None),
+    tk = (
+        await x.post(
+            TOKEN,
+            data={
+                "client_id": CID,
+                "client_secret": CSEC,
+                "code": code,
+                "redirect_uri": REDIR,
+                "grant_type": "authorization_code",
+                "code_verifier": ver,
+            },
         )
+    ).json()
+    access = tk.get("access_token")
+    if not access:
+        raise HTTPException(401, f"oauth failed: {tk}")
+
+    auth_headers = {
+        "Authorization": f"Bearer {access}",
+        "Accept": "application/vnd.github+json",
+    }
+    # independent lookups: run them side by side on the pooled client
+    me_r, emails_r = await asyncio.gather(
+        x.get(ME, headers=auth_headers), x.get(EMAILS, headers=auth_headers)
+    )
+    me, emails = me_r.json(), emails_r.json()
+    email = next(
+        (e["email"] for e in emails if e.get("primary")),
+        (emails[0]["email"] if emails else None),
+    )
 
-    with SessionLocal() as db:
-        u = (
-            db.query(User)
-            .filter(User.provider == "github", User.provider_user_id == str(me["id"]))
-            .one_or_none()
+    u = await db.scalar(
+        select(User).where(
+            User.provider == "github", User.provider_user_id == str(me["id"])
         )
-        if not u:
-            u = User(
-                provider="github",
-                provider_user_id=str(me["id"]),
-                email=email or me.get("email"),
-                name=me.get("name"),
-            )
-            db.add(u)
-        else:
-            u.email = email or u.email
-            u.name = me.get("name") or u.name
-        db.commit()
-        db.refresh(u)
+    )
+    if not u:
+        u = User(
+            provider="github",
+            provider_user_id=str(me["id"]),
+            email=email or me.get("email"),
+            name=me.get("name"),
+        )
+        db.add(u)
+    else:
+        u.email = email or u.email
+        u.name = me.get("name") or u.name
+    await db.commit()
 
     resp = RedirectResponse(url=FRONTEND_URL)
     set_session(resp, {"uid": u.id, "email": u.email})
@@ -131,7 +142,7 @@ async def callback(request: Request, response: Response, code: str, state: str):
 @limiter.limit(
     "120/minute"
 )  # per-user if session dep set on routes using it; /me can be hit often
-def me(request: Request, response: Response):
+async def me(request: Request, response: Response):
     sess = get_session(request)
     if not sess:
         raise HTTPException(401, "not authenticated")
@@ -140,6 +151,6 @@ def me(request: Request, response: Response):
 
 @router.post("/logout")
 @limiter.limit("60/minute")
-def logout(request: Request, response: Response):
+async def logout(request: Request, response: Response):
     response.delete_cookie("session", path="/")
     return {"ok": True}
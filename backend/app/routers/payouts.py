@@ -1,20 +1,41 @@
 from fastapi import APIRouter, Depends, Request, Response, HTTPException, Header, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update
 from sqlalchemy.dialects.postgresql import insert
-from decimal import Decimal
-import os, time, random, httpx
-from sqlalchemy.exc import IntegrityError
+from datetime import datetime, timezone
+from uuid import uuid4
+import base64, csv, io
+import orjson
 
-from app.db import get_db
+from app import events, idempotency, money, stats
+from app.cache import payout_cache
+from app.config import settings
+from app.db import get_db, utcnow
+from app.replicas import (
+    ReadRouter,
+    get_lazy_read_db,
+    get_read_db,
+    get_read_router,
+    get_read_session_factory,
+)
 from app.session import current_user_id, set_user_on_request
-from app.models import Payout, IdempotencyKey
+from app.models import Payout, IdempotencyKey, PayoutDispatch, User
 from app.logging import logger
-from app.schemas import CreatePayoutRequest, PayoutOut, Page
-from app.rate_limit import limiter
+from app.schemas import (
+    BatchItemResult,
+    BatchPayoutItem,
+    CreatePayoutRequest,
+    Page,
+    PayoutBatchOut,
+    PayoutBatchRequest,
+    PayoutOut,
+    PayoutSummary,
+)
+from app.rate_limit import limiter, key_per_user_export
 
 router = APIRouter(prefix="/payouts", tags=["payouts"])
-MOCK_URL = os.getenv("MOCK_URL", "http://localhost:8081/payouts")
 
 
 @router.post(
@@ -23,140 +44,528 @@ MOCK_URL = os.getenv("MOCK_URL", "http://localhost:8081/payouts")
     dependencies=[Depends(set_user_on_request)],
 )
 @limiter.limit("5/minute")
-def create_payout(
+async def create_payout(
     body: CreatePayoutRequest,
     request: Request,
     response: Response,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
+    reads: ReadRouter = Depends(get_read_router),
     idemp: str | None = Header(default=None, alias="Idempotency-Key"),
 ):
     uid = current_user_id(request)
     if not idemp:
         raise HTTPException(400, detail="Idempotency-Key header required")
 
-    # Try to claim the idempotency key FIRST (no payout yet).
-    # If we win (rowcount==1), we own the key for this window.
-    # If we lose (rowcount==0), someone else already claimed it.
-    stmt = (
-        insert(IdempotencyKey)
-        .values(key=idemp, user_id=uid, payout_id=None)
-        .on_conflict_do_nothing(index_elements=[IdempotencyKey.key])
-    )
-    res = db.execute(stmt)
-    db.flush()
-
-    if res.rowcount == 0:
+    # Claim the idempotency key FIRST (no payout yet), committed on its own.
+    # If we win, we own the key; otherwise someone else already claimed it.
+    if not await idempotency.claim(db, [idemp], uid):
         # Another request already claimed this key.
         # If its payout_id is set, return that payout.
-        # If not yet set, briefly wait for the winner to finish.
-        deadline = time.time() + 3.0  # wait up to 3s
-        while time.time() < deadline:
-            existing = db.get(IdempotencyKey, idemp)
-            if existing and existing.payout_id:
-                payout = db.get(Payout, existing.payout_id)
-                return PayoutOut(
-                    id=payout.id,
-                    amount=str(payout.amount),
-                    currency=payout.currency,
-                    status=payout.status,
-                )
-            time.sleep(0.05)
+        # If not yet set, wait to be notified when the winner commits.
+        payout_id = await idempotency.wait_for_payout(db, idemp)
+        if payout_id:
+            row = (
+                await db.execute(select(*PAYOUT_COLUMNS).where(Payout.id == payout_id))
+            ).one()
+            return ORJSONResponse(_payout(row))
         # Still no payout_id; report "processing" (client can retry).
         raise HTTPException(409, detail="Idempotency key currently processing")
 
-    # Create payout
-    p = Payout(
-        user_id=uid,
-        amount=str(body.amount),
-        currency=body.currency,
-        status="processing",
-    )
-    db.add(p)
-    db.flush()
+    try:
+        # Create payout plus its outbox row; app/dispatch.py submits it to the provider
+        p = Payout(
+            user_id=uid,
+            amount_minor=body.amount_minor,
+            currency=body.currency,
+            status="processing",
+        )
+        db.add(p)
+        await db.flush()
+        await stats.apply(
+            db, stats.Delta().add(uid, body.currency, "processing", body.amount_minor)
+        )
+        await db.execute(
+            update(User)
+            .where(User.id == uid)
+            .values(payout_count=User.payout_count + 1)
+        )
+        db.add(
+            PayoutDispatch(
+                payout_id=p.id,
+                next_attempt_at=utcnow(),
+                correlation_id=request.state.request_id,
+            )
+        )
 
-    # Back-fill payout_id on the key and commit
-    db.query(IdempotencyKey).filter(IdempotencyKey.key == idemp).update(
-        {"payout_id": p.id}
-    )
-    db.commit()
+        # Back-fill payout_id on the key and commit
+        filled = await idempotency.fill(db, [(idemp, p.id)])
+        if filled:
+            await db.commit()
+    except Exception:
+        await idempotency.release(db, [idemp])
+        raise
+    if not filled:
+        # our claim went stale and a retry took it over; its payout wins
+        await db.rollback()
+        raise HTTPException(409, detail="Idempotency key currently processing")
+    idempotency.waiters.resolve(idemp, p.id)
+    await payout_cache.invalidate(uid)
     logger.info("payout_created", payout_id=p.id, uid=uid)
 
-    if os.getenv("ENV") == "test":
-        return PayoutOut(
-            id=p.id, amount=str(p.amount), currency=p.currency, status=p.status
-        )
+    resp = ORJSONResponse(_payout(p))
+    await reads.remember_write(db, resp)
+    return resp
 
-    # Call mock provider with retries (bounded exponential + jitter)
-    attempts = 0
-    while attempts < 4:
-        attempts += 1
+
+# PayoutOut's columns. Handlers read them as plain rows and build the JSON
+# body themselves; returning a Response skips FastAPI's response_model
+# validation and stdlib encoding (response_model still documents the shape).
+PAYOUT_COLUMNS = (Payout.id, Payout.amount_minor, Payout.currency, Payout.status)
+
+
+def _payout(r) -> dict:
+    """PayoutOut's wire format, from a row or an entity."""
+    return {
+        "id": r.id,
+        "amount": money.to_str(r.amount_minor, r.currency),
+        "currency": r.currency,
+        "status": r.status,
+    }
+
+
+@router.post(
+    "/batch",
+    response_model=PayoutBatchOut,
+    dependencies=[Depends(set_user_on_request)],
+)
+@limiter.limit("10/minute")
+async def create_payout_batch(
+    body: PayoutBatchRequest,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
+    reads: ReadRouter = Depends(get_read_router),
+):
+    """Create many payouts in one transaction, each with its own idempotency key."""
+    uid = current_user_id(request)
+    if len(body.items) > settings.payout_batch_max:
+        raise HTTPException(413, detail="batch too large")
+
+    # one validation pass; the first item wins for a key repeated in the batch
+    parsed: list[tuple[str | None, BatchPayoutItem | None, str | None]] = []
+    items: dict[str, BatchPayoutItem] = {}
+    for raw in body.items:
         try:
-            headers = {"x-correlation-id": request.headers.get("x-correlation-id", "")}
-            payload = {
-                "amount": str(body.amount),
-                "currency": body.currency,
-                "reference": f"payout_{p.id}",
-            }
-            r = httpx.post(MOCK_URL, json=payload, headers=headers, timeout=5)
-            if r.status_code == 200:
-                ref = r.json().get("reference")
-                if ref:
-                    p.provider_ref = ref
-                    db.commit()
-                    logger.info(
-                        "payout_provider_ref_set", payout_id=p.id, provider_ref=ref
-                    )
-                break
-            if r.status_code in (429, 500):
-                _sleep_backoff(attempts)
-                continue
-            r.raise_for_status()
-        except Exception as e:
-            logger.info("payout_provider_call_error", err=str(e), attempt=attempts)
-            _sleep_backoff(attempts)
+            item = BatchPayoutItem.model_validate(raw)
+        except ValidationError as e:
+            key = raw.get("idempotency_key")
+            parsed.append((key if isinstance(key, str) else None, None, _msg(e)))
             continue
+        parsed.append((item.idempotency_key, item, None))
+        items.setdefault(item.idempotency_key, item)
+
+    batch_id = uuid4().hex
+    claimed: list[str] = []
+    if items:
+        claimed = await idempotency.claim(db, list(items), uid)
+
+    # keys claimed earlier (by a previous batch or a single POST /payouts)
+    existing = {}
+    claimed_set = set(claimed)
+    taken = [k for k in items if k not in claimed_set]
+    if taken:
+        existing = {
+            r.key: r
+            for r in await db.execute(
+                select(IdempotencyKey.key, IdempotencyKey.user_id, *PAYOUT_COLUMNS)
+                .outerjoin(Payout, Payout.id == IdempotencyKey.payout_id)
+                .where(IdempotencyKey.key.in_(taken))
+            )
+        }
+
+    created: dict[str, dict] = {}
+    filled = True
+    try:
+        if claimed:
+            new = [items[k] for k in claimed]
+            ids = (
+                await db.scalars(
+                    insert(Payout).returning(Payout.id, sort_by_parameter_order=True),
+                    [
+                        {
+                            "user_id": uid,
+                            "amount_minor": it.amount_minor,
+                            "currency": it.currency,
+                            "status": "processing",
+                            "batch_id": batch_id,
+                        }
+                        for it in new
+                    ],
+                )
+            ).all()
+            now = utcnow()
+            await db.execute(
+                insert(PayoutDispatch),
+                [
+                    {
+                        "payout_id": pid,
+                        "next_attempt_at": now,
+                        "correlation_id": request.state.request_id,
+                    }
+                    for pid in ids
+                ],
+            )
+            await db.execute(
+                update(User)
+                .where(User.id == uid)
+                .values(payout_count=User.payout_count + len(ids))
+            )
+            delta = stats.Delta()
+            for it in new:
+                delta.add(uid, it.currency, "processing", it.amount_minor)
+            await stats.apply(db, delta)
+            filled = await idempotency.fill(db, list(zip(claimed, ids)))
+            for it, pid in zip(new, ids):
+                created[it.idempotency_key] = {
+                    "id": pid,
+                    "amount": money.to_str(it.amount_minor, it.currency),
+                    "currency": it.currency,
+                    "status": "processing",
+                }
+        if filled:
+            await db.commit()
+    except Exception:
+        await idempotency.release(db, claimed)
+        raise
+    if not filled:
+        # a claim went stale and a retry took it over
+        await db.rollback()
+        raise HTTPException(409, detail="Idempotency key currently processing")
+    for k, p in created.items():
+        idempotency.waiters.resolve(k, p["id"])
+    if created:
+        await payout_cache.invalidate(uid)
+    logger.info(
+        "payout_batch_created",
+        batch_id=batch_id,
+        uid=uid,
+        items=len(body.items),
+        created=len(created),
+    )
+
+    results, seen = [], set()
+    for i, (key, item, err) in enumerate(parsed):
+        if item is None:
+            res = BatchItemResult(
+                index=i, idempotency_key=key, status="invalid", error=err
+            )
+        elif key in created:
+            first = key not in seen
+            res = BatchItemResult(
+                index=i,
+                idempotency_key=key,
+                status="created" if first else "duplicate",
+                payout=created[key],
+            )
+        else:
+            row = existing.get(key)
+            if row is None or row.user_id != uid:
+                # claimed by another user, or vanished between the two statements
+                res = BatchItemResult(
+                    index=i,
+                    idempotency_key=key,
+                    status="conflict",
+                    error="idempotency key already used",
+                )
+            elif row.id is None:
+                res = BatchItemResult(index=i, idempotency_key=key, status="processing")
+            else:
+                res = BatchItemResult(
+                    index=i,
+                    idempotency_key=key,
+                    status="duplicate",
+                    payout=_payout(row),
+                )
+        seen.add(key)
+        results.append(res)
+    out = PayoutBatchOut(batch_id=batch_id, created=len(created), items=results)
+    resp = ORJSONResponse(out.model_dump(mode="json"))
+    if created:
+        await reads.remember_write(db, resp)
+    return resp
+
+
+def _msg(e: ValidationError) -> str:
+    err = e.errors()[0]
+    loc = ".".join(str(x) for x in err["loc"])
+    return f"{loc}: {err['msg']}" if loc else err["msg"]
+
 
-    return PayoutOut(
-        id=p.id, amount=str(p.amount), currency=p.currency, status=p.status
+@router.get(
+    "/summary",
+    response_model=PayoutSummary,
+    dependencies=[Depends(set_user_on_request)],
+)
+@limiter.limit("60/minute")
+async def payout_summary(
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_read_db),
+):
+    """Count and total per (currency, status), read from payout_stats."""
+    uid = current_user_id(request)
+    rows = await stats.summary(db, uid)
+    return ORJSONResponse(
+        {
+            "items": [
+                {
+                    "currency": r.currency,
+                    "status": r.status,
+                    "count": r.count,
+                    "total": money.to_str(r.total_minor, r.currency),
+                }
+                for r in rows
+            ]
+        }
     )
 
 
+@router.get(
+    "/events",
+    dependencies=[Depends(set_user_on_request)],
+)
+@limiter.limit("30/minute")  # reconnects
+async def payout_events(request: Request, response: Response):
+    """Server-Sent Events: one `payout` event per status change of your payouts."""
+    uid = current_user_id(request)
+    full = events.hub.room_for(uid)
+    if full == "worker":
+        raise HTTPException(503, detail="too many event streams")
+    if full == "user":
+        raise HTTPException(429, detail="too many event streams for this user")
+    # no await since room_for: nothing else can take the slot in between
+    sub = events.hub.subscribe(uid)
+    return StreamingResponse(
+        events.hub.stream(uid, sub),
+        media_type="text/event-stream",
+        headers={"cache-control": "no-cache", "x-accel-buffering": "no"},
+    )
+
+
+def _encode_cursor(direction: str, anchor: int) -> str:
+    return base64.urlsafe_b64encode(f"{direction}:{anchor}".encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> tuple[str, int]:
+    try:
+        direction, anchor = (
+            base64.urlsafe_b64decode(cursor.encode()).decode().split(":")
+        )
+        if direction not in ("after", "before"):
+            raise ValueError(direction)
+        return direction, int(anchor)
+    except Exception:
+        raise HTTPException(400, detail="invalid cursor")
+
+
 @router.get(
     "",
     response_model=Page[PayoutOut],
     dependencies=[Depends(set_user_on_request)],
 )
 @limiter.limit("60/minute")  # per-user
-def list_payouts(
+async def list_payouts(
     request: Request,
     response: Response,
-    db: Session = Depends(get_db),
+    open_read=Depends(get_lazy_read_db),
     page: int = Query(1, ge=1),
     limit: int = Query(20, ge=1, le=100),
+    cursor: str | None = Query(None, description="next_cursor/prev_cursor of a page"),
 ):
     uid = current_user_id(request)
-    base = db.query(Payout).filter(Payout.user_id == uid)
-    total = db.query(func.count()).select_from(base.subquery()).scalar()
-    items = (
-        base.order_by(Payout.id.desc()).offset((page - 1) * limit).limit(limit).all()
-    )
+    key = f"list:{limit}:{cursor or page}"
+
+    async def load() -> dict:
+        async with open_read() as db:
+            return await _load_page(db, uid, page, limit, cursor)
+
+    return ORJSONResponse(await payout_cache.get_or_load(uid, key, load))
+
+
+async def _load_page(
+    db: AsyncSession, uid: int, page: int, limit: int, cursor: str | None
+) -> dict:
+    total = await db.scalar(select(User.payout_count).where(User.id == uid))
+    base = select(*PAYOUT_COLUMNS).where(Payout.user_id == uid)
 
-    return Page[PayoutOut](
-        page=page,
-        limit=limit,
-        total=int(total or 0),
-        items=[
-            PayoutOut(
-                id=i.id,
-                amount=str(i.amount),
-                currency=i.currency,
-                status=i.status,
+    # fetch one extra row to learn whether there is another page that way
+    if cursor is None:
+        rows = (
+            await db.execute(
+                base.order_by(Payout.id.desc())
+                .offset((page - 1) * limit)
+                .limit(limit + 1)
             )
-            for i in items
-        ],
+        ).all()
+        more_older, more_newer = len(rows) > limit, page > 1
+        items = rows[:limit]
+    else:
+        direction, anchor = _decode_cursor(cursor)
+        if direction == "after":
+            rows = (
+                await db.execute(
+                    base.where(Payout.id < anchor)
+                    .order_by(Payout.id.desc())
+                    .limit(limit + 1)
+                )
+            ).all()
+            more_older, more_newer = len(rows) > limit, True
+            items = rows[:limit]
+        else:
+            rows = (
+                await db.execute(
+                    base.where(Payout.id > anchor)
+                    .order_by(Payout.id.asc())
+                    .limit(limit + 1)
+                )
+            ).all()
+            more_older, more_newer = True, len(rows) > limit
+            items = rows[:limit][::-1]
+
+    return {
+        "page": page if cursor is None else None,
+        "limit": limit,
+        "total": total,
+        "items": [_payout(i) for i in items],
+        "next_cursor": (
+            _encode_cursor("after", items[-1].id) if items and more_older else None
+        ),
+        "prev_cursor": (
+            _encode_cursor("before", items[0].id) if items and more_newer else None
+        ),
+    }
+
+
+@router.get(
+    "/{payout_id:int}",
+    response_model=PayoutOut,
+    dependencies=[Depends(set_user_on_request)],
+)
+@limiter.limit("120/minute")  # status polling
+async def get_payout(
+    payout_id: int,
+    request: Request,
+    response: Response,
+    open_read=Depends(get_lazy_read_db),
+):
+    uid = current_user_id(request)
+
+    async def load() -> dict:
+        async with open_read() as db:
+            row = (
+                await db.execute(
+                    select(*PAYOUT_COLUMNS).where(
+                        Payout.id == payout_id, Payout.user_id == uid
+                    )
+                )
+            ).first()
+        if row is None:
+            raise HTTPException(404, detail="payout not found")
+        return _payout(row)
+
+    return ORJSONResponse(
+        await payout_cache.get_or_load(uid, f"payout:{payout_id}", load)
+    )
+
+
+EXPORT_COLUMNS = (
+    Payout.id,
+    Payout.amount_minor,
+    Payout.currency,
+    Payout.status,
+    Payout.provider_ref,
+    Payout.created_at,
+)
+EXPORT_HEADER = ["id", "amount", "currency", "status", "provider_ref", "created_at"]
+
+
+def _naive_utc(dt: datetime) -> datetime:
+    # created_at is naive UTC
+    return dt.astimezone(timezone.utc).replace(tzinfo=None) if dt.tzinfo else dt
+
+
+def _ndjson(rows) -> bytes:
+    return b"".join(
+        orjson.dumps(
+            {
+                "id": r.id,
+                "amount": money.to_str(r.amount_minor, r.currency),
+                "currency": r.currency,
+                "status": r.status,
+                "provider_ref": r.provider_ref,
+                "created_at": r.created_at,
+            }
+        )
+        + b"\n"
+        for r in rows
     )
 
 
-def _sleep_backoff(attempt: int):
-    base = min(5.0, 0.5 * (2**attempt))
-    time.sleep(base + random.random() * 0.25)
+def _csv(rows) -> bytes:
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    for r in rows:
+        w.writerow(
+            [
+                r.id,
+                money.to_str(r.amount_minor, r.currency),
+                r.currency,
+                r.status,
+                r.provider_ref or "",
+                r.created_at.isoformat() if r.created_at else "",
+            ]
+        )
+    return buf.getvalue().encode()
+
+
+async def _stream_export(sessions, stmt, fmt: str):
+    """Yield one encoded chunk per `export_chunk_rows` rows of a server-side cursor."""
+    render = _csv if fmt == "csv" else _ndjson
+    if fmt == "csv":
+        yield (",".join(EXPORT_HEADER) + "\r\n").encode()
+    async with sessions() as db:
+        result = await db.stream(
+            stmt.execution_options(yield_per=settings.export_chunk_rows)
+        )
+        async for rows in result.partitions():
+            yield render(rows)
+
+
+@router.get(
+    "/export",
+    dependencies=[Depends(set_user_on_request)],
+)
+@limiter.limit("10/minute", key_func=key_per_user_export)
+async def export_payouts(
+    request: Request,
+    response: Response,
+    sessions=Depends(get_read_session_factory),
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    status: list[str] | None = Query(None),
+    since: datetime | None = Query(None, description="created_at >= since"),
+    until: datetime | None = Query(None, description="created_at < until"),
+):
+    uid = current_user_id(request)
+    stmt = select(*EXPORT_COLUMNS).where(Payout.user_id == uid).order_by(Payout.id)
+    if status:
+        stmt = stmt.where(Payout.status.in_(status))
+    if since:
+        stmt = stmt.where(Payout.created_at >= _naive_utc(since))
+    if until:
+        stmt = stmt.where(Payout.created_at < _naive_utc(until))
+    media = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        _stream_export(sessions, stmt, format),
+        media_type=media,
+        headers={"content-disposition": f'attachment; filename="payouts.{format}"'},
+    )
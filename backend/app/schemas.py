@@ -1,12 +1,10 @@
 from typing import Generic, List, Optional, TypeVar
-from pydantic import BaseModel, Field, field_validator
-from decimal import Decimal, ROUND_HALF_UP
-
-CURRENCY_WHITELIST = {"USD", "EUR", "GBP"}
+from pydantic import BaseModel, Field, field_validator, model_validator
+from decimal import Decimal, InvalidOperation
 
+from app import money
 
-def _quantize_money(x: Decimal) -> Decimal:
-    return x.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+CURRENCY_WHITELIST = {"USD", "EUR", "GBP"}
 
 
 class ErrorBody(BaseModel):
@@ -27,9 +25,22 @@ class CreatePayoutRequest(BaseModel):
             raise ValueError(f"unsupported currency: {v}")
         return v
 
-    @field_validator("amount")
-    def amount_must_be_quantized(cls, v: Decimal) -> Decimal:
-        return _quantize_money(v)
+    @model_validator(mode="after")
+    def amount_must_be_quantized(self):
+        # to the currency's minor unit, so amount_minor is exact
+        try:
+            self.amount = money.quantize(self.amount, self.currency)
+        except InvalidOperation:  # more digits than the context allows
+            raise ValueError("amount too large")
+        if self.amount >= money.MAX_MAJOR or self.amount_minor > money.MAX_MINOR:
+            raise ValueError("amount too large")
+        if self.amount_minor <= 0:
+            raise ValueError("amount is less than one minor unit")
+        return self
+
+    @property
+    def amount_minor(self) -> int:
+        return money.to_minor(self.amount, self.currency)
 
 
 class PayoutOut(BaseModel):
@@ -39,11 +50,47 @@ class PayoutOut(BaseModel):
     status: str
 
 
+class BatchPayoutItem(CreatePayoutRequest):
+    idempotency_key: str = Field(..., min_length=1, max_length=128)
+
+
+class PayoutBatchRequest(BaseModel):
+    # validated per item so one bad row doesn't reject the whole batch
+    items: List[dict]
+
+
+class BatchItemResult(BaseModel):
+    index: int
+    idempotency_key: Optional[str] = None
+    status: str  # created|duplicate|processing|conflict|invalid
+    payout: Optional[PayoutOut] = None
+    error: Optional[str] = None
+
+
+class PayoutBatchOut(BaseModel):
+    batch_id: str
+    created: int
+    items: List[BatchItemResult]
+
+
+class PayoutSummaryItem(BaseModel):
+    currency: str
+    status: str
+    count: int
+    total: str
+
+
+class PayoutSummary(BaseModel):
+    items: List[PayoutSummaryItem]
+
+
 T = TypeVar("T")
 
 
 class Page(BaseModel, Generic[T]):
-    page: int
+    page: Optional[int] = None  # None in cursor mode
     limit: int
-    total: int
+    total: Optional[int] = None
     items: List[T]
+    next_cursor: Optional[str] = None  # older items
+    prev_cursor: Optional[str] = None  # newer items
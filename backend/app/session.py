@@ -1,4 +1,5 @@
-import base64, hmac, hashlib, json, os
+import base64, hmac, hashlib, json, os, time
+from collections import OrderedDict
 from fastapi import APIRouter, Request, Response, HTTPException
 
 COOKIE_NAME = "session"
@@ -7,6 +8,10 @@ SESSION_SECRET = os.getenv("SESSION_SECRET", "devsecret").encode()
 SECURE_COOKIES = os.getenv("SECURE_COOKIES", "false").lower() == "true"
 SAMESITE = os.getenv("COOKIE_SAMESITE", "lax")
 
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "10000"))
+SESSION_CACHE_TTL = float(os.getenv("SESSION_CACHE_TTL_SECONDS", "300"))
+_UNSET = object()
+
 router = APIRouter(prefix="/auth", tags=["auth"])
 
 
@@ -19,10 +24,7 @@ def _b64ud(s: str) -> bytes:
     return base64.urlsafe_b64decode((s + pad).encode())
 
 
-def get_session(req: Request) -> dict | None:
-    raw = req.cookies.get(COOKIE_NAME)
-    if not raw:
-        return None
+def _verify(raw: str) -> dict | None:
     try:
         data, sig = raw.rsplit(".", 1)
         expect = hmac.new(SESSION_SECRET, data.encode(), hashlib.sha256).hexdigest()
@@ -33,6 +35,59 @@ def get_session(req: Request) -> dict | None:
         return None
 
 
+class SessionCache:
+    """
+    Bounded LRU + TTL cache of verified payloads keyed by the raw cookie value.
+    Only successful verifications are cached; rotating SESSION_SECRET clears it.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize, self.ttl = maxsize, ttl
+        self.hits = self.misses = 0
+        self._data: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._secret = SESSION_SECRET
+
+    def get(self, raw: str) -> dict | None:
+        if self._secret != SESSION_SECRET:
+            self.clear()
+            self._secret = SESSION_SECRET
+        entry = self._data.get(raw)
+        now = time.monotonic()
+        if entry and entry[0] > now:
+            self._data.move_to_end(raw)
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        payload = _verify(raw)
+        if payload is None:
+            self._data.pop(raw, None)
+            return None
+        self._data[raw] = (now + self.ttl, payload)
+        self._data.move_to_end(raw)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+        return payload
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+session_cache = SessionCache(SESSION_CACHE_SIZE, SESSION_CACHE_TTL)
+
+
+def get_session(req: Request) -> dict | None:
+    # parsed at most once per request, and at most once per TTL per cookie
+    sess = getattr(req.state, "session", _UNSET)
+    if sess is _UNSET:
+        raw = req.cookies.get(COOKIE_NAME)
+        sess = session_cache.get(raw) if raw else None
+        req.state.session = sess
+    return dict(sess) if sess is not None else None  # callers may mutate
+
+
 def set_session(resp: Response, payload: dict) -> None:
     data = _b64u(json.dumps(payload, separators=(",", ":")).encode())
     sig = hmac.new(SESSION_SECRET, data.encode(), hashlib.sha256).hexdigest()
@@ -0,0 +1,151 @@
+"""
+Per-user payout aggregates in `payout_stats`, keyed (user_id, currency, status).
+
+Writers call `apply` in the same transaction as the payout insert or status
+change, so the summary never drifts from `payouts`: an upsert adds to the new
+status and, for transitions, subtracts from the old one. `rebuild` recomputes
+the table from `payouts`, and `recount` does the same for `users.payout_count`
+(the `total` of GET /payouts), e.g. after payouts were written by a release
+that didn't maintain it:
+
+    cd backend && python -m app.stats rebuild [--user-id 42]
+    cd backend && python -m app.stats recount [--user-id 42]
+"""
+
+import argparse, asyncio
+from collections import defaultdict
+
+from sqlalchemy import delete, func, insert as sa_insert, select, text, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db import AsyncSessionLocal
+from app.models import Payout, PayoutStat, User
+
+
+class Delta:
+    """Accumulates (count, total) changes per (user_id, currency, status).
+
+    Amounts are int minor units, so totals are plain integer sums.
+    """
+
+    def __init__(self):
+        self._d: dict[tuple, list] = defaultdict(lambda: [0, 0])
+
+    def add(self, user_id: int, currency: str, status: str, amount: int, n: int = 1):
+        d = self._d[(user_id, currency, status)]
+        d[0] += n
+        d[1] += amount * n
+        return self
+
+    def move(self, user_id: int, currency: str, src: str, dst: str, amount: int):
+        self.add(user_id, currency, src, amount, -1)
+        return self.add(user_id, currency, dst, amount)
+
+    def rows(self) -> list[dict]:
+        # sorted so concurrent writers lock stat rows in the same order
+        return [
+            {"user_id": u, "currency": c, "status": s, "count": n, "total_minor": t}
+            for (u, c, s), (n, t) in sorted(self._d.items())
+            if n or t
+        ]
+
+
+async def apply(db: AsyncSession, delta: Delta) -> None:
+    rows = delta.rows()
+    if not rows:
+        return
+    stmt = insert(PayoutStat).values(rows)
+    await db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[PayoutStat.user_id, PayoutStat.currency, PayoutStat.status],
+            set_={
+                "count": PayoutStat.count + stmt.excluded.count,
+                "total_minor": PayoutStat.total_minor + stmt.excluded.total_minor,
+            },
+        )
+    )
+
+
+async def summary(db: AsyncSession, user_id: int) -> list:
+    return (
+        await db.execute(
+            select(
+                PayoutStat.currency,
+                PayoutStat.status,
+                PayoutStat.count,
+                PayoutStat.total_minor,
+            )
+            .where(PayoutStat.user_id == user_id, PayoutStat.count != 0)
+            .order_by(PayoutStat.currency, PayoutStat.status)
+        )
+    ).all()
+
+
+async def rebuild(session_factory=AsyncSessionLocal, user_id: int | None = None) -> int:
+    """Recompute stats from `payouts`; returns the number of stat rows written."""
+    agg = select(
+        Payout.user_id,
+        Payout.currency,
+        Payout.status,
+        func.count(),
+        # BIGINT sum: no numeric decoding or Decimal arithmetic
+        func.coalesce(func.sum(Payout.amount_minor), 0),
+    ).group_by(Payout.user_id, Payout.currency, Payout.status)
+    clear = delete(PayoutStat)
+    if user_id is not None:
+        agg = agg.where(Payout.user_id == user_id)
+        clear = clear.where(PayoutStat.user_id == user_id)
+    async with session_factory() as db:
+        if db.bind.dialect.name == "postgresql":
+            # waits for in-flight writers; their deltas land after the rebuild
+            await db.execute(text("LOCK TABLE payout_stats IN EXCLUSIVE MODE"))
+        await db.execute(clear)
+        n = (
+            await db.execute(
+                sa_insert(PayoutStat).from_select(
+                    ["user_id", "currency", "status", "count", "total_minor"], agg
+                )
+            )
+        ).rowcount
+        await db.commit()
+    return n
+
+
+async def recount(session_factory=AsyncSessionLocal, user_id: int | None = None) -> int:
+    """Recompute users.payout_count from `payouts`; returns the users corrected."""
+    n = (
+        select(func.count())
+        .select_from(Payout)
+        .where(Payout.user_id == User.id)
+        .scalar_subquery()
+    )
+    stmt = update(User).where(User.payout_count != n).values(payout_count=n)
+    if user_id is not None:
+        stmt = stmt.where(User.id == user_id)
+    async with session_factory() as db:
+        if db.bind.dialect.name == "postgresql":
+            # waits for in-flight creates; their increments land after the recount
+            await db.execute(text("LOCK TABLE users IN EXCLUSIVE MODE"))
+        fixed = (
+            await db.execute(stmt.execution_options(synchronize_session=False))
+        ).rowcount
+        await db.commit()
+    return fixed
+
+
+def main():
+    ap = argparse.ArgumentParser(prog="python -m app.stats")
+    ap.add_argument("command", choices=["rebuild", "recount"])
+    ap.add_argument("--user-id", type=int)
+    args = ap.parse_args()
+    if args.command == "recount":
+        n = asyncio.run(recount(user_id=args.user_id))
+        print(f"users.payout_count recounted: {n} users corrected")
+    else:
+        n = asyncio.run(rebuild(user_id=args.user_id))
+        print(f"payout_stats rebuilt: {n} rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,35 @@
+"""
+Provider webhooks. Handlers only verify the signature, record the event and
+queue it in webhook_inbox, then answer 200; app/inbox.py applies the status
+changes. The ack therefore costs two INSERTs however busy the payouts are.
+"""
+
 import hmac, hashlib, time, json
 from fastapi import APIRouter, Header, HTTPException, Depends, Request
-from sqlalchemy.orm import Session
+from sqlalchemy import case, update, values, column, String
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.config import settings
-from app.db import get_db
-from app.models import WebhookEvent, Payout
+from app import stats
+from app.db import get_db, utcnow
+from app.metrics import webhook_latency
+from app.models import Payout, WebhookEvent, WebhookInbox
 
 router = APIRouter(prefix="/webhooks", tags=["webhooks"])
 
+# processing -> paid|failed only, so replays and out-of-order deliveries
+# can never move a payout backwards
+TRANSITIONS = {"processing": {"paid", "failed"}}
+
+# what a status update returns: enough for payout_stats and the event stream
+MOVED = (
+    Payout.id,
+    Payout.user_id,
+    Payout.currency,
+    Payout.amount_minor,
+    Payout.status,
+)
+
 
 def verify(sig: str, ts: str, raw: bytes) -> None:
     if abs(time.time() - int(ts)) > 300:  # 5 minutes
@@ -18,24 +41,161 @@ def verify(sig: str, ts: str, raw: bytes) -> None:
         raise HTTPException(401, "bad signature")
 
 
+def _sources(status: str | None) -> list[str]:
+    """States a payout may move to `status` from (empty: event is a no-op)."""
+    return [src for src, dst in TRANSITIONS.items() if status in dst]
+
+
+async def _apply_stats(db: AsyncSession, moved) -> None:
+    """Move each updated payout between payout_stats rows."""
+    delta = stats.Delta()
+    for r in moved:
+        # every target state currently has exactly one source state
+        (src,) = _sources(r.status)
+        delta.move(r.user_id, r.currency, src, r.status, r.amount_minor)
+    await stats.apply(db, delta)
+
+
+def _check_event(ev: dict) -> None:
+    if not (ev.get("event_id") and ev.get("payout_ref")):
+        raise ValueError("event_id and payout_ref are required")
+    status = ev.get("status")
+    if status is not None and not isinstance(status, str):
+        raise ValueError("status must be a string")  # _sources() looks it up
+
+
+def _parse_event(raw: bytes) -> dict:
+    try:
+        ev = json.loads(raw)
+        _check_event(ev)
+    except (ValueError, TypeError, AttributeError):
+        raise HTTPException(400, "invalid event")
+    return ev
+
+
+async def enqueue(db: AsyncSession, events: list[tuple[dict, str]]) -> int:
+    """Record events (idempotent on event_id) and queue the new ones for app/inbox.py.
+
+    Returns how many were new. The caller commits.
+    """
+    new_ids = set(
+        (
+            await db.scalars(
+                insert(WebhookEvent)
+                .values([{"event_id": e["event_id"], "payload": r} for e, r in events])
+                .on_conflict_do_nothing(index_elements=[WebhookEvent.event_id])
+                .returning(WebhookEvent.event_id)
+            )
+        ).all()
+    )
+    now, queued, seen = utcnow(), [], set()
+    for e, r in events:
+        eid = e["event_id"]
+        if eid in new_ids and eid not in seen and _sources(e.get("status")):
+            queued.append(
+                {
+                    "event_id": eid,
+                    "payout_ref": e["payout_ref"],
+                    "payload": r,
+                    "next_attempt_at": now,
+                }
+            )
+        seen.add(eid)
+    if queued:
+        await db.execute(insert(WebhookInbox), queued)
+    return len(new_ids)
+
+
 @router.post("/payments")
 async def payments(
     req: Request,
     x_sig: str = Header(alias="x-sig"),
     x_ts: str = Header(alias="x-sig-ts"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     raw = await req.body()
     verify(x_sig, x_ts, raw)
-    body = json.loads(raw)
-    # idempotent on event_id
-    ev = db.query(WebhookEvent).filter_by(event_id=body["event_id"]).first()
-    if ev:
-        return {"ok": True}  # seen
-    db.add(WebhookEvent(event_id=body["event_id"], payload=json.dumps(body)))
-    # update payout by provider_ref
-    p = db.query(Payout).filter_by(provider_ref=body["payout_ref"]).first()
-    if p:
-        p.status = body.get("status", p.status)
-    db.commit()
+    start = time.perf_counter()
+    # store the signed bytes verbatim; applied by the inbox consumers
+    await enqueue(db, [(_parse_event(raw), raw.decode())])
+    await db.commit()
+    webhook_latency.observe(time.perf_counter() - start, endpoint="payments")
     return {"ok": True}
+
+
+def _parse_batch(raw: bytes, content_type: str) -> list[tuple[dict, str]]:
+    """Return (event, raw json) pairs from a JSON array or NDJSON body."""
+    try:
+        if "ndjson" in content_type:
+            lines = [ln for ln in raw.decode().splitlines() if ln.strip()]
+            events = [(json.loads(ln), ln) for ln in lines]
+        else:
+            events = [(ev, json.dumps(ev)) for ev in json.loads(raw)]
+        for ev, _ in events:
+            _check_event(ev)
+    except (ValueError, TypeError, AttributeError):
+        raise HTTPException(400, "invalid batch")
+    if len(events) > settings.webhook_batch_max:
+        raise HTTPException(413, "batch too large")
+    return events
+
+
+async def apply_statuses(db: AsyncSession, statuses: dict[str, str]) -> list:
+    """Set payouts.status for many provider_refs in one statement.
+
+    Returns the MOVED rows it updated.
+    """
+    # every target shares the same source states, so one predicate covers all
+    sources = {src for st in statuses.values() for src in _sources(st)}
+    if db.bind.dialect.name == "postgresql":
+        v = values(column("ref", String), column("status", String), name="v").data(
+            list(statuses.items())
+        )
+        stmt = (
+            update(Payout)
+            .where(Payout.provider_ref == v.c.ref, Payout.status.in_(sources))
+            .values(status=v.c.status)
+        )
+    else:  # no UPDATE ... FROM (VALUES ...) on SQLite
+        stmt = (
+            update(Payout)
+            .where(Payout.provider_ref.in_(statuses), Payout.status.in_(sources))
+            .values(status=case(statuses, value=Payout.provider_ref))
+        )
+    stmt = stmt.returning(*MOVED)
+    moved = (await db.execute(stmt)).all()
+    await _apply_stats(db, moved)
+    return moved
+
+
+async def fail_payout(db: AsyncSession, payout_id: int) -> list:
+    """Move one payout to "failed" if TRANSITIONS allows it; returns MOVED rows."""
+    moved = (
+        await db.execute(
+            update(Payout)
+            .where(Payout.id == payout_id, Payout.status.in_(_sources("failed")))
+            .values(status="failed")
+            .returning(*MOVED)
+        )
+    ).all()
+    await _apply_stats(db, moved)
+    return moved
+
+
+@router.post("/payments/batch")
+async def payments_batch(
+    req: Request,
+    x_sig: str = Header(alias="x-sig"),
+    x_ts: str = Header(alias="x-sig-ts"),
+    db: AsyncSession = Depends(get_db),
+):
+    raw = await req.body()
+    verify(x_sig, x_ts, raw)  # one signature over the whole body
+    start = time.perf_counter()
+    events = _parse_batch(raw, req.headers.get("content-type", ""))
+    if not events:
+        return {"ok": True, "received": 0, "new": 0}
+    new = await enqueue(db, events)
+    await db.commit()
+    webhook_latency.observe(time.perf_counter() - start, endpoint="payments_batch")
+    return {"ok": True, "received": len(events), "new": new}
@@ -0,0 +1,187 @@
+"""
+Duplicate Idempotency-Key requests on POST /payouts: 50 ms polling vs wake-up.
+
+Fires N concurrent duplicates of one POST /payouts while the winning request
+is held for --delay ms between claiming the key and creating the payout, and
+reports database statements per duplicate and how long after the winner's
+commit the duplicates answer. "notify" is the endpoint as it is; "poll" swaps
+idempotency.wait_for_payout for the re-read-every-50-ms loop it replaced.
+Requests are driven straight through the ASGI interface (no client or
+socket), with rate limiting off.
+
+    cd backend && python -m bench.idempotency_waiters -n 200 --delay 250
+    python -m bench.idempotency_waiters --url postgresql+psycopg://...
+"""
+
+import argparse, asyncio, contextvars, json, os, statistics, tempfile, time
+
+os.environ.setdefault("ENV", "test")
+os.environ.setdefault("RATE_LIMIT_REDIS_URL", "memory://")
+os.environ.setdefault("LOG_SAMPLE", "/payouts=0")
+
+from fastapi import Response
+from sqlalchemy import event, insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app import idempotency, session
+from app.config import settings
+from app.db import Base, get_db
+from app.main import app
+from app.models import IdempotencyKey, User
+from app.rate_limit import limiter
+from app.replicas import ReadRouter, get_read_router
+
+_role = contextvars.ContextVar("role", default="setup")
+
+
+async def _poll(db, key, timeout=None):
+    # what create_payout did before: re-read the key every 50 ms
+    deadline = time.perf_counter() + (timeout or settings.idempotency_wait_seconds)
+    while time.perf_counter() < deadline:
+        payout_id = await db.scalar(
+            select(IdempotencyKey.payout_id).where(IdempotencyKey.key == key)
+        )
+        if payout_id:
+            return payout_id
+        await db.rollback()
+        await asyncio.sleep(0.05)
+    return None
+
+
+async def _post(key: str, cookie: bytes) -> int:
+    body = json.dumps({"amount": "10.00", "currency": "USD"}).encode()
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": "/payouts",
+        "raw_path": b"/payouts",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [
+            (b"host", b"bench"),
+            (b"cookie", cookie),
+            (b"content-type", b"application/json"),
+            (b"idempotency-key", key.encode()),
+        ],
+        "client": ("127.0.0.1", 50000),
+        "server": ("bench", 80),
+    }
+    status = None
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await asyncio.wait_for(app(scope, receive, send), 30)
+    return status
+
+
+async def run(url: str, strategy: str, n: int, delay: float) -> dict:
+    kw = {} if url.startswith("sqlite") else {"pool_size": n + 5}
+    engine = create_async_engine(url, **kw)
+    Session = async_sessionmaker(engine, expire_on_commit=False)
+    queries = {"setup": 0, "winner": 0, "duplicate": 0}
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def _count(*_):
+        queries[_role.get()] += 1
+
+    async def _get_db():
+        async with Session() as db:
+            yield db
+
+    router = ReadRouter(Session)
+    app.dependency_overrides[get_db] = _get_db
+    app.dependency_overrides[get_read_router] = lambda: router
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        uid = await conn.scalar(
+            insert(User)
+            .values(provider="bench", provider_user_id=f"u{time.time_ns()}")
+            .returning(User.id)
+        )
+    r = Response()
+    session.set_session(r, {"uid": uid})
+    cookie = r.headers["set-cookie"].split(";", 1)[0].encode()
+
+    # hold the winner between its claim and the payout
+    real_claim, real_resolve = idempotency.claim, idempotency.waiters.resolve
+    committed: list[float] = []
+
+    async def held_claim(db, keys, uid):
+        won = await real_claim(db, keys, uid)
+        if won:
+            await asyncio.sleep(delay)
+        return won
+
+    def resolve(key, payout_id):
+        # the winner calls this right after its commit
+        committed.append(time.perf_counter())
+        real_resolve(key, payout_id)
+
+    idempotency.claim, idempotency.waiters.resolve = held_claim, resolve
+    real_wait = idempotency.wait_for_payout
+    if strategy == "poll":
+        idempotency.wait_for_payout = _poll
+    listener = None
+    if not url.startswith("sqlite"):
+        listener = asyncio.create_task(idempotency.listen(url))
+    key = f"bench-{strategy}-{time.time_ns()}"
+    answered: list[float] = []
+
+    async def request(role: str) -> int:
+        _role.set(role)
+        status = await _post(key, cookie)
+        answered.append(time.perf_counter())
+        return status
+
+    try:
+        winner = asyncio.create_task(request("winner"))
+        await asyncio.sleep(min(delay / 2, 0.05))  # the winner has claimed
+        dups = [asyncio.create_task(request("duplicate")) for _ in range(n)]
+        statuses = await asyncio.gather(*dups)
+        await winner
+    finally:
+        idempotency.claim, idempotency.waiters.resolve = real_claim, real_resolve
+        idempotency.wait_for_payout = real_wait
+        if listener is not None:
+            listener.cancel()
+        app.dependency_overrides.pop(get_db)
+        app.dependency_overrides.pop(get_read_router)
+        await engine.dispose()
+
+    lat_ms = sorted((t - committed[0]) * 1000 for t in answered[-n:])
+    return {
+        "strategy": strategy,
+        "duplicates": n,
+        "winner_delay_ms": delay * 1000,
+        "ok": sum(1 for s in statuses if s == 200),
+        "queries_per_duplicate": round(queries["duplicate"] / n, 2),
+        "answer_ms_p50": round(statistics.median(lat_ms), 3),
+        "answer_ms_p99": round(lat_ms[int(len(lat_ms) * 0.99) - 1], 3),
+        "answer_ms_max": round(lat_ms[-1], 3),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", type=int, default=100, help="concurrent duplicates")
+    ap.add_argument("--delay", type=float, default=250, help="winner delay, ms")
+    ap.add_argument("--url", default=os.getenv("BENCH_DATABASE_URL"))
+    args = ap.parse_args()
+    url = args.url or f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/bench.db"
+    limiter.enabled = False
+    settings.idempotency_wait_seconds = 10
+    for strategy in ("poll", "notify"):
+        print(json.dumps(asyncio.run(run(url, strategy, args.n, args.delay / 1000))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,347 @@
+"""
+Payout lifecycle load test: create -> provider webhook -> list, end to end.
+
+Starts the backend (uvicorn, `--workers`) and mock-payments as local
+processes, then runs `--users` virtual users. Each one logs in via
+/auth/test-login and repeats: POST /payouts, then polls GET /payouts until the
+webhook has moved the payout out of "processing" (or `--settle-timeout`).
+
+The database is a throwaway SQLite file unless --url points at Postgres
+(migrated with `alembic upgrade head`). Rate limits are switched off so the
+numbers measure the service, not the limiter.
+
+Reports rps, p50/p95/p99 per step, DB queries per request and provider calls
+per payout (both from the backend's /metrics) as JSON. --out writes the result
+to a file; --baseline compares against an earlier result.
+
+    cd backend && python -m bench.lifecycle --users 20 --flows 10 --out run.json
+    python -m bench.lifecycle --baseline run.json --mock-error-rate 0.1
+"""
+
+import argparse, asyncio, json, os, re, subprocess, sys, tempfile, time, uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+MOCK_DIR = BACKEND_DIR.parent / "mock-payments"
+SECRET = "bench_secret"
+
+_SAMPLE = re.compile(r"^([a-zA-Z_:][\w:]*)(\{[^}]*\})?\s+(\S+)$")
+
+
+def percentiles(samples: list[float]) -> dict:
+    if not samples:
+        return {"count": 0}
+    s = sorted(samples)
+
+    def q(p: float) -> float:
+        return round(s[min(len(s) - 1, int(p * len(s)))] * 1000, 2)
+
+    return {"count": len(s), "p50": q(0.50), "p95": q(0.95), "p99": q(0.99)}
+
+
+def parse_metrics(text: str) -> list[tuple[str, str, float]]:
+    out = []
+    for line in text.splitlines():
+        m = _SAMPLE.match(line)
+        if m:
+            out.append((m.group(1), m.group(2) or "", float(m.group(3))))
+    return out
+
+
+def metric_sum(samples, name: str, exclude: str | None = None) -> float:
+    return sum(
+        v
+        for n, labels, v in samples
+        if n == name and not (exclude and exclude in labels)
+    )
+
+
+async def scrape(c: httpx.AsyncClient) -> list:
+    r = await c.get("/metrics")
+    r.raise_for_status()
+    return parse_metrics(r.text)
+
+
+# processes
+
+
+def _start(cmd, cwd, env, log_path) -> subprocess.Popen:
+    log = open(log_path, "wb")
+    return subprocess.Popen(
+        cmd, cwd=cwd, env={**os.environ, **env}, stdout=log, stderr=subprocess.STDOUT
+    )
+
+
+async def _wait_up(url: str, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as c:
+        while True:
+            try:
+                if (await c.get(url)).status_code < 500:
+                    return
+            except httpx.TransportError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"{url} did not come up")
+            await asyncio.sleep(0.2)
+
+
+async def _prepare_db(url: str, env: dict) -> None:
+    if url.startswith("sqlite"):
+        from sqlalchemy.ext.asyncio import create_async_engine
+
+        from app.db import Base
+        import app.models  # noqa: F401
+
+        engine = create_async_engine(url)
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        await engine.dispose()
+    else:
+        subprocess.run(
+            [sys.executable, "-m", "alembic", "upgrade", "head"],
+            cwd=BACKEND_DIR,
+            env={**os.environ, **env},
+            check=True,
+        )
+
+
+# load
+
+
+class Recorder:
+    def __init__(self):
+        self.latency: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+        self.outcomes: dict[str, int] = defaultdict(int)
+        self.requests = 0
+
+    async def call(self, step: str, coro):
+        t0 = time.perf_counter()
+        try:
+            r = await coro
+        except httpx.HTTPError:
+            self.errors[step] += 1
+            return None
+        finally:
+            self.requests += 1
+        self.latency[step].append(time.perf_counter() - t0)
+        if r.status_code >= 400:
+            self.errors[step] += 1
+            return None
+        return r
+
+
+async def user(base: str, i: int, args, rec: Recorder) -> None:
+    async with httpx.AsyncClient(base_url=base, timeout=30) as c:
+        r = await rec.call(
+            "login",
+            c.post("/auth/test-login", params={"email": f"bench+{i}@example.com"}),
+        )
+        if r is None:
+            return
+        for _ in range(args.flows):
+            t0 = time.perf_counter()
+            r = await rec.call(
+                "create",
+                c.post(
+                    "/payouts",
+                    headers={"Idempotency-Key": uuid.uuid4().hex},
+                    json={"amount": "10.00", "currency": "USD"},
+                ),
+            )
+            if r is None:
+                continue
+            pid, status = r.json()["id"], "processing"
+            deadline = time.monotonic() + args.settle_timeout
+            while status == "processing" and time.monotonic() < deadline:
+                await asyncio.sleep(args.poll_interval)
+                r = await rec.call("list", c.get("/payouts", params={"limit": 20}))
+                if r is not None:
+                    for item in r.json()["items"]:
+                        if item["id"] == pid:
+                            status = item["status"]
+            if status == "processing":
+                rec.outcomes["timeout"] += 1
+            else:
+                rec.outcomes[status] += 1
+                rec.latency["lifecycle"].append(time.perf_counter() - t0)
+
+
+async def run(args) -> dict:
+    tmp = Path(tempfile.mkdtemp(prefix="lifecycle-"))
+    url = args.url or f"sqlite+aiosqlite:///{tmp}/lifecycle.db"
+    base = f"http://127.0.0.1:{args.backend_port}"
+    mock = f"http://127.0.0.1:{args.mock_port}"
+    backend_env = {
+        "ENV": "test",  # enables /auth/test-login
+        "RUN_BACKGROUND_TASKS": "true",
+        "DATABASE_URL": url,
+        "MOCK_URL": f"{mock}/payouts",
+        "WEBHOOK_SHARED_SECRET": SECRET,
+        "RATE_LIMIT_ENABLED": "false",
+        "RATE_LIMIT_REDIS_URL": "memory://",
+        "METRICS_DIR": str(tmp / "metrics"),
+        "METRICS_FLUSH_SECONDS": "0.5",
+        "LOG_LEVEL": "WARNING",
+    }
+    mock_env = {
+        "WEBHOOK_TARGET": f"{base}/webhooks/payments",
+        "WEBHOOK_SHARED_SECRET": SECRET,
+        "MOCK_LATENCY_MS": str(args.mock_latency_ms),
+        "MOCK_ERROR_RATE": str(args.mock_error_rate),
+        "MOCK_WEBHOOK_DELAY_MS": args.webhook_delay_ms,
+        "MOCK_SEED": str(args.seed),
+    }
+    os.environ.update(backend_env)
+    await _prepare_db(url, backend_env)
+
+    uvicorn = [
+        sys.executable,
+        "-m",
+        "uvicorn",
+        "app.main:app",
+        "--log-level",
+        "warning",
+    ]
+    procs = [
+        _start(
+            [
+                *uvicorn,
+                "--port",
+                str(args.backend_port),
+                "--workers",
+                str(args.workers),
+            ],
+            BACKEND_DIR,
+            backend_env,
+            tmp / "backend.log",
+        ),
+        _start(
+            [*uvicorn, "--port", str(args.mock_port)],
+            MOCK_DIR,
+            mock_env,
+            tmp / "mock.log",
+        ),
+    ]
+    try:
+        await _wait_up(f"{base}/health")
+        await _wait_up(f"{mock}/docs")
+        rec = Recorder()
+        async with httpx.AsyncClient(base_url=base) as c:
+            before = await scrape(c)
+            t0 = time.perf_counter()
+            await asyncio.gather(*(user(base, i, args, rec) for i in range(args.users)))
+            elapsed = time.perf_counter() - t0
+            await asyncio.sleep(float(backend_env["METRICS_FLUSH_SECONDS"]) * 2)
+            after = await scrape(c)
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            p.wait(10)
+
+    def delta(name, exclude=None):
+        return metric_sum(after, name, exclude) - metric_sum(before, name, exclude)
+
+    served = delta("http_requests_total", exclude='route="/metrics"')
+    created = len(rec.latency["create"]) - rec.errors["create"]
+    webhook_n = delta("webhook_processing_seconds_count")
+    return {
+        "commit": _commit(),
+        "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "baseline")}
+        | {"database": url.split(":", 1)[0]},
+        "elapsed_s": round(elapsed, 3),
+        "requests": rec.requests,
+        "rps": round(rec.requests / elapsed, 1),
+        "latency_ms": {k: percentiles(v) for k, v in rec.latency.items()},
+        "errors": dict(rec.errors),
+        "outcomes": dict(rec.outcomes),
+        "db_queries_per_request": (
+            round(delta("db_queries_total") / served, 2) if served else None
+        ),
+        "provider_calls_per_payout": (
+            round(delta("provider_request_duration_seconds_count") / created, 2)
+            if created
+            else None
+        ),
+        "webhook_ms_mean": (
+            round(delta("webhook_processing_seconds_sum") / webhook_n * 1000, 2)
+            if webhook_n
+            else None
+        ),
+        "logs": str(tmp),
+    }
+
+
+def _commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BACKEND_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(result: dict, baseline: dict) -> dict:
+    """Relative change per headline number (+0.10 = 10% higher than baseline)."""
+    keys = {
+        "rps": ("rps",),
+        "create_p95": ("latency_ms", "create", "p95"),
+        "list_p95": ("latency_ms", "list", "p95"),
+        "lifecycle_p95": ("latency_ms", "lifecycle", "p95"),
+        "db_queries_per_request": ("db_queries_per_request",),
+        "provider_calls_per_payout": ("provider_calls_per_payout",),
+    }
+    out = {}
+    for name, path in keys.items():
+        cur, base = result, baseline
+        for k in path:
+            cur, base = (cur or {}).get(k), (base or {}).get(k)
+        if cur is not None and base:
+            out[name] = round((cur - base) / base, 3)
+    return {"baseline_commit": baseline.get("commit"), "change": out}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=20)
+    ap.add_argument("--flows", type=int, default=10, help="payouts per user")
+    ap.add_argument("--workers", type=int, default=1)
+    ap.add_argument("--url", default=os.getenv("BENCH_DATABASE_URL"))
+    ap.add_argument("--backend-port", type=int, default=18000)
+    ap.add_argument("--mock-port", type=int, default=18081)
+    ap.add_argument("--mock-latency-ms", type=float, default=50)
+    ap.add_argument("--mock-error-rate", type=float, default=0.1)
+    ap.add_argument("--webhook-delay-ms", default="50,250", help="min,max")
+    ap.add_argument(
+        "--seed", type=int, default=1, help="mock-payments seed (same seed, same run)"
+    )
+    ap.add_argument("--poll-interval", type=float, default=0.2)
+    ap.add_argument("--settle-timeout", type=float, default=30)
+    ap.add_argument("--out")
+    ap.add_argument("--baseline")
+    args = ap.parse_args()
+
+    result = asyncio.run(run(args))
+    if args.baseline:
+        result["vs_baseline"] = compare(
+            result, json.loads(Path(args.baseline).read_text())
+        )
+    text = json.dumps(result, indent=2)
+    if args.out:
+        Path(args.out).write_text(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Request-logging cost on the calling (event loop) thread, before and after the
+orjson + background-writer pipeline.
+
+"before" is the old setup: stdlib json rendering and a synchronous write per
+line. "after" renders with orjson and enqueues for the writer thread, and
+applies LOG_SAMPLE to the share of /health probes. Both write to /dev/null so
+only the logging work itself is measured. `core_share_at_rps` is the fraction
+of one CPU the logging would take at --rps requests per second.
+
+    cd backend && python -m bench.logging_overhead -n 50000 --rps 5000
+"""
+
+import argparse, json, os, time
+
+os.environ.setdefault("RATE_LIMIT_REDIS_URL", "memory://")
+
+import orjson, structlog
+
+from app import logging as app_logging
+
+
+def _processors(serializer=json.dumps):
+    return [
+        structlog.processors.add_log_level,
+        structlog.processors.TimeStamper(fmt="iso"),
+        structlog.processors.format_exc_info,
+        structlog.processors.JSONRenderer(serializer=serializer),
+    ]
+
+
+def _event(i: int, health_every: int) -> dict:
+    path = "/health" if health_every and i % health_every == 0 else "/payouts"
+    return {
+        "path": f"http://localhost:8000{path}",
+        "url_path": path,
+        "method": "GET",
+        "status": 200,
+        "duration_ms": 3,
+        "cid": "0f8fad5b-d9cb-469f-a165-70867728950e",
+    }
+
+
+def run(mode: str, n: int, health_every: int) -> float:
+    devnull = open(os.devnull, "w")
+    if mode == "before":
+        log = structlog.wrap_logger(
+            structlog.PrintLogger(devnull),
+            processors=_processors(),
+            wrapper_class=structlog.make_filtering_bound_logger(20),
+        )
+    else:
+        writer = app_logging.QueueWriter(n + 1, stream=devnull)
+        log = structlog.wrap_logger(
+            app_logging.QueueLogger(writer),
+            processors=_processors(orjson.dumps),
+            wrapper_class=structlog.make_filtering_bound_logger(20),
+        )
+    events = [_event(i, health_every) for i in range(n)]
+    t0 = time.perf_counter()
+    for ev in events:
+        path = ev.pop("url_path")
+        if mode == "before" or app_logging.sampled(path, ev["status"]):
+            log.info("request_completed", **ev)
+    dt = time.perf_counter() - t0
+    if mode == "after":
+        writer.flush()
+    return dt
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", type=int, default=50000)
+    ap.add_argument("--rps", type=int, default=5000)
+    ap.add_argument(
+        "--health-every", type=int, default=5, help="every Nth request is /health"
+    )
+    args = ap.parse_args()
+    for mode in ("before", "after"):
+        dt = run(mode, args.n, args.health_every)
+        us = dt / args.n * 1e6
+        print(
+            json.dumps(
+                {
+                    "mode": mode,
+                    "requests": args.n,
+                    "us_per_request": round(us, 2),
+                    "core_share_at_rps": round(us * args.rps / 1e6, 4),
+                }
+            )
+        )
+    print(json.dumps({"dropped": app_logging.log_dropped.value()}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+Per-request middleware overhead, before and after the pure-ASGI stack.
+
+"before" rebuilds the old stack around the same routes: the
+@app.middleware("http") correlation/logging function, CORSMiddleware and
+SlowAPIMiddleware (the function and SlowAPI run on BaseHTTPMiddleware, which
+adds a task and a memory stream per request). "after" is app.main.app with app.middleware.stack().
+"bare" is the same routes with no middleware at all; `overhead_us` is the
+difference to it. Requests are driven straight through the ASGI interface
+(no client or socket) against a throwaway SQLite file, one at a time, with
+the payout read cache off.
+
+    cd backend && python -m bench.middleware_overhead -n 3000
+"""
+
+import argparse, asyncio, json, os, statistics, tempfile, time
+
+os.environ.setdefault("ENV", "test")
+os.environ.setdefault("RATE_LIMIT_REDIS_URL", "memory://")
+# request logging has its own bench (logging_overhead)
+os.environ.setdefault("LOG_SAMPLE", "/health=0,/payouts=0")
+
+from fastapi import FastAPI, Request, Response
+from fastapi.middleware.cors import CORSMiddleware
+from slowapi.middleware import SlowAPIMiddleware
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from uuid import uuid4
+
+from app import metrics, session
+from app.cache import payout_cache
+from app.db import Base, get_db
+from app.logging import logger, sampled
+from app.main import app, origins
+from app.models import Payout, User
+from app.rate_limit import limiter
+from app.replicas import ReadRouter, get_read_db, get_read_router
+
+# GET /payouts allows 60/min per user; spread requests so none are limited
+USERS = 200
+
+
+async def _correlation_and_log(request: Request, call_next):
+    # the middleware as it was, verbatim
+    cid = request.headers.get("x-correlation-id") or str(uuid4())
+    request.state.request_id = cid
+    start = time.perf_counter()
+    response = None
+
+    try:
+        response = await call_next(request)
+        return response
+    finally:
+        dur = time.perf_counter() - start
+        status = getattr(response, "status_code", 500)
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        metrics.http_requests.inc(method=request.method, route=route, status=status)
+        metrics.http_latency.observe(dur, method=request.method, route=route)
+        if sampled(request.url.path, status):
+            logger.info(
+                "request_completed",
+                path=str(request.url),
+                method=request.method,
+                status=status,
+                duration_ms=int(dur * 1000),
+                cid=cid,
+            )
+        if response:
+            response.headers["x-correlation-id"] = cid
+
+
+def _same_routes(middleware=()) -> FastAPI:
+    a = FastAPI(middleware=list(middleware))
+    a.router = app.router
+    a.exception_handlers = app.exception_handlers
+    a.state.limiter = limiter
+    return a
+
+
+def _before() -> FastAPI:
+    a = _same_routes()
+    a.middleware("http")(_correlation_and_log)
+    a.add_middleware(
+        CORSMiddleware,
+        allow_origins=origins,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    a.add_middleware(SlowAPIMiddleware)
+    return a
+
+
+async def _request(asgi, path: str, cookie: bytes) -> None:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"bench"), (b"cookie", cookie)],
+        "client": ("127.0.0.1", 50000),
+        "server": ("bench", 80),
+    }
+    status = None
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await asyncio.wait_for(asgi(scope, receive, send), 10)
+    if status != 200:
+        raise RuntimeError(f"GET {path} returned {status}")
+
+
+async def _setup(url: str) -> list[bytes]:
+    engine = create_async_engine(url)
+    Session = async_sessionmaker(engine, expire_on_commit=False)
+
+    async def _get_db():
+        async with Session() as db:
+            yield db
+
+    app.dependency_overrides[get_db] = _get_db
+    # reads too: no replicas, everything on the bench database
+    router = ReadRouter(Session)
+    app.dependency_overrides[get_read_router] = lambda: router
+    app.dependency_overrides[get_read_db] = _get_db
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        uids = (
+            await conn.execute(
+                insert(User).returning(User.id),
+                [
+                    {"provider": "bench", "provider_user_id": f"u{i}"}
+                    for i in range(USERS)
+                ],
+            )
+        ).scalars()
+        uids = list(uids)
+        await conn.execute(
+            insert(Payout),
+            [
+                {"user_id": uid, "amount_minor": 100, "currency": "USD"}
+                for uid in uids
+                for _ in range(10)
+            ],
+        )
+    cookies = []
+    for uid in uids:
+        r = Response()
+        session.set_session(r, {"uid": uid})
+        cookies.append(r.headers["set-cookie"].split(";", 1)[0].encode())
+    return cookies
+
+
+async def main(args):
+    cookies = await _setup(f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/bench.db")
+    # every mode reads from the database; a warm L1 would favour later modes
+    payout_cache.enabled = False
+    apps = {"bare": _same_routes(), "before": _before(), "after": app}
+    results = {}
+    for path in ("/health", "/payouts"):
+        # interleave rounds so drift (caches, GC) hits every mode alike
+        samples = {mode: [] for mode in apps}
+        for _ in range(args.rounds):
+            for mode, asgi in apps.items():
+                limiter.reset()
+                n = args.n // args.rounds
+                t0 = time.perf_counter()
+                for i in range(n):
+                    await _request(asgi, path, cookies[i % USERS])
+                samples[mode].append((time.perf_counter() - t0) / n * 1e6)
+        for mode in apps:
+            results[path, mode] = statistics.median(samples[mode])
+    for (path, mode), us in results.items():
+        print(
+            json.dumps(
+                {
+                    "path": path,
+                    "mode": mode,
+                    "us_per_request": round(us, 1),
+                    "overhead_us": round(us - results[path, "bare"], 1),
+                }
+            )
+        )
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", type=int, default=3000, help="requests per mode and path")
+    ap.add_argument("--rounds", type=int, default=5)
+    asyncio.run(main(ap.parse_args()))
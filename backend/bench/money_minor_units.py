@@ -0,0 +1,162 @@
+"""
+Numeric(12,2) amounts vs BIGINT minor units on the aggregation and export paths.
+
+"before" reads a copy of the old payouts table (amount Numeric(12,2)): rows
+decode to Decimal and render with str(); sums go through Decimal. "after" is
+app.models.Payout (amount_minor BIGINT) with app.money.to_str and int sums.
+Both tables hold the same rows in a throwaway SQLite file; time is process
+CPU time, so SQLite's own work is included. SQLite sums both columns
+natively, so `sum` is about equal here; on Postgres a numeric SUM runs in
+arbitrary precision and a bigint SUM does not.
+
+    export  select n rows and render them as the NDJSON export does
+    sum     SUM per (user, currency, status), as `python -m app.stats rebuild`
+    delta   stats.Delta for n status moves, as a webhook batch does
+
+    cd backend && python -m bench.money_minor_units -n 20000
+"""
+
+import argparse, json, tempfile, time
+from collections import defaultdict
+from decimal import Decimal
+
+import orjson
+from sqlalchemy import (
+    Column,
+    Integer,
+    MetaData,
+    Numeric,
+    String,
+    Table,
+    create_engine,
+    func,
+    insert,
+    select,
+)
+
+from app import money
+from app.db import Base
+from app.models import Payout, User
+from app.stats import Delta
+
+legacy = Table(
+    "payouts_numeric",
+    MetaData(),
+    Column("id", Integer, primary_key=True),
+    Column("user_id", Integer),
+    Column("amount", Numeric(12, 2)),
+    Column("currency", String(3)),
+    Column("status", String(32)),
+)
+
+
+class DecimalDelta(Delta):
+    """stats.Delta as it was: Decimal totals."""
+
+    def __init__(self):
+        self._d = defaultdict(lambda: [0, Decimal(0)])
+
+    def add(self, user_id, currency, status, amount, n=1):
+        d = self._d[(user_id, currency, status)]
+        d[0] += n
+        d[1] += Decimal(str(amount)) * n
+        return self
+
+
+def _export(conn, cols, amount):
+    return b"".join(
+        orjson.dumps(
+            {
+                "id": r.id,
+                "amount": amount(r),
+                "currency": r.currency,
+                "status": r.status,
+            }
+        )
+        + b"\n"
+        for r in conn.execute(select(*cols))
+    )
+
+
+def main(args):
+    engine = create_engine(f"sqlite:///{tempfile.mkdtemp()}/m.db")
+    Base.metadata.create_all(engine)
+    legacy.metadata.create_all(engine)
+    statuses = ("processing", "paid", "failed")
+    with engine.begin() as conn:
+        conn.execute(insert(User), [{"provider": "b", "provider_user_id": "u"}])
+        keys = [
+            {
+                "user_id": 1,
+                "currency": ("USD", "EUR", "GBP")[i % 3],
+                "status": statuses[i % 3],
+            }
+            for i in range(args.n)
+        ]
+        minor = [100 + i * 7 for i in range(args.n)]
+        conn.execute(
+            insert(Payout), [k | {"amount_minor": m} for k, m in zip(keys, minor)]
+        )
+        conn.execute(
+            insert(legacy),
+            [k | {"amount": Decimal(m).scaleb(-2)} for k, m in zip(keys, minor)],
+        )
+
+    with engine.connect() as conn:
+        runs = {
+            ("export", "before"): lambda: _export(
+                conn,
+                (legacy.c.id, legacy.c.amount, legacy.c.currency, legacy.c.status),
+                lambda r: str(r.amount),
+            ),
+            ("export", "after"): lambda: _export(
+                conn,
+                (Payout.id, Payout.amount_minor, Payout.currency, Payout.status),
+                lambda r: money.to_str(r.amount_minor, r.currency),
+            ),
+            ("sum", "before"): lambda: conn.execute(
+                select(func.sum(legacy.c.amount)).group_by(
+                    legacy.c.user_id, legacy.c.currency, legacy.c.status
+                )
+            ).all(),
+            ("sum", "after"): lambda: conn.execute(
+                select(func.sum(Payout.amount_minor)).group_by(
+                    Payout.user_id, Payout.currency, Payout.status
+                )
+            ).all(),
+        }
+        amounts = {"before": [Decimal(m).scaleb(-2) for m in minor], "after": minor}
+        for mode, cls in (("before", DecimalDelta), ("after", Delta)):
+
+            def delta(cls=cls, amounts=amounts[mode]):
+                d = cls()
+                for a in amounts:
+                    d.move(1, "USD", "processing", "paid", a)
+                return d.rows()
+
+            runs["delta", mode] = delta
+
+        for (path, mode), fn in runs.items():
+            fn()  # warm up
+            t0 = time.process_time()
+            for _ in range(args.repeat):
+                fn()
+            dt = (time.process_time() - t0) / args.repeat
+            print(
+                json.dumps(
+                    {
+                        "path": path,
+                        "mode": mode,
+                        "rows": args.n,
+                        "cpu_ms": round(dt * 1e3, 2),
+                    }
+                )
+            )
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", type=int, default=20000, help="payout rows")
+    ap.add_argument("--repeat", type=int, default=10)
+    main(ap.parse_args())
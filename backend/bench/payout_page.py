@@ -0,0 +1,139 @@
+"""
+CPU time per 100-item GET /payouts page, before and after the lean read path.
+
+"before" loads ORM entities, builds PayoutOut/Page models, then runs FastAPI's
+response_model pass (validate + serialize) and JSONResponse's stdlib encode.
+"after" selects column tuples, builds dicts and encodes once with orjson
+(ORJSONResponse). Both query the same throwaway SQLite file; time is process
+CPU time, so SQLite's own work is included. The *_render rows time the
+response side alone, from already loaded rows (or a cached page, after).
+
+    cd backend && python -m bench.payout_page -n 2000
+"""
+
+import argparse, asyncio, json, os, tempfile, time
+
+os.environ.setdefault("RATE_LIMIT_REDIS_URL", "memory://")
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app import money
+from app.db import Base
+from app.main import app
+from app.models import Payout, User
+from app.routers import payouts
+from app.schemas import Page, PayoutOut
+
+LIMIT = 100
+
+
+async def before(db, uid: int) -> bytes:
+    rows = (
+        await db.scalars(
+            select(Payout)
+            .where(Payout.user_id == uid)
+            .order_by(Payout.id.desc())
+            .limit(LIMIT + 1)
+        )
+    ).all()
+    return await render_before(rows)
+
+
+async def render_before(rows) -> bytes:
+    items = rows[:LIMIT]
+    content = Page[PayoutOut](
+        page=1,
+        limit=LIMIT,
+        total=len(rows),
+        items=[
+            PayoutOut(
+                id=p.id,
+                amount=money.to_str(p.amount_minor, p.currency),
+                currency=p.currency,
+                status=p.status,
+            )
+            for p in items
+        ],
+        next_cursor=payouts._encode_cursor("after", items[-1].id),
+    ).model_dump(mode="json")
+    content = await serialize_response(field=_field, response_content=content)
+    return JSONResponse(content).body
+
+
+async def after(db, uid: int) -> bytes:
+    page = await payouts._load_page(db, uid, 1, LIMIT, None)
+    return ORJSONResponse(page).body
+
+
+async def render_after(page: dict) -> bytes:
+    # a cache hit: the page dict is already built
+    return ORJSONResponse(page).body
+
+
+_field = next(
+    r.response_field
+    for r in app.routes
+    if getattr(r, "path", None) == "/payouts" and "GET" in r.methods
+)
+
+
+async def main(args):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/b.db")
+    Session = async_sessionmaker(engine, expire_on_commit=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        uid = (
+            await conn.execute(
+                insert(User)
+                .values(provider="bench", provider_user_id="u", payout_count=LIMIT + 1)
+                .returning(User.id)
+            )
+        ).scalar_one()
+        await conn.execute(
+            insert(Payout),
+            [
+                {"user_id": uid, "amount_minor": i * 100 + 25, "currency": "USD"}
+                for i in range(LIMIT + 1)
+            ],
+        )
+
+    async with Session() as db:
+        a, b = await before(db, uid), await after(db, uid)
+        assert json.loads(a)["items"] == json.loads(b)["items"]
+        entities = (await db.scalars(select(Payout).order_by(Payout.id.desc()))).all()
+        page = await payouts._load_page(db, uid, 1, LIMIT, None)
+        runs = (
+            ("before", lambda: before(db, uid)),
+            ("after", lambda: after(db, uid)),
+            ("before_render", lambda: render_before(entities)),
+            ("after_render", lambda: render_after(page)),
+        )
+        for name, fn in runs:
+            for _ in range(50):  # warm caches (statement compilation etc.)
+                await fn()
+            t0 = time.process_time()
+            for _ in range(args.n):
+                await fn()
+                if name in ("before", "after"):
+                    db.expunge_all()  # a fresh session per request, as in the app
+            dt = time.process_time() - t0
+            print(
+                json.dumps(
+                    {
+                        "mode": name,
+                        "pages": args.n,
+                        "items_per_page": LIMIT,
+                        "cpu_us_per_page": round(dt / args.n * 1e6, 1),
+                    }
+                )
+            )
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", type=int, default=2000)
+    asyncio.run(main(ap.parse_args()))
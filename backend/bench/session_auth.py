@@ -0,0 +1,74 @@
+"""
+Per-request auth overhead: session cookie parsing before and after the cache.
+
+"before" replays what a protected request used to do (set_user_on_request and
+current_user_id each decode + HMAC + json.loads the cookie); "after" runs the
+same two dependencies against a fresh Request with the verified-session cache.
+
+    cd backend && python -m bench.session_auth -n 200000
+"""
+
+import argparse, json, os, time
+
+os.environ.setdefault("RATE_LIMIT_REDIS_URL", "memory://")
+
+from fastapi import Response
+from starlette.requests import Request
+
+from app import session
+
+
+def _cookie() -> str:
+    resp = Response()
+    session.set_session(resp, {"uid": 42, "email": "bench@example.com"})
+    return resp.headers["set-cookie"].split(";")[0].split("=", 1)[1]
+
+
+def _request(raw: str) -> Request:
+    return Request(
+        {"type": "http", "headers": [(b"cookie", f"session={raw}".encode())]}
+    )
+
+
+def before(raw: str) -> None:
+    req = _request(raw)
+    for _ in range(2):
+        sess = session._verify(req.cookies.get(session.COOKIE_NAME))
+        int(sess["uid"])
+
+
+def after(raw: str) -> None:
+    req = _request(raw)
+    session.set_user_on_request(req)
+    session.current_user_id(req)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", type=int, default=100000)
+    args = ap.parse_args()
+    raw = _cookie()
+    baseline = time.perf_counter()
+    for _ in range(args.n):
+        _request(raw).cookies  # request construction alone, subtracted below
+    baseline = time.perf_counter() - baseline
+    for name, fn in (("before", before), ("after", after)):
+        t0 = time.perf_counter()
+        for _ in range(args.n):
+            fn(raw)
+        dt = time.perf_counter() - t0 - baseline
+        print(
+            json.dumps(
+                {
+                    "mode": name,
+                    "requests": args.n,
+                    "us_per_request": round(dt / args.n * 1e6, 3),
+                }
+            )
+        )
+    c = session.session_cache
+    print(json.dumps({"cache_hits": c.hits, "cache_misses": c.misses}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Webhook ingestion throughput: POST /webhooks/payments vs /webhooks/payments/batch.
+
+Runs the app in-process (httpx ASGI transport) against a throwaway SQLite file,
+or --url for a real database, and reports events/sec for each endpoint.
+
+    cd backend && python -m bench.webhook_batch --events 2000 --batch 200
+"""
+
+import argparse, asyncio, hashlib, hmac, json, os, tempfile, time
+
+os.environ.setdefault("ENV", "test")
+os.environ.setdefault("RATE_LIMIT_REDIS_URL", "memory://")
+os.environ.setdefault("WEBHOOK_SHARED_SECRET", "bench_secret")
+
+import httpx
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.config import settings
+from app.db import Base, get_db
+from app.main import app
+from app.models import Payout, User
+
+
+def _signed(raw: bytes) -> dict:
+    ts = str(int(time.time()))
+    sig = hmac.new(
+        settings.webhook_secret.encode(), f"{ts}.".encode() + raw, hashlib.sha256
+    ).hexdigest()
+    return {"x-sig-ts": ts, "x-sig": sig, "content-type": "application/json"}
+
+
+def _events(prefix: str, n: int, payouts: int) -> list[dict]:
+    return [
+        {
+            "event_id": f"{prefix}_{i}",
+            "payout_ref": f"ref_{i % payouts}",
+            "status": "paid" if i % 2 else "failed",
+        }
+        for i in range(n)
+    ]
+
+
+async def _single(client, events, concurrency):
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(ev):
+        raw = json.dumps(ev).encode()
+        async with sem:
+            r = await client.post(
+                "/webhooks/payments", content=raw, headers=_signed(raw)
+            )
+            r.raise_for_status()
+
+    await asyncio.gather(*(one(e) for e in events))
+
+
+async def _batched(client, events, size, concurrency):
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(chunk):
+        raw = json.dumps(chunk).encode()
+        async with sem:
+            r = await client.post(
+                "/webhooks/payments/batch", content=raw, headers=_signed(raw)
+            )
+            r.raise_for_status()
+
+    chunks = [events[i : i + size] for i in range(0, len(events), size)]
+    await asyncio.gather(*(one(c) for c in chunks))
+
+
+async def main(args):
+    url = args.url or f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/bench.db"
+    engine = create_async_engine(url)
+    Session = async_sessionmaker(engine, expire_on_commit=False)
+
+    async def _get_db():
+        async with Session() as db:
+            yield db
+
+    app.dependency_overrides[get_db] = _get_db
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        uid = (
+            await conn.execute(
+                insert(User)
+                .values(provider="bench", provider_user_id=str(time.time_ns()))
+                .returning(User.id)
+            )
+        ).scalar_one()
+        await conn.execute(
+            insert(Payout),
+            [
+                {
+                    "user_id": uid,
+                    "amount_minor": 100,
+                    "currency": "USD",
+                    "status": "processing",
+                    "provider_ref": f"ref_{i}",
+                }
+                for i in range(args.payouts)
+            ],
+        )
+
+    transport = httpx.ASGITransport(app=app)
+    results = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as c:
+        run = str(time.time_ns())
+        for mode in ("single", "batch"):
+            events = _events(f"{mode}_{run}", args.events, args.payouts)
+            t0 = time.perf_counter()
+            if mode == "single":
+                await _single(c, events, args.concurrency)
+            else:
+                await _batched(c, events, args.batch, args.concurrency)
+            dt = time.perf_counter() - t0
+            results.append(
+                {
+                    "endpoint": mode,
+                    "events": args.events,
+                    "batch_size": args.batch if mode == "batch" else 1,
+                    "seconds": round(dt, 3),
+                    "events_per_sec": round(args.events / dt, 1),
+                }
+            )
+    await engine.dispose()
+    for r in results:
+        print(json.dumps(r))
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--events", type=int, default=2000)
+    ap.add_argument("--batch", type=int, default=200)
+    ap.add_argument("--payouts", type=int, default=500)
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--url", default=os.getenv("BENCH_DATABASE_URL"))
+    asyncio.run(main(ap.parse_args()))
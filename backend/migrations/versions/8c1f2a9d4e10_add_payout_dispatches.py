@@ -0,0 +1,54 @@
+"""add payout_dispatches outbox
+
+Revision ID: 8c1f2a9d4e10
+Revises: 377a04f1b31b
+Create Date: 2026-10-18 09:12:44.102311
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "8c1f2a9d4e10"
+down_revision: Union[str, None] = "377a04f1b31b"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "payout_dispatches",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("payout_id", sa.Integer(), nullable=False),
+        sa.Column("status", sa.String(length=16), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("next_attempt_at", sa.DateTime(), nullable=False),
+        sa.Column("correlation_id", sa.String(length=128), nullable=True),
+        sa.Column("last_error", sa.String(length=255), nullable=True),
+        sa.Column(
+            "created_at",
+            sa.DateTime(),
+            server_default=sa.text("CURRENT_TIMESTAMP"),
+            nullable=False,
+        ),
+        sa.ForeignKeyConstraint(["payout_id"], ["payouts.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("payout_id"),
+    )
+    op.create_index(
+        op.f("ix_payout_dispatches_next_attempt_at"),
+        "payout_dispatches",
+        ["next_attempt_at"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        op.f("ix_payout_dispatches_next_attempt_at"), table_name="payout_dispatches"
+    )
+    op.drop_table("payout_dispatches")
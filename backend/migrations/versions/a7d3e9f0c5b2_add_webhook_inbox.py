@@ -0,0 +1,84 @@
+"""add webhook_inbox queue and webhook_dead_letters
+
+Revision ID: a7d3e9f0c5b2
+Revises: f2c8a6e1d3b4
+Create Date: 2026-10-18 21:05:37.418920
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "a7d3e9f0c5b2"
+down_revision: Union[str, None] = "f2c8a6e1d3b4"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "webhook_inbox",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("event_id", sa.String(length=128), nullable=False),
+        sa.Column("payout_ref", sa.String(length=128), nullable=False),
+        sa.Column("payload", sa.String(), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("next_attempt_at", sa.DateTime(), nullable=False),
+        sa.Column("last_error", sa.String(length=255), nullable=True),
+        sa.Column(
+            "received_at",
+            sa.DateTime(),
+            server_default=sa.text("CURRENT_TIMESTAMP"),
+            nullable=False,
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        op.f("ix_webhook_inbox_next_attempt_at"),
+        "webhook_inbox",
+        ["next_attempt_at"],
+        unique=False,
+    )
+    # the consumers' "oldest row for this payout_ref" check
+    op.create_index(
+        "ix_webhook_inbox_payout_ref_id",
+        "webhook_inbox",
+        ["payout_ref", "id"],
+        unique=False,
+    )
+    op.create_table(
+        "webhook_dead_letters",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("event_id", sa.String(length=128), nullable=False),
+        sa.Column("payout_ref", sa.String(length=128), nullable=False),
+        sa.Column("payload", sa.String(), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("last_error", sa.String(length=255), nullable=True),
+        sa.Column("received_at", sa.DateTime(), nullable=False),
+        sa.Column(
+            "failed_at",
+            sa.DateTime(),
+            server_default=sa.text("CURRENT_TIMESTAMP"),
+            nullable=False,
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        op.f("ix_webhook_dead_letters_event_id"),
+        "webhook_dead_letters",
+        ["event_id"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        op.f("ix_webhook_dead_letters_event_id"), table_name="webhook_dead_letters"
+    )
+    op.drop_table("webhook_dead_letters")
+    op.drop_index("ix_webhook_inbox_payout_ref_id", table_name="webhook_inbox")
+    op.drop_index(op.f("ix_webhook_inbox_next_attempt_at"), table_name="webhook_inbox")
+    op.drop_table("webhook_inbox")
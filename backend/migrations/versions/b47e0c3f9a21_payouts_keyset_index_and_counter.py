@@ -0,0 +1,63 @@
+"""payouts keyset index and per-user payout counter
+
+Revision ID: b47e0c3f9a21
+Revises: 8c1f2a9d4e10
+Create Date: 2026-10-18 11:40:03.518877
+
+The backfill counts the payouts that exist when it runs. Payouts created by
+the previous release until it is gone don't bump the counter: run
+`python -m app.stats recount` once the deploy has finished.
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "b47e0c3f9a21"
+down_revision: Union[str, None] = "8c1f2a9d4e10"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "users",
+        sa.Column(
+            "payout_count", sa.Integer(), server_default=sa.text("0"), nullable=False
+        ),
+    )
+    op.execute(
+        "UPDATE users SET payout_count = c.n "
+        "FROM (SELECT user_id, count(*) AS n FROM payouts GROUP BY user_id) AS c "
+        "WHERE users.id = c.user_id"
+    )
+    # build without blocking writes; (user_id, id DESC) also serves user_id lookups
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_payouts_user_id_id",
+            "payouts",
+            ["user_id", sa.text("id DESC")],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+        op.drop_index(
+            "ix_payouts_user_id", table_name="payouts", postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_payouts_user_id",
+            "payouts",
+            ["user_id"],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+        op.drop_index(
+            "ix_payouts_user_id_id", table_name="payouts", postgresql_concurrently=True
+        )
+    op.drop_column("users", "payout_count")
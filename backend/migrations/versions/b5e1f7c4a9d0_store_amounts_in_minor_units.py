@@ -0,0 +1,142 @@
+"""store payout amounts and stat totals as BIGINT minor units
+
+Revision ID: b5e1f7c4a9d0
+Revises: a7d3e9f0c5b2
+Create Date: 2026-10-18 22:14:51.207334
+
+Expand step of an expand/contract change, safe to run while the previous
+release is still serving:
+
+1. add nullable payouts.amount_minor and payout_stats.total_minor, and make
+   the old Numeric columns nullable (metadata-only changes);
+2. a trigger on each table keeps the old and new column in step, so rows
+   written by either release are readable by both;
+3. backfill existing rows in id batches, each committed on its own, so no
+   long transaction holds row locks;
+4. NOT NULL on the new columns via a NOT VALID check that is validated
+   separately (no full-table scan under an exclusive lock).
+
+The contract step (drop the triggers, currency_exponent(), payouts.amount
+and payout_stats.total) belongs in a later release, once no worker of this
+one's predecessor is left.
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "b5e1f7c4a9d0"
+down_revision: Union[str, None] = "a7d3e9f0c5b2"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH = 10_000
+
+# app/money.py EXPONENTS as of this revision
+EXPONENT_SQL = """
+CREATE OR REPLACE FUNCTION currency_exponent(c text) RETURNS int
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT CASE
+        WHEN c IN ('BIF', 'CLP', 'DJF', 'GNF', 'ISK', 'JPY', 'KMF', 'KRW', 'PYG',
+                   'RWF', 'UGX', 'UYI', 'VND', 'VUV', 'XAF', 'XOF', 'XPF') THEN 0
+        WHEN c IN ('BHD', 'IQD', 'JOD', 'KWD', 'LYD', 'OMR', 'TND') THEN 3
+        WHEN c IN ('CLF', 'UYW') THEN 4
+        ELSE 2
+    END
+$$
+"""
+
+# (table, backfill batch key, old Numeric column, new minor-unit column)
+PAIRS = [
+    ("payouts", "id", "amount", "amount_minor"),
+    ("payout_stats", "user_id", "total", "total_minor"),
+]
+
+
+def _to_minor(old: str, currency: str = "currency") -> str:
+    return f"round({old} * power(10::numeric, currency_exponent({currency})))::bigint"
+
+
+def _to_major(new: str, currency: str = "currency") -> str:
+    return f"{new} / power(10::numeric, currency_exponent({currency}))"
+
+
+def _sync_trigger(table: str, old: str, new: str) -> str:
+    # whichever column the writer changed wins; the other one follows
+    to_minor = _to_minor(f"NEW.{old}", "NEW.currency")
+    to_major = _to_major(f"NEW.{new}", "NEW.currency")
+    return f"""
+CREATE FUNCTION {table}_{new}_sync() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' AND NEW.{new} IS DISTINCT FROM OLD.{new}
+            AND NEW.{old} IS NOT DISTINCT FROM OLD.{old} THEN
+        NEW.{old} := {to_major};
+    ELSIF TG_OP = 'UPDATE' AND NEW.{old} IS DISTINCT FROM OLD.{old}
+            AND NEW.{new} IS NOT DISTINCT FROM OLD.{new} THEN
+        NEW.{new} := {to_minor};
+    ELSIF NEW.{new} IS NULL THEN
+        NEW.{new} := {to_minor};
+    ELSIF NEW.{old} IS NULL THEN
+        NEW.{old} := {to_major};
+    END IF;
+    RETURN NEW;
+END
+$$;
+CREATE TRIGGER {table}_{new}_sync BEFORE INSERT OR UPDATE ON {table}
+    FOR EACH ROW EXECUTE FUNCTION {table}_{new}_sync();
+"""
+
+
+def upgrade() -> None:
+    # fail fast instead of queueing every query behind a long transaction
+    op.execute("SET LOCAL lock_timeout = '5s'")
+    op.execute(EXPONENT_SQL)
+    for table, _, old, new in PAIRS:
+        op.add_column(table, sa.Column(new, sa.BigInteger(), nullable=True))
+        op.alter_column(table, old, nullable=True)
+        op.execute(_sync_trigger(table, old, new))
+
+    with op.get_context().autocommit_block():
+        conn = op.get_bind()
+        conn.execute(sa.text("SET lock_timeout = '5s'"))  # SET NOT NULL below
+        for table, key, old, new in PAIRS:
+            lo, hi = conn.execute(
+                sa.text(f"SELECT min({key}), max({key}) FROM {table}")
+            ).one()
+            start = lo or 0
+            while hi is not None and start <= hi:
+                conn.execute(
+                    sa.text(
+                        f"UPDATE {table} SET {new} = {_to_minor(old)} "
+                        f"WHERE {key} >= :a AND {key} < :b AND {new} IS NULL"
+                    ),
+                    {"a": start, "b": start + BATCH},
+                )
+                start += BATCH
+
+            check = f"ck_{table}_{new}_not_null"
+            conn.execute(
+                sa.text(
+                    f"ALTER TABLE {table} ADD CONSTRAINT {check} "
+                    f"CHECK ({new} IS NOT NULL) NOT VALID"
+                )
+            )
+            conn.execute(sa.text(f"ALTER TABLE {table} VALIDATE CONSTRAINT {check}"))
+            # uses the validated check instead of scanning the table
+            conn.execute(
+                sa.text(f"ALTER TABLE {table} ALTER COLUMN {new} SET NOT NULL")
+            )
+            conn.execute(sa.text(f"ALTER TABLE {table} DROP CONSTRAINT {check}"))
+
+
+def downgrade() -> None:
+    for table, _, old, new in PAIRS:
+        # the trigger kept both columns filled; this covers rows it never saw
+        op.execute(f"UPDATE {table} SET {old} = {_to_major(new)} WHERE {old} IS NULL")
+        op.execute(f"DROP TRIGGER {table}_{new}_sync ON {table}")
+        op.execute(f"DROP FUNCTION {table}_{new}_sync()")
+        op.alter_column(table, old, nullable=False)
+        op.drop_column(table, new)
+    op.execute("DROP FUNCTION currency_exponent(text)")
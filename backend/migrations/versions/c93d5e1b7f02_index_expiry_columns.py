@@ -0,0 +1,50 @@
+"""index idempotency_keys.created_at and webhook_events.received_at
+
+Revision ID: c93d5e1b7f02
+Revises: b47e0c3f9a21
+Create Date: 2026-10-18 14:05:51.230187
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "c93d5e1b7f02"
+down_revision: Union[str, None] = "b47e0c3f9a21"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            op.f("ix_idempotency_keys_created_at"),
+            "idempotency_keys",
+            ["created_at"],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            op.f("ix_webhook_events_received_at"),
+            "webhook_events",
+            ["received_at"],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            op.f("ix_webhook_events_received_at"),
+            table_name="webhook_events",
+            postgresql_concurrently=True,
+        )
+        op.drop_index(
+            op.f("ix_idempotency_keys_created_at"),
+            table_name="idempotency_keys",
+            postgresql_concurrently=True,
+        )
@@ -0,0 +1,41 @@
+"""add payouts.batch_id for bulk creation
+
+Revision ID: e41b7c2d9f13
+Revises: c93d5e1b7f02
+Create Date: 2026-10-18 16:22:41.907115
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "e41b7c2d9f13"
+down_revision: Union[str, None] = "c93d5e1b7f02"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # nullable, no default: a catalog-only change on Postgres
+    op.add_column("payouts", sa.Column("batch_id", sa.String(length=32), nullable=True))
+    with op.get_context().autocommit_block():
+        op.create_index(
+            op.f("ix_payouts_batch_id"),
+            "payouts",
+            ["batch_id"],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            op.f("ix_payouts_batch_id"),
+            table_name="payouts",
+            postgresql_concurrently=True,
+        )
+    op.drop_column("payouts", "batch_id")
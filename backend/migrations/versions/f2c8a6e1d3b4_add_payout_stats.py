@@ -0,0 +1,41 @@
+"""add payout_stats aggregates
+
+Revision ID: f2c8a6e1d3b4
+Revises: e41b7c2d9f13
+Create Date: 2026-10-18 17:48:09.336512
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "f2c8a6e1d3b4"
+down_revision: Union[str, None] = "e41b7c2d9f13"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "payout_stats",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("currency", sa.String(length=3), nullable=False),
+        sa.Column("status", sa.String(length=32), nullable=False),
+        sa.Column("count", sa.Integer(), nullable=False),
+        sa.Column("total", sa.Numeric(precision=18, scale=2), nullable=False),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("user_id", "currency", "status"),
+    )
+    # same query as `python -m app.stats rebuild`
+    op.execute(
+        "INSERT INTO payout_stats (user_id, currency, status, count, total) "
+        "SELECT user_id, currency, status, count(*), coalesce(sum(amount), 0) "
+        "FROM payouts GROUP BY user_id, currency, status"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("payout_stats")
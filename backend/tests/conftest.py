@@ -1,49 +1,68 @@
-import os
+import asyncio, hashlib, hmac, json, os, time
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.pool import NullPool
+import tempfile
 import uuid
 
 # test env
-os.environ["WEBHOOK_SHARED_SECRET"] = "test_secret"
+WEBHOOK_SECRET = "test_secret"
+os.environ["WEBHOOK_SHARED_SECRET"] = WEBHOOK_SECRET
 os.environ["ENV"] = "test"
 
 from app.main import app as fastapi_app
+from app import inbox
 from app.db import Base, get_db
+from app.cache import payout_cache
+from app.provider import guard as provider_guard
+from app.rate_limit import limiter
+from app.replicas import ReadRouter, get_read_router
 import app.models
 
-TEST_DB_URL = "sqlite+pysqlite:///:memory:"
+# one SQLite file shared by the sync assertion session and the async app session
+TEST_DB_PATH = os.path.join(tempfile.mkdtemp(), "test.db")
 engine = create_engine(
-    TEST_DB_URL,
+    f"sqlite+pysqlite:///{TEST_DB_PATH}",
     connect_args={"check_same_thread": False},
-    poolclass=StaticPool,
     future=True,
 )
 TestingSessionLocal = sessionmaker(
     bind=engine, autoflush=False, autocommit=False, future=True
 )
+# NullPool: TestClient and asyncio.run() each bring their own event loop
+async_engine = create_async_engine(
+    f"sqlite+aiosqlite:///{TEST_DB_PATH}", poolclass=NullPool
+)
+TestingAsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, autoflush=False, expire_on_commit=False
+)
 
 
 @pytest.fixture(scope="function", autouse=True)
 def _create_schema():
     Base.metadata.create_all(bind=engine)
+    # user ids restart with every fresh schema, so counters must too
+    limiter.reset()
+    payout_cache.clear()
+    provider_guard.reset()
     try:
         yield
     finally:
         Base.metadata.drop_all(bind=engine)
 
 
-def _override_get_db():
-    db = TestingSessionLocal()
-    try:
+async def _override_get_db():
+    async with TestingAsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
 fastapi_app.dependency_overrides[get_db] = _override_get_db
+# reads go to the same file; tests/test_replicas.py brings its own replica
+primary_only = ReadRouter(TestingAsyncSessionLocal)
+fastapi_app.dependency_overrides[get_read_router] = lambda: primary_only
 
 
 @pytest.fixture
@@ -51,6 +70,17 @@ def client(_create_schema):
     return TestClient(fastapi_app)
 
 
+@pytest.fixture
+def session_factory():
+    return TestingAsyncSessionLocal
+
+
+@pytest.fixture
+def drain_webhooks():
+    """Apply queued webhook events now, as the inbox consumers would."""
+    return lambda: asyncio.run(inbox.drain(TestingAsyncSessionLocal))
+
+
 @pytest.fixture
 def dbs():
     db = TestingSessionLocal()
@@ -67,3 +97,43 @@ def login_cookie(client):
     r = client.post("/auth/test-login", params={"email": email})
     assert r.status_code == 200
     return {"Cookie": f"session={client.cookies.get('session')}"}
+
+
+@pytest.fixture
+def create_payout(client, login_cookie):
+    """POST /payouts as the logged-in user and return the 200 response."""
+
+    def create(key, amount="1.00", currency="USD"):
+        r = client.post(
+            "/payouts",
+            headers={"Idempotency-Key": key, **login_cookie},
+            json={"amount": amount, "currency": currency},
+        )
+        assert r.status_code == 200, r.text
+        return r
+
+    return create
+
+
+@pytest.fixture
+def sign_webhook():
+    """Signature headers for a raw webhook body, as the provider sends them."""
+
+    def sign(raw):
+        ts = str(int(time.time()))
+        sig = hmac.new(WEBHOOK_SECRET.encode(), f"{ts}.{raw}".encode(), hashlib.sha256)
+        return {"x-sig-ts": ts, "x-sig": sig.hexdigest()}
+
+    return sign
+
+
+@pytest.fixture
+def post_webhook(client, sign_webhook):
+    """POST a signed webhook; `body` is an event (or list of them) or raw JSON."""
+
+    def post(body, path="/webhooks/payments", content_type="application/json"):
+        raw = body if isinstance(body, str) else json.dumps(body)
+        headers = {**sign_webhook(raw), "content-type": content_type}
+        return client.post(path, content=raw, headers=headers)
+
+    return post
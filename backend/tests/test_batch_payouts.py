@@ -0,0 +1,69 @@
+import uuid
+
+from sqlalchemy import func, select
+
+from app.config import settings
+from app.models import IdempotencyKey, Payout, PayoutDispatch, User
+
+
+def _item(key, amount="10.00", currency="USD"):
+    return {"idempotency_key": key, "amount": amount, "currency": currency}
+
+
+def _post(client, cookie, items):
+    return client.post("/payouts/batch", headers=cookie, json={"items": items})
+
+
+def test_batch_creates_payouts_in_one_go(client, login_cookie, dbs):
+    r = _post(
+        client,
+        login_cookie,
+        [
+            _item("b-1"),
+            _item("b-2", "5.5", "eur"),
+            _item("b-3", currency="JPY"),
+            _item("b-1"),  # repeated within the batch
+        ],
+    )
+    assert r.status_code == 200
+    body = r.json()
+    assert body["created"] == 2
+    statuses = [it["status"] for it in body["items"]]
+    assert statuses == ["created", "created", "invalid", "duplicate"]
+    assert body["items"][1]["payout"]["amount"] == "5.50"
+    assert body["items"][1]["payout"]["currency"] == "EUR"
+    assert "currency" in body["items"][2]["error"]
+    assert body["items"][3]["payout"]["id"] == body["items"][0]["payout"]["id"]
+
+    ids = [body["items"][0]["payout"]["id"], body["items"][1]["payout"]["id"]]
+    payouts = dbs.scalars(select(Payout).where(Payout.id.in_(ids))).all()
+    assert {p.batch_id for p in payouts} == {body["batch_id"]}
+    assert dbs.scalar(select(func.count()).select_from(PayoutDispatch)) == 2
+    assert dbs.get(IdempotencyKey, "b-2").payout_id == ids[1]
+    assert dbs.get(User, payouts[0].user_id).payout_count == 2
+
+
+def test_batch_replay_returns_existing_payouts(client, login_cookie, dbs):
+    first = _post(client, login_cookie, [_item("r-1"), _item("r-2")]).json()
+    again = _post(client, login_cookie, [_item("r-1"), _item("r-3")]).json()
+    assert [it["status"] for it in again["items"]] == ["duplicate", "created"]
+    assert again["items"][0]["payout"]["id"] == first["items"][0]["payout"]["id"]
+    assert dbs.scalar(select(func.count()).select_from(Payout)) == 3
+
+
+def test_batch_key_of_another_user_conflicts(client, login_cookie):
+    assert _post(client, login_cookie, [_item("shared-1")]).status_code == 200
+    other = client.post(
+        "/auth/test-login", params={"email": f"{uuid.uuid4().hex[:8]}@example.com"}
+    )
+    assert other.status_code == 200
+    cookie = {"Cookie": f"session={client.cookies.get('session')}"}
+    body = _post(client, cookie, [_item("shared-1")]).json()
+    assert body["items"][0]["status"] == "conflict"
+    assert body["created"] == 0
+
+
+def test_batch_too_large(client, login_cookie, monkeypatch):
+    monkeypatch.setattr(settings, "payout_batch_max", 2)
+    r = _post(client, login_cookie, [_item(f"x-{i}") for i in range(3)])
+    assert r.status_code == 413
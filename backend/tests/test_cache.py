@@ -0,0 +1,210 @@
+import asyncio
+
+from sqlalchemy import update
+
+from app.cache import ReadCache, cache_requests
+from app.models import Payout
+
+
+def _hits():
+    return cache_requests.value(cache="payouts", result="l1_hit")
+
+
+def test_list_is_cached_until_create_invalidates(
+    client, login_cookie, dbs, create_payout
+):
+    pid = create_payout("c-1").json()["id"]
+    first = client.get("/payouts", headers=login_cookie).json()
+    # a write that bypasses the app is not seen while the entry is cached
+    dbs.execute(update(Payout).where(Payout.id == pid).values(status="paid"))
+    dbs.commit()
+    hits = _hits()
+    assert client.get("/payouts", headers=login_cookie).json() == first
+    assert _hits() == hits + 1
+
+    create_payout("c-2")
+    body = client.get("/payouts", headers=login_cookie).json()
+    assert body["total"] == 2
+    assert [i["status"] for i in body["items"]] == ["processing", "paid"]
+
+
+def test_single_payout_invalidated_by_webhook(
+    client, login_cookie, dbs, drain_webhooks, create_payout, post_webhook
+):
+    pid = create_payout("c-3").json()["id"]
+    dbs.execute(update(Payout).where(Payout.id == pid).values(provider_ref="ref-c3"))
+    dbs.commit()
+    r = client.get(f"/payouts/{pid}", headers=login_cookie)
+    assert r.json()["status"] == "processing"
+
+    r = post_webhook({"event_id": "c-evt", "payout_ref": "ref-c3", "status": "paid"})
+    assert r.status_code == 200
+    drain_webhooks()
+    assert (
+        client.get(f"/payouts/{pid}", headers=login_cookie).json()["status"] == "paid"
+    )
+    assert client.get("/payouts/999999", headers=login_cookie).status_code == 404
+
+
+def test_concurrent_misses_share_one_load():
+    cache = ReadCache("t", None, ttl=30, l1_ttl=30, l1_size=10)
+    calls = 0
+
+    async def load():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return {"n": calls}
+
+    async def run():
+        return await asyncio.gather(
+            *(cache.get_or_load(1, "k", load) for _ in range(20))
+        )
+
+    assert asyncio.run(run()) == [{"n": 1}] * 20
+    assert calls == 1
+
+
+def test_failed_load_is_not_cached():
+    cache = ReadCache("t", None, ttl=30, l1_ttl=30, l1_size=10)
+    calls = 0
+
+    async def load():
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            raise RuntimeError("db down")
+        return {"ok": True}
+
+    async def run():
+        try:
+            await cache.get_or_load(1, "k", load)
+        except RuntimeError:
+            pass
+        return await cache.get_or_load(1, "k", load)
+
+    assert asyncio.run(run()) == {"ok": True}
+
+
+def test_invalidation_during_load_is_not_stored():
+    cache = ReadCache("t", None, ttl=30, l1_ttl=30, l1_size=10)
+
+    async def run():
+        async def load():
+            await cache.invalidate(1)  # a write commits while we read
+            return {"stale": True}
+
+        await cache.get_or_load(1, "k", load)
+        return await cache.get_or_load(1, "k", lambda: asyncio.sleep(0, {"fresh": 1}))
+
+    assert asyncio.run(run()) == {"fresh": 1}
+
+
+class _FakeRedis:
+    """The slice of redis.asyncio ReadCache uses, shared by two 'workers'."""
+
+    def __init__(self):
+        self.data: dict[str, bytes] = {}
+        self.subscribers: list[_FakePubSub] = []
+
+    def register_script(self, _src):
+        async def read(keys, args):  # app.cache._READ
+            g = self.data.get(keys[0], b"0")
+            return [g, self.data.get(f"{args[0]}{g.decode()}:{args[1]}")]
+
+        return read
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = value.encode()
+
+    def pipeline(self, transaction=True):
+        return _FakePipeline(self)
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        return _FakePubSub(self)
+
+
+class _FakePipeline:
+    def __init__(self, r):
+        self.r, self.ops = r, []
+
+    def incr(self, key):
+        self.ops.append(
+            lambda: self.r.data.update(
+                {key: b"%d" % (int(self.r.data.get(key, b"0")) + 1)}
+            )
+        )
+
+    def expire(self, key, seconds):
+        pass
+
+    def publish(self, channel, msg):
+        def send():
+            for s in self.r.subscribers:
+                if channel in s.channels:
+                    s.queue.put_nowait({"type": "message", "data": msg.encode()})
+
+        self.ops.append(send)
+
+    async def execute(self):
+        for op in self.ops:
+            op()
+
+
+class _FakePubSub:
+    def __init__(self, r):
+        self.r, self.channels, self.queue = r, set(), asyncio.Queue()
+        self.closed = False
+
+    async def subscribe(self, channel):
+        self.channels.add(channel)
+        self.r.subscribers.append(self)
+
+    async def listen(self):
+        while True:
+            yield await self.queue.get()
+
+    async def aclose(self):
+        self.closed = True
+        self.r.subscribers.remove(self)
+
+
+def test_l2_hit_then_invalidation_reaches_other_workers():
+    r = _FakeRedis()
+    a, b = (ReadCache("t", None, ttl=30, l1_ttl=30, l1_size=10) for _ in "ab")
+    for c in (a, b):
+        c.redis, c._read = r, r.register_script(None)
+    loads = []
+
+    def loader(name, value):
+        async def load():
+            loads.append(name)
+            return value
+
+        return load
+
+    async def run():
+        listener = asyncio.create_task(b.listen())
+        await asyncio.sleep(0)  # subscribed
+        assert await a.get_or_load(1, "k", loader("a", {"v": 1})) == {"v": 1}
+        before = cache_requests.value(cache="t", result="l2_hit")
+        # b has nothing in L1: served from Redis, no database load
+        assert await b.get_or_load(1, "k", loader("b", {"v": 0})) == {"v": 1}
+        assert cache_requests.value(cache="t", result="l2_hit") == before + 1
+
+        await a.invalidate(1)  # generation bump + publish
+        assert r.data["cache:t:gen:1"] == b"1"
+        await asyncio.sleep(0)  # b's listener applies it
+        assert await b.get_or_load(1, "k", loader("b", {"v": 2})) == {"v": 2}
+
+        pubsub = r.subscribers[0]
+        listener.cancel()
+        try:
+            await listener
+        except asyncio.CancelledError:
+            pass
+        return pubsub
+
+    pubsub = asyncio.run(run())
+    assert loads == ["a", "b"]
+    assert pubsub.closed and not r.subscribers
@@ -0,0 +1,46 @@
+import asyncio
+from datetime import timedelta
+
+from sqlalchemy import func, select
+
+from app.cleanup import delete_expired, expire, rows_deleted
+from app.db import utcnow
+from app.models import IdempotencyKey
+
+
+def _seed(dbs, old: int, fresh: int):
+    now = utcnow()
+    for i in range(old):
+        dbs.add(
+            IdempotencyKey(
+                key=f"old-{i}", user_id=1, created_at=now - timedelta(days=2)
+            )
+        )
+    for i in range(fresh):
+        dbs.add(IdempotencyKey(key=f"new-{i}", user_id=1, created_at=now))
+    dbs.commit()
+
+
+def test_delete_expired_works_in_batches(dbs, session_factory):
+    _seed(dbs, old=5, fresh=2)
+    cutoff = utcnow() - timedelta(hours=24)
+    n = asyncio.run(
+        delete_expired(
+            IdempotencyKey,
+            IdempotencyKey.created_at,
+            cutoff,
+            session_factory,
+            batch_size=2,
+        )
+    )
+    assert n == 5
+    keys = set(dbs.scalars(select(IdempotencyKey.key)))
+    assert keys == {"new-0", "new-1"}
+
+
+def test_expire_records_metrics(dbs, session_factory):
+    _seed(dbs, old=3, fresh=1)
+    before = rows_deleted.value(table="idempotency_keys")
+    asyncio.run(expire(IdempotencyKey, IdempotencyKey.created_at, 24, session_factory))
+    assert rows_deleted.value(table="idempotency_keys") == before + 3
+    assert dbs.scalar(select(func.count()).select_from(IdempotencyKey)) == 1
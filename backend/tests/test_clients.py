@@ -0,0 +1,15 @@
+from fastapi.testclient import TestClient
+
+from app.clients import GITHUB, PROVIDER
+from app.config import settings
+from app.main import app as fastapi_app
+
+
+def test_lifespan_opens_and_closes_pooled_clients():
+    with TestClient(fastapi_app):
+        clients = fastapi_app.state.http_clients
+        assert set(clients) == {PROVIDER, GITHUB}
+        provider = clients[PROVIDER]
+        assert not provider.is_closed
+        assert provider.timeout.connect == settings.http_connect_timeout_seconds
+    assert provider.is_closed
@@ -0,0 +1,102 @@
+import asyncio
+
+import httpx
+from sqlalchemy import select, update
+
+from app.config import settings
+from app.db import utcnow
+from app.dispatch import dispatch_once
+from app.models import Payout, PayoutDispatch
+
+
+def test_create_enqueues_dispatch(client, login_cookie, dbs, create_payout):
+    pid = create_payout("k-disp-1").json()["id"]
+    d = dbs.scalar(select(PayoutDispatch).where(PayoutDispatch.payout_id == pid))
+    assert d is not None
+    assert d.status == "pending"
+    assert dbs.get(Payout, pid).provider_ref is None
+
+
+def test_dispatcher_sets_provider_ref(
+    client, login_cookie, dbs, session_factory, create_payout
+):
+    pid = create_payout("k-disp-2").json()["id"]
+    seen = []
+
+    def handler(req: httpx.Request) -> httpx.Response:
+        seen.append(req)
+        return httpx.Response(200, json={"reference": "mock_1"})
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as c:
+            return await dispatch_once(c, session_factory)
+
+    assert asyncio.run(run()) == 1
+    assert len(seen) == 1
+    assert dbs.get(Payout, pid).provider_ref == "mock_1"
+    d = dbs.scalar(select(PayoutDispatch).where(PayoutDispatch.payout_id == pid))
+    assert d.status == "sent"
+
+
+def test_dispatcher_reschedules_on_provider_error(
+    client, login_cookie, dbs, session_factory, create_payout
+):
+    pid = create_payout("k-disp-3").json()["id"]
+
+    def handler(req: httpx.Request) -> httpx.Response:
+        return httpx.Response(429, json={"error": "rate_limited"})
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as c:
+            first = await dispatch_once(c, session_factory)
+            # backed off, so nothing is due right away
+            second = await dispatch_once(c, session_factory)
+            return first, second
+
+    assert asyncio.run(run()) == (1, 0)
+    d = dbs.scalar(select(PayoutDispatch).where(PayoutDispatch.payout_id == pid))
+    assert d.status == "pending"
+    assert d.attempts == 1
+    assert d.last_error
+
+
+def _dispatch(session_factory, status):
+    async def run():
+        t = httpx.MockTransport(lambda req: httpx.Response(status))
+        async with httpx.AsyncClient(transport=t) as c:
+            return await dispatch_once(c, session_factory)
+
+    return asyncio.run(run())
+
+
+def test_payout_fails_once_attempts_run_out(
+    client, login_cookie, dbs, session_factory, monkeypatch, create_payout
+):
+    monkeypatch.setattr(settings, "dispatch_max_attempts", 2)
+    pid = create_payout("k-disp-4").json()["id"]
+    assert _dispatch(session_factory, 500) == 1
+    assert client.get(f"/payouts/{pid}", headers=login_cookie).json()["status"] == (
+        "processing"
+    )
+    dbs.execute(update(PayoutDispatch).values(next_attempt_at=utcnow()))
+    dbs.commit()
+    assert _dispatch(session_factory, 500) == 1
+
+    r = client.get(f"/payouts/{pid}", headers=login_cookie)
+    assert r.json()["status"] == "failed"
+    summary = client.get("/payouts/summary", headers=login_cookie).json()["items"]
+    assert [(i["status"], i["count"]) for i in summary] == [("failed", 1)]
+    d = dbs.scalar(select(PayoutDispatch).where(PayoutDispatch.payout_id == pid))
+    assert (d.status, d.attempts) == ("failed", 2)
+
+
+def test_provider_4xx_fails_the_payout_without_retrying(
+    client, login_cookie, dbs, session_factory, create_payout
+):
+    pid = create_payout("k-disp-5").json()["id"]
+    assert _dispatch(session_factory, 422) == 1
+    assert client.get(f"/payouts/{pid}", headers=login_cookie).json()["status"] == (
+        "failed"
+    )
+    d = dbs.scalar(select(PayoutDispatch).where(PayoutDispatch.payout_id == pid))
+    assert (d.status, d.attempts) == ("failed", 1)
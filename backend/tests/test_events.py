@@ -0,0 +1,217 @@
+import asyncio, json
+
+import httpx
+from fastapi import Response
+from sqlalchemy import update
+
+from app import inbox
+from app.events import PING, hub
+from app.main import app
+from app.models import Payout
+from app.session import set_session
+
+
+def _cookie(uid: int) -> str:
+    r = Response()
+    set_session(r, {"uid": uid})
+    return r.headers["set-cookie"].split(";", 1)[0]
+
+
+class Stream:
+    """Drives GET /payouts/events at the ASGI level; test clients buffer bodies."""
+
+    def __init__(self, cookie: str):
+        self.cookie = cookie
+        self.status = None
+        self.frames: asyncio.Queue[bytes] = asyncio.Queue()
+        self.gone = asyncio.Event()
+        self.stuck = False  # send() never returns, like a full TCP window
+
+    async def receive(self):
+        await self.gone.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(self, msg):
+        if self.stuck:
+            await asyncio.Event().wait()
+        if msg["type"] == "http.response.start":
+            self.status = msg["status"]
+        elif msg.get("body"):
+            self.frames.put_nowait(msg["body"])
+
+    def open(self) -> asyncio.Task:
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": "/payouts/events",
+            "raw_path": b"/payouts/events",
+            "query_string": b"",
+            "root_path": "",
+            "headers": [(b"host", b"test"), (b"cookie", self.cookie.encode())],
+            "client": ("127.0.0.1", 50000),
+            "server": ("test", 80),
+        }
+        return asyncio.create_task(app(scope, self.receive, self.send))
+
+    async def next(self, timeout=5) -> bytes:
+        return await asyncio.wait_for(self.frames.get(), timeout)
+
+
+def test_webhook_update_is_pushed_to_the_owner(
+    client, login_cookie, dbs, session_factory, sign_webhook
+):
+    r = client.post(
+        "/payouts",
+        headers={"Idempotency-Key": "ev-1", **login_cookie},
+        json={"amount": "4.00", "currency": "USD"},
+    )
+    pid = r.json()["id"]
+    dbs.execute(update(Payout).where(Payout.id == pid).values(provider_ref="ref-ev"))
+    dbs.commit()
+
+    async def run():
+        s = Stream(login_cookie["Cookie"])
+        task = s.open()
+        assert await s.next() == b"retry: 3000\n\n"
+        assert s.status == 200
+
+        raw = json.dumps(
+            {"event_id": "ev-e1", "payout_ref": "ref-ev", "status": "paid"}
+        )
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://test"
+        ) as c:
+            r = await c.post(
+                "/webhooks/payments",
+                content=raw,
+                headers=sign_webhook(raw),
+            )
+            assert r.status_code == 200
+        await inbox.drain(session_factory)
+
+        frame = await s.next()
+        assert frame.startswith(b"event: payout\ndata: ")
+        data = json.loads(frame.split(b"data: ", 1)[1])
+        assert data == {
+            "id": pid,
+            "status": "paid",
+            "amount": "4.00",
+            "currency": "USD",
+        }
+
+        s.gone.set()
+        await asyncio.wait_for(task, 5)
+        assert len(hub) == 0
+
+    asyncio.run(run())
+
+
+def test_unauthenticated_stream_rejected(client):
+    assert client.get("/payouts/events").status_code == 401
+
+
+def test_worker_holds_thousands_of_idle_streams(monkeypatch):
+    n = 2000
+    monkeypatch.setattr(hub, "max_connections", n)
+    # long enough that opening 2000 streams doesn't look like stuck readers
+    monkeypatch.setattr(hub, "heartbeat", 2)
+
+    async def run():
+        streams = [Stream(_cookie(100_000 + i)) for i in range(n)]
+        tasks = [s.open() for s in streams]
+        await asyncio.gather(*(s.next(60) for s in streams))
+        assert len(hub) == n
+
+        # one ticker heartbeats every idle stream
+        pings = await asyncio.gather(*(s.next(10) for s in streams))
+        assert set(pings) == {PING}
+        tickers = [t for t in asyncio.all_tasks() if t.get_coro().__name__ == "_tick"]
+        assert len(tickers) == 1
+
+        # the cap is per worker
+        extra = Stream(_cookie(99_999))
+        await asyncio.wait_for(extra.open(), 5)
+        assert extra.status == 503
+
+        # an event reaches only its user's stream
+        hub.publish(100_000, {"id": 1, "status": "paid"})
+        while (frame := await streams[0].next()) == PING:
+            pass
+        assert frame.startswith(b"event: payout")
+        others = [s.frames.get_nowait() for s in streams[1:] if not s.frames.empty()]
+        assert set(others) <= {PING}
+
+        for s in streams:
+            s.gone.set()
+        await asyncio.wait_for(asyncio.gather(*tasks), 30)
+        assert len(hub) == 0
+
+    asyncio.run(run())
+
+
+def test_stuck_reader_is_evicted(monkeypatch):
+    monkeypatch.setattr(hub, "heartbeat", 0.05)
+
+    async def run():
+        s = Stream(_cookie(9))
+        task = s.open()
+        await s.next()
+        s.stuck = True
+        await asyncio.sleep(0.5)
+        assert len(hub) == 0
+        task.cancel()
+
+    asyncio.run(run())
+
+
+def test_per_user_limit(monkeypatch):
+    monkeypatch.setattr(hub, "max_per_user", 1)
+
+    async def run():
+        a, b = Stream(_cookie(7)), Stream(_cookie(7))
+        ta = a.open()
+        await a.next()
+        await asyncio.wait_for(b.open(), 5)
+        assert b.status == 429
+        a.gone.set()
+        await asyncio.wait_for(ta, 5)
+
+    asyncio.run(run())
+
+
+def test_lagging_reader_is_closed(monkeypatch):
+    monkeypatch.setattr(hub, "queue_size", 2)
+
+    async def run():
+        s = Stream(_cookie(8))
+        task = s.open()
+        await s.next()
+        # publish synchronously, faster than the stream can drain
+        for i in range(3):
+            hub.publish(8, {"id": i, "status": "paid"})
+        await asyncio.wait_for(task, 5)  # the server ended the stream
+        assert len(hub) == 0
+
+    asyncio.run(run())
+
+
+def test_slot_is_taken_before_the_body_starts(monkeypatch):
+    monkeypatch.setattr(hub, "max_per_user", 1)
+    monkeypatch.setattr(hub, "heartbeat", 0.05)
+
+    async def run():
+        a, b = Stream(_cookie(6)), Stream(_cookie(6))
+        a.stuck = True  # the response is under way, its body not started
+        ta = a.open()
+        await asyncio.sleep(0.01)
+        await asyncio.wait_for(b.open(), 5)
+        assert b.status == 429
+        # a body that never starts can't take its pings: the slot comes back
+        await asyncio.sleep(0.3)
+        assert len(hub) == 0
+        ta.cancel()
+
+    asyncio.run(run())
@@ -0,0 +1,66 @@
+import csv, io, json
+from datetime import timedelta
+
+from sqlalchemy import update
+
+from app.config import settings
+from app.db import utcnow
+from app.models import Payout
+
+
+def _seed(client, cookie, n):
+    items = [
+        {"idempotency_key": f"exp-{i}", "amount": f"{i + 1}.00", "currency": "USD"}
+        for i in range(n)
+    ]
+    r = client.post("/payouts/batch", headers=cookie, json={"items": items})
+    assert r.status_code == 200
+    return [it["payout"]["id"] for it in r.json()["items"]]
+
+
+def test_export_ndjson_streams_all_rows(client, login_cookie, monkeypatch):
+    monkeypatch.setattr(settings, "export_chunk_rows", 2)  # several partitions
+    ids = _seed(client, login_cookie, 5)
+    with client.stream("GET", "/payouts/export", headers=login_cookie) as r:
+        assert r.status_code == 200
+        assert r.headers["content-type"] == "application/x-ndjson"
+        rows = [json.loads(line) for line in r.iter_lines() if line]
+    assert [row["id"] for row in rows] == ids
+    assert rows[0]["amount"] == "1.00"
+    assert rows[0]["status"] == "processing"
+
+
+def test_export_csv_with_filters(client, login_cookie, dbs):
+    ids = _seed(client, login_cookie, 4)
+    dbs.execute(update(Payout).where(Payout.id == ids[1]).values(status="paid"))
+    dbs.execute(
+        update(Payout)
+        .where(Payout.id == ids[2])
+        .values(status="paid", created_at=utcnow() - timedelta(days=3))
+    )
+    dbs.commit()
+    since = (utcnow() - timedelta(days=1)).isoformat()
+    r = client.get(
+        "/payouts/export",
+        params={"format": "csv", "status": "paid", "since": since},
+        headers=login_cookie,
+    )
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(io.StringIO(r.text)))
+    assert [int(row["id"]) for row in rows] == [ids[1]]
+    assert rows[0]["amount"] == "2.00"
+
+
+def test_export_rejects_unknown_format(client, login_cookie):
+    r = client.get("/payouts/export", params={"format": "xml"}, headers=login_cookie)
+    assert r.status_code == 422
+
+
+def test_export_only_returns_own_payouts(client, login_cookie):
+    _seed(client, login_cookie, 2)
+    client.post("/auth/test-login", params={"email": "someone-else@example.com"})
+    other = {"Cookie": f"session={client.cookies.get('session')}"}
+    r = client.get("/payouts/export", headers=other)
+    assert r.status_code == 200
+    assert r.text == ""
@@ -1,5 +1,21 @@
-from sqlalchemy import func, select
-from app.models import Payout, IdempotencyKey
+import asyncio
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import func, select, update
+from app import stats
+from app.config import settings
+from app.db import utcnow
+from app.idempotency import WaiterRegistry, claim, fill, wait_for_payout, waiters
+from app.models import Payout, IdempotencyKey, User
+
+
+def _post(client, cookie, key):
+    return client.post(
+        "/payouts",
+        headers={"Idempotency-Key": key, **cookie},
+        json={"amount": "10.00", "currency": "USD"},
+    )
 
 
 def test_idempotent_create_one_row(client, login_cookie, dbs):
@@ -25,3 +41,114 @@ def test_idempotent_create_one_row(client, login_cookie, dbs):
     idk = dbs.get(IdempotencyKey, "k-111")
     assert idk is not None
     assert idk.payout_id == body1["id"]
+
+
+def test_registry_wakes_all_waiters():
+    reg = WaiterRegistry()
+
+    async def run():
+        futs = [reg.register("k") for _ in range(3)]
+        assert len(reg) == 3
+        reg.resolve("k", 42)
+        return await asyncio.gather(*futs)
+
+    assert asyncio.run(run()) == [42, 42, 42]
+    assert len(reg) == 0
+
+
+def test_wait_for_payout_wakes_on_publish(session_factory, dbs):
+    dbs.add(IdempotencyKey(key="k-wait-1", user_id=1, payout_id=None))
+    dbs.commit()
+
+    async def run():
+        async with session_factory() as db:
+            task = asyncio.create_task(wait_for_payout(db, "k-wait-1", timeout=2))
+            await asyncio.sleep(0.05)
+            assert len(waiters) == 1
+            waiters.resolve("k-wait-1", 7)
+            return await task
+
+    assert asyncio.run(run()) == 7
+    assert len(waiters) == 0
+
+
+def test_wait_for_payout_times_out(session_factory, dbs):
+    dbs.add(IdempotencyKey(key="k-wait-2", user_id=1, payout_id=None))
+    dbs.commit()
+
+    async def run():
+        async with session_factory() as db:
+            return await wait_for_payout(db, "k-wait-2", timeout=0.05)
+
+    assert asyncio.run(run()) is None
+
+
+def test_wait_for_payout_returns_committed_id(session_factory, dbs):
+    dbs.add(IdempotencyKey(key="k-wait-3", user_id=1, payout_id=9))
+    dbs.commit()
+
+    async def run():
+        async with session_factory() as db:
+            return await wait_for_payout(db, "k-wait-3", timeout=0.05)
+
+    assert asyncio.run(run()) == 9
+
+
+def test_claim_is_committed_before_the_payout_and_released_on_failure(
+    client, login_cookie, dbs, monkeypatch
+):
+    seen = []
+
+    async def failing_apply(db, delta):
+        # another connection already sees the claim: duplicates don't queue on it
+        dbs.expire_all()
+        seen.append(dbs.get(IdempotencyKey, "k-claim-1").payout_id)
+        raise RuntimeError("db went away")
+
+    monkeypatch.setattr(stats, "apply", failing_apply)
+    with pytest.raises(RuntimeError):
+        _post(client, login_cookie, "k-claim-1")
+    assert seen == [None]
+    dbs.expire_all()
+    assert dbs.get(IdempotencyKey, "k-claim-1") is None
+    assert dbs.scalar(select(func.count()).select_from(Payout)) == 0
+
+
+def test_orphaned_claim_is_taken_over_once_stale(
+    client, login_cookie, dbs, monkeypatch
+):
+    monkeypatch.setattr(settings, "idempotency_wait_seconds", 0.05)
+    uid = dbs.scalar(select(User.id))
+    dbs.add(IdempotencyKey(key="k-orphan", user_id=uid, payout_id=None))
+    dbs.commit()
+    # the winner may still be running: wait, then report processing
+    assert _post(client, login_cookie, "k-orphan").status_code == 409
+
+    old = utcnow() - timedelta(seconds=settings.idempotency_claim_seconds + 1)
+    dbs.execute(
+        update(IdempotencyKey)
+        .where(IdempotencyKey.key == "k-orphan")
+        .values(created_at=old)
+    )
+    dbs.commit()
+    r = _post(client, login_cookie, "k-orphan")
+    assert r.status_code == 200
+    dbs.expire_all()
+    assert dbs.get(IdempotencyKey, "k-orphan").payout_id == r.json()["id"]
+
+
+def test_fill_fails_once_the_claim_was_taken_over(session_factory, dbs):
+    async def run():
+        async with session_factory() as db:
+            assert await claim(db, ["k-fill"], 1) == ["k-fill"]
+            # a retry took the stale claim over and committed its payout first
+            dbs.execute(
+                update(IdempotencyKey)
+                .where(IdempotencyKey.key == "k-fill")
+                .values(payout_id=5)
+            )
+            dbs.commit()
+            return await fill(db, [("k-fill", 6)])
+
+    assert asyncio.run(run()) is False
+    assert dbs.get(IdempotencyKey, "k-fill").payout_id == 5
@@ -0,0 +1,151 @@
+import asyncio
+
+import httpx
+import pytest
+from sqlalchemy import func, select, update
+
+from app import inbox
+from app.dispatch import dispatch_once
+from app.config import settings
+from app.models import Payout, WebhookDeadLetter, WebhookInbox
+
+
+@pytest.fixture
+def refs(client, login_cookie, dbs):
+    """Two payouts with provider refs "ref-a" and "ref-b"."""
+    out = []
+    for name in ("a", "b"):
+        r = client.post(
+            "/payouts",
+            headers={"Idempotency-Key": f"inbox-{name}", **login_cookie},
+            json={"amount": "3.00", "currency": "USD"},
+        )
+        pid = r.json()["id"]
+        dbs.execute(
+            update(Payout).where(Payout.id == pid).values(provider_ref=f"ref-{name}")
+        )
+        dbs.commit()
+        out.append(pid)
+    return out
+
+
+def _status(dbs, pid):
+    dbs.expire_all()
+    return dbs.get(Payout, pid).status
+
+
+def _count(dbs, model):
+    return dbs.scalar(select(func.count()).select_from(model))
+
+
+def test_ack_queues_and_consumers_apply_in_order_per_ref(
+    client, dbs, refs, session_factory, post_webhook
+):
+    a, b = refs
+    for i, (ref, status) in enumerate(
+        [("ref-a", "failed"), ("ref-a", "paid"), ("ref-b", "paid")]
+    ):
+        r = post_webhook({"event_id": f"q-{i}", "payout_ref": ref, "status": status})
+        assert r.status_code == 200
+    assert post_webhook({"status": "paid"}).status_code == 400
+    # acknowledged, not applied yet
+    assert _status(dbs, a) == "processing"
+    assert _count(dbs, WebhookInbox) == 3
+
+    # only the oldest event of each payout is claimable
+    rows = asyncio.run(inbox.claim_batch(session_factory))
+    assert [r.event_id for r in rows] == ["q-0", "q-2"]
+    assert asyncio.run(inbox.claim_batch(session_factory)) == []  # leased
+    asyncio.run(inbox.apply(rows, session_factory))
+
+    asyncio.run(inbox.drain(session_factory))
+    assert _status(dbs, a) == "failed"  # arrival order: "paid" came too late
+    assert _status(dbs, b) == "paid"
+    assert _count(dbs, WebhookInbox) == 0
+
+
+def test_failing_event_retries_then_dead_letters_and_replays(
+    client, dbs, refs, session_factory, monkeypatch, post_webhook
+):
+    a, b = refs
+    monkeypatch.setattr(settings, "webhook_max_attempts", 2)
+    real = inbox.apply_statuses
+
+    async def broken(db, statuses):
+        if statuses.get("ref-a") == "paid":
+            raise RuntimeError("poison")
+        return await real(db, statuses)
+
+    monkeypatch.setattr(inbox, "apply_statuses", broken)
+    post_webhook({"event_id": "d-1", "payout_ref": "ref-a", "status": "paid"})
+    post_webhook({"event_id": "d-2", "payout_ref": "ref-a", "status": "failed"})
+    post_webhook({"event_id": "d-3", "payout_ref": "ref-b", "status": "paid"})
+
+    asyncio.run(inbox.drain(session_factory))
+    # the batch failed as a whole; ref-b still went through on its own
+    assert _status(dbs, b) == "paid"
+    assert _status(dbs, a) == "processing"  # d-2 waits behind d-1's retry
+    row = dbs.scalar(select(WebhookInbox).where(WebhookInbox.event_id == "d-1"))
+    assert row.attempts == 1 and row.last_error == "poison"
+
+    dbs.execute(update(WebhookInbox).values(next_attempt_at=row.received_at))
+    dbs.commit()
+    asyncio.run(inbox.drain(session_factory))
+    dead = dbs.scalars(select(WebhookDeadLetter)).all()
+    assert [(d.event_id, d.attempts) for d in dead] == [("d-1", 2)]
+    assert _status(dbs, a) == "failed"  # unblocked once d-1 was set aside
+    assert _count(dbs, WebhookInbox) == 0
+
+    monkeypatch.setattr(inbox, "apply_statuses", real)
+    assert asyncio.run(inbox.replay(["d-1"], session_factory)) == 1
+    assert asyncio.run(inbox.drain(session_factory)) == 1
+    assert _count(dbs, WebhookDeadLetter) == 0
+    assert _status(dbs, a) == "failed"  # replayed, but can't move it backwards
+
+
+def _requeue_now(dbs):
+    dbs.execute(update(WebhookInbox).values(next_attempt_at=func.current_timestamp()))
+    dbs.commit()
+
+
+def test_webhook_before_the_dispatcher_stored_the_ref_waits_for_it(
+    client, login_cookie, dbs, session_factory, post_webhook
+):
+    r = client.post(
+        "/payouts",
+        headers={"Idempotency-Key": "inbox-early", **login_cookie},
+        json={"amount": "3.00", "currency": "USD"},
+    )
+    pid = r.json()["id"]
+    # the provider answered and its webhook came in before record_result ran
+    post_webhook({"event_id": "e-1", "payout_ref": "ref-early", "status": "paid"})
+    asyncio.run(inbox.drain(session_factory))
+    row = dbs.scalar(select(WebhookInbox))
+    assert (row.attempts, row.last_error) == (1, "unknown payout_ref")
+    assert _status(dbs, pid) == "processing"
+
+    async def dispatch():
+        t = httpx.MockTransport(
+            lambda req: httpx.Response(200, json={"reference": "ref-early"})
+        )
+        async with httpx.AsyncClient(transport=t) as c:
+            await dispatch_once(c, session_factory)
+
+    asyncio.run(dispatch())
+    _requeue_now(dbs)
+    asyncio.run(inbox.drain(session_factory))
+    assert _status(dbs, pid) == "paid"
+    assert _count(dbs, WebhookInbox) == 0
+
+
+def test_webhook_for_a_ref_that_never_shows_up_is_dead_lettered(
+    client, dbs, session_factory, monkeypatch, post_webhook
+):
+    monkeypatch.setattr(settings, "webhook_max_attempts", 2)
+    post_webhook({"event_id": "e-2", "payout_ref": "ref-none", "status": "paid"})
+    asyncio.run(inbox.drain(session_factory))
+    _requeue_now(dbs)
+    asyncio.run(inbox.drain(session_factory))
+    assert _count(dbs, WebhookInbox) == 0
+    dead = dbs.scalar(select(WebhookDeadLetter))
+    assert (dead.event_id, dead.last_error) == ("e-2", "unknown payout_ref")
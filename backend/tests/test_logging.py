@@ -0,0 +1,41 @@
+import io, json, logging, queue
+
+from app import logging as app_logging
+
+
+def test_queue_writer_writes_rendered_lines():
+    out = io.StringIO()
+    writer = app_logging.QueueWriter(100, stream=out)
+    log = app_logging.QueueLogger(writer)
+    log.info(b'{"event":"a"}')
+    log.error(b'{"event":"b"}')
+    writer.flush()
+    lines = [json.loads(ln) for ln in out.getvalue().splitlines()]
+    assert [ln["event"] for ln in lines] == ["a", "b"]
+
+
+def test_full_queue_drops_instead_of_blocking():
+    writer = app_logging.QueueWriter(1, stream=io.StringIO())
+    # the writer thread keeps waiting on the original queue
+    writer.queue = queue.Queue(1)
+    before = app_logging.log_dropped.value()
+    writer.put(b"x")
+    writer.put(b"y")
+    assert app_logging.log_dropped.value() == before + 1
+
+
+def test_sampling(monkeypatch):
+    monkeypatch.setattr(
+        app_logging, "_sample_rates", app_logging._rates("/health=0,/metrics=1")
+    )
+    assert not app_logging.sampled("/health", 200)
+    assert app_logging.sampled("/health", 503)
+    assert app_logging.sampled("/metrics", 200)
+    assert app_logging.sampled("/payouts", 200)
+
+
+def test_per_logger_levels():
+    assert app_logging._levels("httpx=warning, app=DEBUG,bad") == {
+        "httpx": logging.WARNING,
+        "app": logging.DEBUG,
+    }
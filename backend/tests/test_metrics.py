@@ -0,0 +1,85 @@
+import asyncio, json, os, time
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app import metrics
+from app.db import TimedAsyncQueuePool
+
+
+def test_histogram_buckets_are_cumulative():
+    h = metrics.Histogram("test_hist_seconds", "test", buckets=(0.1, 1))
+    metrics.REGISTRY.remove(h)
+    for v in (0.05, 0.5, 0.5, 3):
+        h.observe(v, route="/x")
+    out = h.render()
+    assert 'test_hist_seconds_bucket{route="/x",le="0.1"} 1' in out
+    assert 'test_hist_seconds_bucket{route="/x",le="1"} 3' in out
+    assert 'test_hist_seconds_bucket{route="/x",le="+Inf"} 4' in out
+    assert 'test_hist_seconds_count{route="/x"} 4' in out
+    assert h.count(route="/x") == 4
+
+
+def test_requests_are_labelled_by_route_template(client, login_cookie):
+    before = metrics.http_requests.value(method="GET", route="/payouts", status=200)
+    missing = metrics.http_requests.value(method="GET", route="unmatched", status=404)
+    assert client.get("/payouts?page=1", headers=login_cookie).status_code == 200
+    assert client.get("/payouts?limit=5", headers=login_cookie).status_code == 200
+    assert client.get("/no/such/path/123").status_code == 404
+    assert (
+        metrics.http_requests.value(method="GET", route="/payouts", status=200)
+        == before + 2
+    )
+    assert (
+        metrics.http_requests.value(method="GET", route="unmatched", status=404)
+        == missing + 1
+    )
+
+    r = client.get("/metrics")
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain")
+    assert "# TYPE http_request_duration_seconds histogram" in r.text
+    assert (
+        'http_request_duration_seconds_count{method="GET",route="/payouts"}' in r.text
+    )
+    assert "page=1" not in r.text and "/no/such/path" not in r.text
+
+
+def test_snapshots_from_several_workers_are_merged(tmp_path, monkeypatch):
+    c = metrics.Counter("test_merge_total", "test")
+    g = metrics.Gauge("test_merge_gauge", "test")
+    try:
+        monkeypatch.setattr(metrics, "METRICS_DIR", str(tmp_path))
+        c.inc(2, kind="a")
+        g.set(7)
+        snap = metrics.snapshot()
+        # a second worker with the same counter
+        snap["test_merge_total"] = [[[["kind", "a"]], 3.0]]
+        (tmp_path / "99999.json").write_text(json.dumps(snap))
+        out = asyncio.run(metrics.render_async())
+        # a worker that stopped flushing: its gauges go, its counters stay
+        (tmp_path / "99998.json").write_text(json.dumps(snap))
+        old = time.time() - metrics.STALE_SECONDS - 1
+        os.utime(tmp_path / "99998.json", (old, old))
+        gone = metrics.render()
+    finally:
+        metrics.REGISTRY.remove(c)
+        metrics.REGISTRY.remove(g)
+    assert 'test_merge_total{kind="a"} 5' in out
+    assert 'test_merge_gauge{pid="99999"} 7' in out
+    assert 'test_merge_total{kind="a"} 8' in gone
+    assert 'pid="99998"' not in gone
+
+
+def test_pool_checkout_wait_is_recorded(tmp_path):
+    async def run():
+        engine = create_async_engine(
+            f"sqlite+aiosqlite:///{tmp_path}/pool.db", poolclass=TimedAsyncQueuePool
+        )
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+        await engine.dispose()
+
+    before = metrics.db_checkout_wait.count()
+    asyncio.run(run())
+    assert metrics.db_checkout_wait.count() == before + 1
@@ -0,0 +1,90 @@
+import asyncio
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from slowapi import Limiter
+from slowapi.errors import RateLimitExceeded
+from starlette.testclient import TestClient
+
+from app import metrics
+from app.main import on_rate_limited
+from app.middleware import stack
+from app.rate_limit import key_per_ip, limiter
+
+
+def test_correlation_id_is_echoed_or_generated(client):
+    r = client.get("/health", headers={"X-Correlation-ID": "cid-123"})
+    assert r.headers["x-correlation-id"] == "cid-123"
+    r = client.get("/payouts")
+    assert r.status_code == 401
+    assert r.json()["request_id"] == r.headers["x-correlation-id"]
+
+
+def test_streaming_response_is_not_buffered():
+    app = FastAPI(middleware=stack(limiter, []))
+    release = asyncio.Event()
+
+    @app.get("/stream")
+    async def stream():
+        async def body():
+            yield b"first"
+            await release.wait()  # only after the client saw the first chunk
+            yield b"second"
+
+        return StreamingResponse(body())
+
+    async def run():
+        sent = asyncio.Queue()
+
+        async def receive():
+            await asyncio.Event().wait()
+
+        scope = {
+            "type": "http",
+            "method": "GET",
+            "path": "/stream",
+            "raw_path": b"/stream",
+            "query_string": b"",
+            "root_path": "",
+            "scheme": "http",
+            "server": ("test", 80),
+            "headers": [(b"host", b"test"), (b"x-correlation-id", b"cid-s")],
+        }
+        task = asyncio.create_task(app(scope, receive, sent.put))
+        start = await asyncio.wait_for(sent.get(), 5)
+        assert (b"x-correlation-id", b"cid-s") in start["headers"]
+        first = await asyncio.wait_for(sent.get(), 5)
+        assert first["body"] == b"first" and first["more_body"]
+        release.set()
+        assert (await asyncio.wait_for(sent.get(), 5))["body"] == b"second"
+        await asyncio.wait_for(task, 5)
+
+    before = metrics.http_requests.value(method="GET", route="/stream", status=200)
+    asyncio.run(run())
+    assert (
+        metrics.http_requests.value(method="GET", route="/stream", status=200)
+        == before + 1
+    )
+
+
+def test_default_limits_are_enforced_for_undecorated_routes():
+    lim = Limiter(
+        key_func=key_per_ip, default_limits=["2/minute"], headers_enabled=True
+    )
+    app = FastAPI(middleware=stack(lim, []))
+    app.state.limiter = lim
+    app.add_exception_handler(RateLimitExceeded, on_rate_limited)
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    c = TestClient(app)
+    ok = [c.get("/ping") for _ in range(2)]
+    assert [r.status_code for r in ok] == [200, 200]
+    assert ok[1].headers["x-ratelimit-remaining"] == "0"
+    r = c.get("/ping")
+    assert r.status_code == 429
+    assert r.json()["error"] == "rate_limited"
+    assert r.json()["request_id"] == r.headers["x-correlation-id"]
+    assert "retry-after" in r.headers
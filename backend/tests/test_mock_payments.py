@@ -0,0 +1,148 @@
+import asyncio, importlib.util
+from pathlib import Path
+
+import httpx
+import pytest
+from sqlalchemy import select
+
+from app import inbox
+from app.dispatch import dispatch_once
+from app.main import app as backend_app
+from app.models import Payout
+
+# mock-payments is its own service (and its package is also called `app`)
+_MAIN = Path(__file__).resolve().parents[2] / "mock-payments" / "app" / "main.py"
+_spec = importlib.util.spec_from_file_location("mock_payments", _MAIN)
+mp = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(mp)
+
+
+@pytest.fixture(autouse=True)
+def _fresh_mock():
+    mp.mock.config = mp.Config()
+    mp.mock.reset()
+    yield
+    mp.mock.config = mp.Config()
+    mp.mock.reset()
+
+
+def _client(app, base="http://mock"):
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url=base)
+
+
+def test_errors_use_real_status_codes():
+    async def run():
+        async with _client(mp.app) as c:
+            r = await c.patch("/admin/config", json={"scenario": "outage"})
+            assert r.status_code == 200
+            r = await c.post("/payouts", json={"reference": "payout_1"})
+            assert r.status_code == 503
+            assert r.headers["retry-after"] == "5"
+            await c.patch("/admin/config", json={"scenario": "healthy"})
+            r = await c.post("/payouts", json={"reference": "payout_1"})
+            assert r.status_code == 200 and r.json()["reference"].startswith("mock_")
+            r = await c.patch(
+                "/admin/config", json={"error_429": 0.9, "error_500": 0.2}
+            )
+            assert r.status_code == 422
+            return (await c.get("/admin/stats")).json()
+
+    stats = asyncio.run(run())
+    assert stats["503"] == 1 and stats["200"] == 1
+    assert stats["webhooks_pending"] == 1
+
+
+def test_seeded_runs_replay_per_payout_and_attempt():
+    refs = [f"payout_{i}" for i in range(40)]
+
+    async def run(seed, order):
+        async with _client(mp.app) as c:
+            await c.post("/admin/reset", json={"seed": seed})
+            out = {}
+            for attempt in range(2):
+                for ref in order:
+                    r = await c.post("/payouts", json={"reference": ref})
+                    out[ref, attempt] = (r.status_code, r.text)
+            return out
+
+    first = asyncio.run(run(42, refs))
+    assert {s for s, _ in first.values()} == {200, 429, 500}  # default 30% mix
+    assert asyncio.run(run(42, refs[::-1])) == first
+    assert asyncio.run(run(43, refs)) != first
+
+
+def test_webhooks_are_queued_batched_and_applied(
+    client, login_cookie, dbs, session_factory
+):
+    ids = []
+    for i in range(3):
+        r = client.post(
+            "/payouts",
+            headers={"Idempotency-Key": f"mock-{i}", **login_cookie},
+            json={"amount": "5.00", "currency": "USD"},
+        )
+        ids.append(r.json()["id"])
+
+    async def run():
+        async with _client(mp.app) as provider:
+            await provider.patch(
+                "/admin/config",
+                json={
+                    "scenario": "healthy",
+                    "seed": 7,
+                    "webhook_delay_ms": [0, 20],
+                    "webhook_batch_size": 10,
+                    "webhook_batch_window_ms": 100,
+                    "webhook_url": "http://backend/webhooks/payments",
+                    "webhook_batch_url": "http://backend/webhooks/payments/batch",
+                },
+            )
+            await mp.mock.start(client=_client(backend_app, "http://backend"))
+            try:
+                assert await dispatch_once(provider, session_factory) == 3
+                for _ in range(100):
+                    if mp.mock.stats["webhooks_delivered"] == 3:
+                        break
+                    await asyncio.sleep(0.02)
+                await inbox.drain(session_factory)
+            finally:
+                await mp.mock.stop()
+
+    asyncio.run(run())
+    assert mp.mock.stats["webhook_posts"] == 1  # one batch for all three
+    payouts = dbs.scalars(select(Payout).where(Payout.id.in_(ids))).all()
+    assert all(p.provider_ref.startswith("mock_") for p in payouts)
+    assert {p.status for p in payouts} <= {"paid", "failed"}
+
+
+def test_failed_webhook_delivery_is_retried(monkeypatch):
+    calls = []
+
+    def backend(req):
+        calls.append(req)
+        return httpx.Response(500 if len(calls) == 1 else 200)
+
+    async def run():
+        mp.mock.config = mp.Config(
+            error_429=0, error_500=0, webhook_delay_ms=(0, 0), webhook_max_attempts=3
+        )
+        await mp.mock.start(
+            client=httpx.AsyncClient(transport=httpx.MockTransport(backend))
+        )
+        # first redelivery is 1s out; skip the wait
+        push = mp.mock._push
+        monkeypatch.setattr(mp.mock, "_push", lambda delay, *a: push(0, *a))
+        try:
+            async with _client(mp.app) as c:
+                await c.post("/payouts", json={"reference": "payout_9"})
+            for _ in range(100):
+                if mp.mock.stats["webhooks_delivered"]:
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            await mp.mock.stop()
+
+    asyncio.run(run())
+    assert len(calls) == 2
+    assert calls[0].content == calls[1].content  # same event redelivered
+    assert mp.mock.stats["webhook_retries"] == 1
@@ -0,0 +1,67 @@
+from decimal import Decimal
+
+import pytest
+from pydantic import ValidationError
+from sqlalchemy import select
+
+from app import money
+from app.models import Payout, PayoutStat
+from app.schemas import CreatePayoutRequest
+
+
+@pytest.mark.parametrize(
+    "currency,amount,minor,text",
+    [
+        ("USD", "25", 2500, "25.00"),
+        ("EUR", "0.05", 5, "0.05"),
+        ("GBP", "1.005", 101, "1.01"),  # half up
+        ("JPY", "1500.4", 1500, "1500"),
+        ("KWD", "1.25", 1250, "1.250"),
+        ("CLF", "0.0001", 1, "0.0001"),
+    ],
+)
+def test_minor_units_round_trip(currency, amount, minor, text):
+    assert money.to_minor(Decimal(amount), currency) == minor
+    assert money.to_str(minor, currency) == text
+    assert money.to_str(-minor, currency) == "-" + text
+
+
+def test_request_amount_is_quantized_to_the_currency():
+    body = CreatePayoutRequest(amount="10.005", currency="usd")
+    assert (body.amount, body.amount_minor) == (Decimal("10.01"), 1001)
+    assert CreatePayoutRequest(amount="9999999999.99", currency="USD")
+
+
+@pytest.mark.parametrize(
+    "amount,err",
+    [
+        ("12345678901.00", "amount too large"),  # overflows Numeric(12,2)
+        ("9999999999.995", "amount too large"),  # ... once rounded
+        ("1e30", "amount too large"),  # quantize: InvalidOperation
+        ("Infinity", "finite number"),
+        ("0.004", "less than one minor unit"),
+    ],
+)
+def test_out_of_range_amounts_are_rejected(client, login_cookie, amount, err):
+    with pytest.raises(ValidationError, match=err):
+        CreatePayoutRequest(amount=amount, currency="USD")
+    r = client.post(
+        "/payouts",
+        headers={"Idempotency-Key": f"money-{amount}", **login_cookie},
+        json={"amount": amount, "currency": "USD"},
+    )
+    assert r.status_code == 422
+    assert err in str(r.json()["details"])
+
+
+def test_amounts_are_stored_as_minor_units(client, login_cookie, dbs):
+    r = client.post(
+        "/payouts",
+        headers={"Idempotency-Key": "money-1", **login_cookie},
+        json={"amount": "12.345", "currency": "EUR"},
+    )
+    assert r.json()["amount"] == "12.35"
+    assert dbs.scalar(select(Payout.amount_minor)) == 1235
+    assert dbs.scalar(select(PayoutStat.total_minor)) == 1235
+    r = client.get("/payouts/summary", headers=login_cookie)
+    assert r.json()["items"][0]["total"] == "12.35"
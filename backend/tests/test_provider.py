@@ -0,0 +1,210 @@
+import asyncio, random
+
+import httpx
+import pytest
+from sqlalchemy import select
+
+from app import provider
+from app.config import settings
+from app.dispatch import dispatch_once
+from app.metrics import provider_breaker_state, provider_shed
+from app.models import PayoutDispatch
+from app.provider import ProviderError, ProviderUnavailable, create_payout
+
+
+@pytest.fixture
+def configure(monkeypatch):
+    def apply(**overrides):
+        for k, v in overrides.items():
+            monkeypatch.setattr(settings, k, v)
+        provider.guard.reset()
+
+    return apply
+
+
+def _call_many(handler, n, sequential=True):
+    """Run `n` create_payout calls; returns (outcomes, provider hits)."""
+    hits = []
+
+    async def counted(req):
+        hits.append(req)
+        r = handler(req)
+        return await r if asyncio.iscoroutine(r) else r
+
+    async def one(c):
+        try:
+            return await create_payout(c, {"amount": "1.00"}, {})
+        except (ProviderUnavailable, ProviderError) as e:
+            return e
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(counted)) as c:
+            if sequential:
+                return [await one(c) for _ in range(n)]
+            return await asyncio.gather(*(one(c) for _ in range(n)))
+
+    return asyncio.run(run()), len(hits)
+
+
+def test_breaker_opens_sheds_and_recovers(configure):
+    configure(
+        provider_breaker_window=10,
+        provider_breaker_min_calls=5,
+        provider_breaker_cooldown_seconds=0.05,
+    )
+    shed = provider_shed.value(reason="open")
+    out, hits = _call_many(lambda req: httpx.Response(500), 20)
+    assert hits == 5  # opened after min_calls failures; the rest never went out
+    assert all(isinstance(e, ProviderUnavailable) for e in out[5:])
+    assert provider.guard.breaker.state == provider.OPEN
+    assert provider_breaker_state.value() == 2
+    assert provider_shed.value(reason="open") == shed + 15
+
+    asyncio.run(asyncio.sleep(0.06))
+    out, hits = _call_many(lambda req: httpx.Response(200, json={"reference": "r"}), 1)
+    assert out == ["r"] and hits == 1  # the half-open probe closed it
+    assert provider.guard.breaker.state == provider.CLOSED
+    assert provider_breaker_state.value() == 0
+
+
+def test_failed_probe_reopens(configure):
+    configure(
+        provider_breaker_window=4,
+        provider_breaker_min_calls=2,
+        provider_breaker_cooldown_seconds=0.05,
+    )
+    _call_many(lambda req: httpx.Response(502), 2)
+    asyncio.run(asyncio.sleep(0.06))
+    out, hits = _call_many(lambda req: httpx.Response(502), 3)
+    assert hits == 1
+    assert isinstance(out[0], ProviderError)
+    assert [e.reason for e in out[1:]] == ["open", "open"]
+
+
+def test_retry_after_pauses_calls_and_halves_concurrency(configure):
+    configure(dispatch_concurrency=8)
+    out, hits = _call_many(
+        lambda req: httpx.Response(429, headers={"Retry-After": "2"}), 3
+    )
+    assert hits == 1
+    assert out[0].status == 429 and out[0].retry_after == 2
+    assert [e.reason for e in out[1:]] == ["retry_after", "retry_after"]
+    assert 1.5 < out[1].retry_after <= 2
+    assert provider.guard.limiter.limit == 4
+    assert provider.guard.breaker.state == provider.CLOSED  # 429s aren't failures
+
+
+def test_aimd_bounds_calls_in_flight(configure):
+    configure(dispatch_concurrency=4, provider_rate_per_second=0)
+    inflight, peak = 0, 0
+
+    async def slow(req):
+        nonlocal inflight, peak
+        inflight += 1
+        peak = max(peak, inflight)
+        await asyncio.sleep(0.01)
+        inflight -= 1
+        return httpx.Response(200, json={"reference": "r"})
+
+    out, hits = _call_many(slow, 30, sequential=False)
+    assert out == ["r"] * 30 and hits == 30
+    assert peak == 4
+
+
+def test_slow_calls_shrink_then_fast_calls_grow_the_limit(configure):
+    # a wide margin: "fast" calls must stay under the target on a busy machine
+    configure(dispatch_concurrency=8, provider_latency_target_seconds=0.05)
+
+    async def slow(req):
+        await asyncio.sleep(0.1)
+        return httpx.Response(200, json={"reference": "r"})
+
+    _call_many(slow, 1)
+    assert provider.guard.limiter.limit == 4
+    # +1/limit per fast success: about `limit` calls per step back up
+    _call_many(lambda req: httpx.Response(200, json={"reference": "r"}), 40)
+    assert provider.guard.limiter.limit == 8
+
+
+def test_token_bucket_sheds_beyond_burst(configure):
+    configure(
+        provider_rate_per_second=1,
+        provider_burst=2,
+        provider_queue_timeout_seconds=0.1,
+    )
+    out, hits = _call_many(lambda req: httpx.Response(200, json={"reference": "r"}), 4)
+    assert hits == 2
+    assert [getattr(e, "reason", e) for e in out] == ["r", "r", "rate", "rate"]
+
+
+def _mock_provider(error_rate: float, seed: int, throttled=2 / 3):
+    """mock-payments' error mix: by default 2/3 of errors are 429s, the rest 500s."""
+    rng = random.Random(seed)
+
+    def handler(req):
+        r = rng.random()
+        if r < error_rate * throttled:
+            return httpx.Response(429, json={"error": "rate_limited"})
+        if r < error_rate:
+            return httpx.Response(500, json={"error": "server"})
+        return httpx.Response(200, json={"reference": "mock"})
+
+    return handler
+
+
+@pytest.mark.parametrize(
+    "scenario, error_rate, throttled",
+    [("healthy", 0.0, 2 / 3), ("degraded", 0.3, 2 / 3), ("down", 1.0, 0)],
+)
+def test_degraded_provider_scenarios(configure, scenario, error_rate, throttled):
+    configure(
+        dispatch_concurrency=8,
+        provider_rate_per_second=0,
+        provider_breaker_cooldown_seconds=60,
+    )
+    lim = provider.guard.limiter
+    lows = []
+    overload = lim.on_overload
+    lim.on_overload = lambda: (overload(), lows.append(lim.limit))
+    out, hits = _call_many(_mock_provider(error_rate, 7, throttled), 200)
+    shed = [e for e in out if isinstance(e, ProviderUnavailable)]
+    if scenario == "healthy":
+        assert hits == 200 and not shed
+        assert not lows and lim.limit == 8
+    elif scenario == "degraded":
+        # 10% 5xx doesn't trip the breaker; the 429s shrink concurrency,
+        # successes grow it back
+        assert provider.guard.breaker.state == provider.CLOSED
+        assert hits == 200
+        assert min(lows) == 4
+    else:
+        # a dead provider sees the breaker's first verdict, not every call
+        assert provider.guard.breaker.state == provider.OPEN
+        assert hits == settings.provider_breaker_min_calls
+        assert len(shed) == 200 - hits
+
+
+def test_dispatch_shed_keeps_attempts(
+    configure, client, login_cookie, dbs, session_factory
+):
+    configure(provider_breaker_cooldown_seconds=60)
+    provider.guard.breaker._open()
+    r = client.post(
+        "/payouts",
+        headers={"Idempotency-Key": "shed-1", **login_cookie},
+        json={"amount": "1.00", "currency": "USD"},
+    )
+    pid = r.json()["id"]
+
+    def handler(req):
+        raise AssertionError("an open breaker must not call the provider")
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as c:
+            return await dispatch_once(c, session_factory)
+
+    assert asyncio.run(run()) == 1
+    d = dbs.scalar(select(PayoutDispatch).where(PayoutDispatch.payout_id == pid))
+    assert d.status == "pending"
+    assert d.attempts == 0
+    assert "shed: open" in d.last_error
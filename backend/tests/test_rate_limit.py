@@ -61,3 +61,105 @@ def test_rate_limit_payouts_get_headers_present(client, login_cookie):
     assert limit is not None, "X-RateLimit-Limit header missing"
     assert remaining is not None, "X-RateLimit-Remaining header missing"
     assert reset is not None, "X-RateLimit-Reset header missing"
+
+
+class _FakeRedis:
+    """Just enough of redis-py for HybridStorage.sync()."""
+
+    def __init__(self):
+        self.data: dict[str, int] = {}
+        self.down = False
+        self.calls = 0
+
+    def pipeline(self, transaction=False):
+        return _FakePipe(self)
+
+
+class _FakePipe:
+    def __init__(self, r):
+        self.r, self.ops = r, []
+
+    def incrby(self, k, n):
+        self.ops.append(("incrby", k, n))
+
+    def expireat(self, k, ts):
+        self.ops.append(("expireat", k, ts))
+
+    def get(self, k):
+        self.ops.append(("get", k, None))
+
+    def execute(self):
+        import redis
+
+        self.r.calls += 1
+        self.r.last = [op for op, _, _ in self.ops]
+        if self.r.down:
+            raise redis.ConnectionError("down")
+        out = []
+        for op, k, n in self.ops:
+            if op == "incrby":
+                self.r.data[k] = self.r.data.get(k, 0) + n
+                out.append(self.r.data[k])
+            elif op == "get":
+                out.append(self.r.data.get(k))
+            else:
+                out.append(True)
+        return out
+
+
+def _hybrid(fake):
+    from app.rate_limit import HybridStorage
+
+    s = HybridStorage("hybrid+redis://fake", client=fake)
+    s._thread = object()  # drive sync() by hand
+    return s
+
+
+def test_hybrid_storage_counts_locally_and_converges_across_workers():
+    fake = _FakeRedis()
+    a, b = _hybrid(fake), _hybrid(fake)
+    for _ in range(3):
+        a.incr("user:1", 60)
+    for _ in range(2):
+        b.incr("user:1", 60)
+    assert fake.calls == 0  # no Redis round trip on the request path
+    assert a.get("user:1") == 3
+
+    a.sync(), b.sync()
+    assert b.get("user:1") == 5
+    # a has nothing to push: it pulls the total after a read
+    a.get("user:1")
+    a.sync()
+    assert a.get("user:1") == 5
+    assert a.get_expiry("user:1") > 0
+
+
+def test_hybrid_storage_leaves_idle_keys_alone():
+    fake = _FakeRedis()
+    s = _hybrid(fake)
+    for i in range(100):
+        s.incr(f"user:{i}", 60)
+    s.sync()
+    assert fake.calls == 1
+    s.sync(), s.sync()
+    assert fake.calls == 1  # no pending hits, no reads: no Redis traffic
+
+    s.incr("user:7", 60)
+    s.sync()
+    assert fake.last == ["incrby", "expireat"]
+
+
+def test_hybrid_storage_falls_back_to_local_when_redis_down():
+    fake = _FakeRedis()
+    fake.down = True
+    s = _hybrid(fake)
+    assert s.incr("ip:1", 60) == 1
+    s.sync()
+    assert not s.redis_ok
+    assert s.incr("ip:1", 60) == 2  # still limiting locally
+
+    fake.down = False
+    s.sync()
+    assert s.redis_ok
+    assert sum(fake.data.values()) == 2  # backlog pushed on recovery
+    assert s.get("ip:1") == 2
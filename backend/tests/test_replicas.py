@@ -0,0 +1,119 @@
+import asyncio, os, tempfile
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app import metrics
+from app.cache import payout_cache
+from app.config import settings
+from app.db import Base
+from app.main import app as fastapi_app
+from app.replicas import READ_TOKEN_COOKIE, ReadRouter, Replica, get_read_router
+
+
+def _sqlite(path):
+    return async_sessionmaker(
+        create_async_engine(f"sqlite+aiosqlite:///{path}", poolclass=NullPool),
+        expire_on_commit=False,
+    )
+
+
+@pytest.fixture
+def router(session_factory, monkeypatch):
+    """The test DB as primary, plus an empty second SQLite file as its replica.
+
+    The replica never receives the primary's writes, so whatever a read
+    returns shows where it was routed.
+    """
+    path = os.path.join(tempfile.mkdtemp(), "replica.db")
+    Base.metadata.create_all(create_engine(f"sqlite:///{path}"))
+    r = ReadRouter(session_factory, [Replica("replica", _sqlite(path))])
+    monkeypatch.setitem(fastapi_app.dependency_overrides, get_read_router, lambda: r)
+    monkeypatch.setattr(payout_cache, "enabled", False)
+    return r
+
+
+def _items(client, cookie, token=None):
+    if token:
+        cookie = {"Cookie": f"{cookie['Cookie']}; {READ_TOKEN_COOKIE}={token}"}
+    r = client.get("/payouts", headers=cookie)
+    assert r.status_code == 200
+    return len(r.json()["items"])
+
+
+def _reads(target, reason):
+    return metrics.db_reads.value(target=target, reason=reason)
+
+
+def test_reads_use_the_replica_unless_the_session_just_wrote(
+    client, login_cookie, router, monkeypatch, create_payout
+):
+    asyncio.run(router.check())
+    assert router.replicas[0].healthy
+    token = create_payout("rep-1").cookies[READ_TOKEN_COOKIE]
+
+    before = _reads("primary", "behind_token")
+    assert _items(client, login_cookie, token) == 1  # read-your-writes
+    assert _reads("primary", "behind_token") == before + 1
+    assert _items(client, login_cookie) == 0  # no token: the (stale) replica
+
+    # once the replica is known to be past the token it serves that session too
+    monkeypatch.setattr(settings, "replica_max_lag_seconds", 0)
+    asyncio.run(router.check())
+    assert _items(client, login_cookie, token) == 0
+
+
+def test_cache_invalidation_pins_the_user_to_the_primary(
+    client, login_cookie, router, monkeypatch, create_payout
+):
+    monkeypatch.setattr(payout_cache, "on_invalidate", [router.pin])
+    asyncio.run(router.check())
+    create_payout("rep-2")  # invalidates the user's payout cache
+    assert _items(client, login_cookie) == 1  # no token, still the primary
+    router._pinned.clear()
+    assert _items(client, login_cookie) == 0
+
+
+def test_write_between_dependency_and_cache_read_is_not_cached_from_the_replica(
+    client, login_cookie, router, monkeypatch, create_payout
+):
+    monkeypatch.setattr(payout_cache, "enabled", True)
+    monkeypatch.setattr(payout_cache, "on_invalidate", [router.pin])
+    asyncio.run(router.check())
+    create_payout("rep-4")
+    router._pinned.clear()
+    real = payout_cache.get_or_load
+
+    async def write_lands_first(uid, key, loader):
+        # another request's write commits after this one resolved its deps
+        payout_cache.invalidate_local(uid)
+        return await real(uid, key, loader)
+
+    monkeypatch.setattr(payout_cache, "get_or_load", write_lands_first)
+    assert _items(client, login_cookie) == 1
+    monkeypatch.setattr(payout_cache, "get_or_load", real)
+    router._pinned.clear()
+    assert _items(client, login_cookie) == 1  # the primary's rows got cached
+
+
+def test_unhealthy_replica_falls_back_to_the_primary(
+    client, login_cookie, router, create_payout
+):
+    create_payout("rep-3")
+    # not checked yet: out of rotation
+    assert _items(client, login_cookie) == 1
+
+    replica = router.replicas[0]
+    replica.sessions = _sqlite("/nonexistent/dir/replica.db")
+    replica.healthy = True
+    with pytest.raises(OperationalError):  # TestClient re-raises the 500's cause
+        client.get("/payouts", headers=login_cookie)
+    assert not replica.healthy  # the failed query took it out of rotation
+    assert _items(client, login_cookie) == 1
+
+    asyncio.run(router.check())
+    assert not replica.healthy
+    assert metrics.db_replica_healthy.value(replica="replica") == 0
@@ -0,0 +1,53 @@
+from fastapi import Response
+from starlette.requests import Request
+
+from app import session
+from app.session import SessionCache, get_session, set_session
+
+
+def _cookie(payload: dict) -> str:
+    resp = Response()
+    set_session(resp, payload)
+    return resp.headers["set-cookie"].split(";")[0].split("=", 1)[1]
+
+
+def _request(raw: str) -> Request:
+    return Request(
+        {"type": "http", "headers": [(b"cookie", f"session={raw}".encode())]}
+    )
+
+
+def test_cache_hits_after_first_verification():
+    cache = SessionCache(maxsize=10, ttl=60)
+    raw = _cookie({"uid": 1})
+    assert cache.get(raw) == {"uid": 1}
+    assert cache.get(raw) == {"uid": 1}
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert cache.get(raw[:-1] + "0") is None  # tampered
+    assert len(cache) == 1
+
+
+def test_cache_is_bounded_and_expires():
+    cache = SessionCache(maxsize=2, ttl=0)
+    for uid in range(3):
+        cache.get(_cookie({"uid": uid}))
+    assert len(cache) == 2
+    cache.get(_cookie({"uid": 2}))
+    assert cache.hits == 0  # ttl=0: always re-verified
+
+
+def test_secret_rotation_invalidates(monkeypatch):
+    cache = SessionCache(maxsize=10, ttl=60)
+    raw = _cookie({"uid": 1})
+    assert cache.get(raw) == {"uid": 1}
+    monkeypatch.setattr(session, "SESSION_SECRET", b"rotated")
+    assert cache.get(raw) is None
+
+
+def test_get_session_parses_once_per_request_and_returns_copies():
+    raw = _cookie({"uid": 5})
+    req = _request(raw)
+    first = get_session(req)
+    first["oauth_state"] = "x"
+    assert get_session(req) == {"uid": 5}
+    assert req.state.session == {"uid": 5}
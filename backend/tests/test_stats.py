@@ -0,0 +1,89 @@
+import asyncio
+
+from sqlalchemy import delete, select, update
+
+from app.models import Payout, PayoutStat, User
+from app.stats import rebuild, recount
+
+
+def _summary(client, cookie):
+    r = client.get("/payouts/summary", headers=cookie)
+    assert r.status_code == 200
+    return {
+        (i["currency"], i["status"]): (i["count"], i["total"])
+        for i in r.json()["items"]
+    }
+
+
+def _create(client, cookie, dbs, create_payout):
+    items = [
+        {"idempotency_key": "s-1", "amount": "10.00", "currency": "USD"},
+        {"idempotency_key": "s-2", "amount": "2.50", "currency": "USD"},
+        {"idempotency_key": "s-3", "amount": "7.00", "currency": "EUR"},
+    ]
+    client.post("/payouts/batch", headers=cookie, json={"items": items})
+    create_payout("s-4", "1.25", "EUR")
+    for p in dbs.scalars(select(Payout)):
+        p.provider_ref = f"ref_{p.id}"
+    dbs.commit()
+    return [p.id for p in dbs.scalars(select(Payout).order_by(Payout.id))]
+
+
+def test_summary_follows_creates_and_transitions(
+    client, login_cookie, dbs, drain_webhooks, create_payout, post_webhook
+):
+    ids = _create(client, login_cookie, dbs, create_payout)
+    assert _summary(client, login_cookie) == {
+        ("EUR", "processing"): (2, "8.25"),
+        ("USD", "processing"): (2, "12.50"),
+    }
+
+    paid = {"event_id": "st-1", "payout_ref": f"ref_{ids[0]}", "status": "paid"}
+    assert post_webhook(paid).status_code == 200
+    # replayed event and a backwards transition change nothing
+    assert post_webhook(paid).status_code == 200
+    r = post_webhook(
+        [
+            {"event_id": "st-2", "payout_ref": f"ref_{ids[2]}", "status": "failed"},
+            {"event_id": "st-3", "payout_ref": f"ref_{ids[0]}", "status": "failed"},
+        ],
+        "/webhooks/payments/batch",
+    )
+    assert r.status_code == 200
+    drain_webhooks()
+    assert _summary(client, login_cookie) == {
+        ("EUR", "failed"): (1, "7.00"),
+        ("EUR", "processing"): (1, "1.25"),
+        ("USD", "paid"): (1, "10.00"),
+        ("USD", "processing"): (1, "2.50"),
+    }
+
+
+def test_rebuild_recomputes_from_payouts(
+    client, login_cookie, dbs, session_factory, create_payout
+):
+    ids = _create(client, login_cookie, dbs, create_payout)
+    dbs.execute(update(Payout).where(Payout.id == ids[1]).values(status="paid"))
+    dbs.execute(delete(PayoutStat).where(PayoutStat.currency == "EUR"))
+    dbs.commit()
+
+    assert asyncio.run(rebuild(session_factory)) == 3
+    assert _summary(client, login_cookie) == {
+        ("EUR", "processing"): (2, "8.25"),
+        ("USD", "paid"): (1, "2.50"),
+        ("USD", "processing"): (1, "10.00"),
+    }
+
+
+def test_recount_fixes_the_listing_total(
+    client, login_cookie, dbs, session_factory, create_payout
+):
+    ids = _create(client, login_cookie, dbs, create_payout)
+    # payouts written by a release that didn't maintain the counter
+    dbs.execute(update(User).values(payout_count=1))
+    dbs.commit()
+
+    assert asyncio.run(recount(session_factory)) == 1
+    r = client.get("/payouts", headers=login_cookie)
+    assert r.json()["total"] == len(ids)
+    assert asyncio.run(recount(session_factory)) == 0
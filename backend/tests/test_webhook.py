@@ -1,15 +1,13 @@
-import hmac, hashlib, json, time
-from sqlalchemy import select
-from app.models import Payout
+import json, time
+from sqlalchemy import func, select
+from app.models import Payout, WebhookEvent
 
-SECRET = "test_secret"
+BATCH = "/webhooks/payments/batch"
 
 
-def sign(ts: str, raw: str) -> str:
-    return hmac.new(SECRET.encode(), f"{ts}.{raw}".encode(), hashlib.sha256).hexdigest()
-
-
-def test_webhook_updates_status(client, login_cookie, dbs):
+def test_webhook_updates_status(
+    client, login_cookie, dbs, drain_webhooks, post_webhook
+):
     r = client.post(
         "/payouts",
         headers={"Idempotency-Key": "k-222", **login_cookie},
@@ -28,15 +26,9 @@ def test_webhook_updates_status(client, login_cookie, dbs):
         "payout_ref": f"payout_{pid}",
         "status": "paid",
     }
-    raw = json.dumps(payload)
-    ts = str(int(time.time()))
-    sig = sign(ts, raw)
-    r2 = client.post(
-        "/webhooks/payments",
-        data=raw,
-        headers={"x-sig-ts": ts, "x-sig": sig, "content-type": "application/json"},
-    )
+    r2 = post_webhook(payload)
     assert r2.status_code in (200, 204)
+    drain_webhooks()
 
     st = dbs.scalar(select(Payout.status).where(Payout.id == pid))
     assert st == "paid"
@@ -72,3 +64,90 @@ def test_webhook_rejects_bad_signature(client, login_cookie, dbs):
 
     st = dbs.scalar(select(Payout.status).where(Payout.id == pid))
     assert st == "processing"
+
+
+def _payout_with_ref(client, login_cookie, dbs, key):
+    r = client.post(
+        "/payouts",
+        headers={"Idempotency-Key": key, **login_cookie},
+        json={"amount": "5.00", "currency": "USD"},
+    )
+    pid = r.json()["id"]
+    p = dbs.get(Payout, pid)
+    p.provider_ref = f"payout_{pid}"
+    dbs.commit()
+    return pid
+
+
+def test_webhook_batch_applies_new_events_once(
+    client, login_cookie, dbs, drain_webhooks, post_webhook
+):
+    a = _payout_with_ref(client, login_cookie, dbs, "k-b-1")
+    b = _payout_with_ref(client, login_cookie, dbs, "k-b-2")
+    events = [
+        {"event_id": "evt_b_1", "payout_ref": f"payout_{a}", "status": "paid"},
+        {"event_id": "evt_b_2", "payout_ref": f"payout_{b}", "status": "failed"},
+    ]
+    r = post_webhook(events, BATCH)
+    assert r.status_code == 200, r.text
+    assert r.json() == {"ok": True, "received": 2, "new": 2}
+
+    # replay as NDJSON: nothing new
+    ndjson = "\n".join(json.dumps(e) for e in events)
+    r = post_webhook(ndjson, BATCH, "application/x-ndjson")
+    assert r.json()["new"] == 0
+    drain_webhooks()
+
+    dbs.expire_all()
+    assert dbs.get(Payout, a).status == "paid"
+    assert dbs.get(Payout, b).status == "failed"
+
+
+def test_webhook_batch_rejects_bad_signature(client):
+    raw = json.dumps([{"event_id": "e", "payout_ref": "r", "status": "paid"}])
+    r = client.post(
+        "/webhooks/payments/batch",
+        content=raw,
+        headers={"x-sig-ts": str(int(time.time())), "x-sig": "deadbeef"},
+    )
+    assert r.status_code == 401
+
+
+def test_webhook_batch_rejects_malformed_events(client, post_webhook):
+    r = post_webhook([{"status": "paid"}], BATCH)
+    assert r.status_code == 400
+
+
+def test_webhook_stores_raw_body_and_ignores_backwards_moves(
+    client, login_cookie, dbs, drain_webhooks, post_webhook
+):
+    pid = _payout_with_ref(client, login_cookie, dbs, "k-ooo-1")
+    ref = f"payout_{pid}"
+    raw = '{"event_id":"evt_o_1", "payout_ref":"%s", "status":"paid"}' % ref
+    assert post_webhook(raw).status_code == 200
+
+    # late/out-of-order events can't move a settled payout
+    for i, status in enumerate(["processing", "failed"], start=2):
+        later = json.dumps(
+            {"event_id": f"evt_o_{i}", "payout_ref": ref, "status": status}
+        )
+        assert post_webhook(later).status_code == 200
+
+    # replaying the same event is a no-op, not a 409
+    assert post_webhook(raw).status_code == 200
+    drain_webhooks()
+
+    dbs.expire_all()
+    assert dbs.get(Payout, pid).status == "paid"
+    stored = dbs.scalar(
+        select(WebhookEvent.payload).where(WebhookEvent.event_id == "evt_o_1")
+    )
+    assert stored == raw
+    assert dbs.scalar(select(func.count()).select_from(WebhookEvent)) == 3
+
+
+def test_webhook_rejects_non_string_status(client, post_webhook):
+    for status in (["paid"], {"s": "paid"}, 1):
+        ev = {"event_id": "e-bad", "payout_ref": "r", "status": status}
+        assert post_webhook(ev).status_code == 400
+        assert post_webhook([ev], BATCH).status_code == 400
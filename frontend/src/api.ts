@@ -81,10 +81,12 @@ export type Payout = {
   status: "pending" | "processing" | "paid" | "failed";
 };
 export type Page<T> = {
-  page: number;
+  page: number | null;
   limit: number;
-  total: number;
+  total: number | null;
   items: T[];
+  next_cursor: string | null;
+  prev_cursor: string | null;
 };
 
 export async function createPayout(
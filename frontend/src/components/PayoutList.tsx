@@ -104,7 +104,7 @@ export function PayoutList() {
   const to = data ? Math.max(from - data.items.length + 1, 0) : 0;
 
   const canPrev = page > 1;
-  const canNext = data ? page * LIMIT < data.total : false;
+  const canNext = data ? page * LIMIT < total : false;
 
   const onPrev = () => {
     if (canPrev && !loading) load(page - 1);
@@ -1,47 +1,347 @@
-from fastapi import FastAPI, BackgroundTasks, Request
-import os, time, random, json, hmac, hashlib, httpx
+"""
+Mock payment provider for local development and load tests.
 
-app = FastAPI(title="Mock Payments")
+POST /payouts answers after a sampled latency with either a reference or an
+error status (429/500/503, optionally with Retry-After). Every accepted payout
+gets a signed `paid`/`failed` webhook after a sampled delay. Webhooks are
+queued in-process, optionally coalesced into POST {target}/batch calls, and
+sent by `webhook_concurrency` async workers over one pooled HTTP client.
+Failed deliveries are retried with backoff.
+
+Everything is configurable at runtime:
+
+    GET   /admin/config              current config
+    PATCH /admin/config              partial update; {"scenario": "degraded"}
+                                     applies a preset first
+    POST  /admin/reset               clear counters and pending webhooks and
+                                     re-seed; body {"seed": 42} optional
+    GET   /admin/stats               outcome counters and queue depth
+
+With a `seed`, every decision is drawn from an RNG keyed by
+(seed, reference, nth call for that reference): latency, error, provider
+reference, webhook status, delay and event id. A replayed run therefore gets
+the same outcome per payout and attempt, whatever order requests arrive in.
+Env vars set the startup defaults; MOCK_ADMIN_TOKEN protects /admin.
+"""
+
+import asyncio, hashlib, heapq, hmac, itertools, json, math, os, random, time
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import Literal
+
+import httpx
+from fastapi import Body, FastAPI, Header, HTTPException, Request
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field
 
-WEBHOOK = os.getenv("WEBHOOK_TARGET", "http://localhost:8000/webhooks/payments")
 SECRET = os.getenv("WEBHOOK_SHARED_SECRET", "changeme")
+ADMIN_TOKEN = os.getenv("MOCK_ADMIN_TOKEN")
 
+_WEBHOOK = os.getenv("WEBHOOK_TARGET", "http://localhost:8000/webhooks/payments")
+_ERROR_RATE = float(os.getenv("MOCK_ERROR_RATE", "0.3"))  # 2/3 429s, 1/3 500s
+_SEED = os.getenv("MOCK_SEED")
 
-def send_webhook(payout_ref: str, cid: str | None):
-    time.sleep(random.choice([1, 2, 3]))  # pretend to process
-    payload = {
-        "event_id": f"evt_{int(time.time()*1000)}_{random.randint(100,999)}",
-        "payout_ref": payout_ref,
-        "status": random.choice(["paid", "failed"]),
-    }
-    raw = json.dumps(payload).encode()
-    ts = str(int(time.time()))
-    sig = hmac.new(SECRET.encode(), f"{ts}.".encode() + raw, hashlib.sha256).hexdigest()
-    headers = {"x-sig-ts": ts, "x-sig": sig}
-    if cid:
-        headers["x-correlation-id"] = cid
-    try:
-        httpx.post(
-            WEBHOOK,
-            content=raw,
-            headers={"content-type": "application/json", **headers},
+
+def _range(raw: str) -> tuple[float, float]:
+    """ "min,max" (or a single fixed value) in milliseconds."""
+    parts = [float(x) for x in raw.split(",")]
+    return parts[0], parts[-1]
+
+
+class Config(BaseModel):
+    # provider call
+    latency_ms: float = Field(float(os.getenv("MOCK_LATENCY_MS", "0")), ge=0)
+    latency_dist: Literal["fixed", "uniform", "exponential", "lognormal"] = os.getenv(
+        "MOCK_LATENCY_DIST", "fixed"
+    )
+    # uniform: +/- this fraction of latency_ms; lognormal: sigma
+    latency_spread: float = Field(0.5, ge=0)
+    error_429: float = Field(_ERROR_RATE * 2 / 3, ge=0, le=1)
+    error_500: float = Field(_ERROR_RATE / 3, ge=0, le=1)
+    error_503: float = Field(0.0, ge=0, le=1)
+    retry_after_s: float | None = Field(None, ge=0)  # sent with 429/503
+
+    # webhooks
+    webhook_url: str = _WEBHOOK
+    webhook_batch_url: str = os.getenv("WEBHOOK_BATCH_TARGET", f"{_WEBHOOK}/batch")
+    webhook_delay_ms: tuple[float, float] = _range(
+        os.getenv("MOCK_WEBHOOK_DELAY_MS", "1000,3000")
+    )
+    webhook_failed_ratio: float = Field(0.5, ge=0, le=1)
+    # coalesce into POST webhook_batch_url (0 = one request per event)
+    webhook_batch_size: int = Field(int(os.getenv("WEBHOOK_BATCH_SIZE", "0")), ge=0)
+    webhook_batch_window_ms: float = float(os.getenv("WEBHOOK_BATCH_WINDOW_MS", "200"))
+    webhook_concurrency: int = Field(int(os.getenv("WEBHOOK_CONCURRENCY", "8")), ge=1)
+    webhook_max_attempts: int = Field(5, ge=1)
+
+    seed: int | None = int(_SEED) if _SEED else None
+
+
+SCENARIOS = {
+    "healthy": {"error_429": 0, "error_500": 0, "error_503": 0},
+    "degraded": {"error_429": 0.2, "error_500": 0.1, "error_503": 0},
+    "throttling": {"error_429": 0.5, "error_500": 0, "retry_after_s": 1},
+    "outage": {"error_429": 0, "error_500": 0, "error_503": 1, "retry_after_s": 5},
+    "slow": {"latency_ms": 800, "latency_dist": "lognormal", "latency_spread": 0.6},
+}
+
+
+class Mock:
+    def __init__(self, config: Config):
+        self.config = config
+        self.client: httpx.AsyncClient | None = None
+        self._tasks: list[asyncio.Task] = []
+        self._ready: asyncio.Queue | None = None  # due events
+        self._outbox: asyncio.Queue | None = None  # (events, batched) to send
+        self._wake: asyncio.Event | None = None
+        self.reset()
+
+    def reset(self) -> None:
+        self.stats: Counter = Counter()
+        self._calls: Counter = Counter()  # per reference, for seeded replay
+        self._random = random.Random()
+        self._seq = itertools.count()
+        self._due: list = []  # heap of (due, seq, events, cid, attempt)
+        for q in (self._ready, self._outbox):  # running: drop queued, keep workers
+            while q is not None and not q.empty():
+                q.get_nowait()
+
+    # decisions
+
+    def rng(self, ref: str) -> random.Random:
+        if self.config.seed is None:
+            return self._random
+        n = self._calls[ref]
+        self._calls[ref] += 1
+        return random.Random(f"{self.config.seed}:{ref}:{n}")
+
+    def latency(self, rng: random.Random) -> float:
+        c = self.config
+        ms, spread = c.latency_ms, c.latency_spread
+        if ms <= 0:
+            return 0.0
+        if c.latency_dist == "uniform":
+            ms = rng.uniform(ms * (1 - spread), ms * (1 + spread))
+        elif c.latency_dist == "exponential":
+            ms = rng.expovariate(1 / ms)
+        elif c.latency_dist == "lognormal":
+            ms = rng.lognormvariate(math.log(ms), spread)
+        return max(ms, 0.0) / 1000
+
+    def error(self, roll: float) -> int | None:
+        c = self.config
+        for status, rate in (
+            (429, c.error_429),
+            (500, c.error_500),
+            (503, c.error_503),
+        ):
+            if roll < rate:
+                return status
+            roll -= rate
+        return None
+
+    # webhooks
+
+    def schedule(self, ref: str, rng: random.Random, cid: str | None) -> None:
+        c = self.config
+        event = {
+            "event_id": f"evt_{rng.getrandbits(64):016x}",
+            "payout_ref": ref,
+            "status": "failed" if rng.random() < c.webhook_failed_ratio else "paid",
+        }
+        lo, hi = c.webhook_delay_ms
+        self._push(rng.uniform(lo, hi) / 1000, [event], cid, 1)
+
+    def _push(self, delay: float, events: list, cid: str | None, attempt: int):
+        due = time.monotonic() + delay
+        heapq.heappush(self._due, (due, next(self._seq), events, cid, attempt))
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _scheduler(self) -> None:
+        """Move due webhooks to the ready queue; sleeps until the next one."""
+        while True:
+            now = time.monotonic()
+            while self._due and self._due[0][0] <= now:
+                _, _, events, cid, attempt = heapq.heappop(self._due)
+                for ev in events:
+                    self._ready.put_nowait((ev, cid, attempt))
+            timeout = self._due[0][0] - now if self._due else None
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _batcher(self) -> None:
+        """Group ready events into deliveries; one place, so batches fill up."""
+        while True:
+            items = [await self._ready.get()]
+            size = self.config.webhook_batch_size
+            if size:
+                deadline = time.monotonic() + self.config.webhook_batch_window_ms / 1000
+                while len(items) < size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        items.append(
+                            await asyncio.wait_for(self._ready.get(), remaining)
+                        )
+                    except asyncio.TimeoutError:
+                        break
+            await self._outbox.put((items, bool(size)))
+
+    async def _sender(self) -> None:
+        while True:
+            items, batched = await self._outbox.get()
+            try:
+                await self._deliver(items, batched)
+            except Exception:
+                self.stats["webhook_errors"] += 1
+
+    async def _deliver(self, items: list, batched: bool) -> None:
+        c = self.config
+        if batched:
+            url, cid = c.webhook_batch_url, None
+            raw = json.dumps([ev for ev, _, _ in items]).encode()
+        else:
+            ((ev, cid, _),) = items
+            url, raw = c.webhook_url, json.dumps(ev).encode()
+        ts = str(int(time.time()))
+        sig = hmac.new(SECRET.encode(), f"{ts}.".encode() + raw, hashlib.sha256)
+        headers = {
+            "content-type": "application/json",
+            "x-sig-ts": ts,
+            "x-sig": sig.hexdigest(),
+        }
+        if cid:
+            headers["x-correlation-id"] = cid
+        self.stats["webhook_posts"] += 1
+        try:
+            r = await self.client.post(url, content=raw, headers=headers)
+            ok = r.status_code < 300
+        except httpx.HTTPError:
+            ok = False
+        if ok:
+            self.stats["webhooks_delivered"] += len(items)
+            return
+        # redeliver each event on its own schedule, like a real provider
+        for ev, cid, attempt in items:
+            if attempt >= c.webhook_max_attempts:
+                self.stats["webhooks_dropped"] += 1
+            else:
+                self.stats["webhook_retries"] += 1
+                self._push(min(30.0, 0.5 * 2**attempt), [ev], cid, attempt + 1)
+
+    def pending(self) -> int:
+        queued = self._ready.qsize() if self._ready else 0
+        if self._outbox:
+            queued += sum(len(items) for items, _ in self._outbox._queue)
+        return queued + sum(len(e) for _, _, e, _, _ in self._due)
+
+    async def start(self, client: httpx.AsyncClient | None = None) -> None:
+        self.client = client or httpx.AsyncClient(
             timeout=5,
+            limits=httpx.Limits(max_connections=self.config.webhook_concurrency),
         )
+        n = self.config.webhook_concurrency
+        self._ready, self._wake = asyncio.Queue(), asyncio.Event()
+        self._outbox = asyncio.Queue(n)  # backpressure on the batcher
+        self._tasks = [
+            asyncio.create_task(self._scheduler()),
+            asyncio.create_task(self._batcher()),
+        ] + [asyncio.create_task(self._sender()) for _ in range(n)]
+
+    async def stop(self) -> None:
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks, self._ready, self._outbox, self._wake = [], None, None, None
+        await self.client.aclose()
+
+
+mock = Mock(Config())
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await mock.start()
+    try:
+        yield
+    finally:
+        await mock.stop()
+
 
-    except Exception:
-        pass
+app = FastAPI(title="Mock Payments", lifespan=lifespan)
 
 
 @app.post("/payouts")
-async def create(req: Request, bg: BackgroundTasks):
+async def create(req: Request):
     body = await req.json()
-    # Simulate transient errors (20% 429, 10% 500)
-    r = random.random()
-    if r < 0.2:
-        return {"error": "rate_limited"}, 429
-    if r < 0.3:
-        return {"error": "server"}, 500
-
-    ref = f"mock_{int(time.time()*1000)}"
-    bg.add_task(send_webhook, ref, req.headers.get("x-correlation-id"))
+    ref_in = body.get("reference") or f"anon_{next(mock._seq)}"
+    rng = mock.rng(ref_in)
+    # fixed draw order keeps seeded runs reproducible
+    delay, roll = mock.latency(rng), rng.random()
+    if delay:
+        await asyncio.sleep(delay)
+    status = mock.error(roll)
+    if status:
+        mock.stats[str(status)] += 1
+        headers = {}
+        if status in (429, 503) and mock.config.retry_after_s is not None:
+            headers["Retry-After"] = str(math.ceil(mock.config.retry_after_s))
+        error = {429: "rate_limited", 500: "server", 503: "unavailable"}[status]
+        return JSONResponse({"error": error}, status_code=status, headers=headers)
+
+    mock.stats["200"] += 1
+    ref = f"mock_{rng.getrandbits(64):016x}"
+    mock.schedule(ref, rng, req.headers.get("x-correlation-id"))
     return {"reference": ref}
+
+
+def _admin(token: str | None) -> None:
+    if ADMIN_TOKEN and not hmac.compare_digest(token or "", ADMIN_TOKEN):
+        raise HTTPException(401, "bad admin token")
+
+
+@app.get("/admin/config")
+async def get_config(x_admin_token: str | None = Header(None)):
+    _admin(x_admin_token)
+    return mock.config
+
+
+@app.patch("/admin/config")
+async def patch_config(
+    patch: dict = Body(...), x_admin_token: str | None = Header(None)
+):
+    _admin(x_admin_token)
+    patch = dict(patch)
+    scenario = patch.pop("scenario", None)
+    if scenario is not None and scenario not in SCENARIOS:
+        raise HTTPException(422, f"unknown scenario, one of {sorted(SCENARIOS)}")
+    merged = {**mock.config.model_dump(), **SCENARIOS.get(scenario, {}), **patch}
+    config = Config.model_validate(merged)
+    if config.error_429 + config.error_500 + config.error_503 > 1:
+        raise HTTPException(422, "error rates add up to more than 1")
+    if config.seed != mock.config.seed:
+        mock._calls.clear()
+    mock.config = config
+    return config
+
+
+@app.post("/admin/reset")
+async def reset(
+    body: dict | None = Body(None), x_admin_token: str | None = Header(None)
+):
+    _admin(x_admin_token)
+    if body and "seed" in body:
+        mock.config = mock.config.model_copy(update={"seed": body["seed"]})
+    mock.reset()
+    return {"ok": True, "seed": mock.config.seed}
+
+
+@app.get("/admin/stats")
+async def stats(x_admin_token: str | None = Header(None)):
+    _admin(x_admin_token)
+    return {**mock.stats, "webhooks_pending": mock.pending()}